@@ -0,0 +1,416 @@
+"""Request-level orchestration of the LLM calls behind /refine."""
+import asyncio
+import copy
+import os
+import time
+
+import httpx
+
+import llm_cache
+import metrics
+from llm_service import generate_analysis, get_quality_score, refine_followup, stream_analysis, validate_requirement
+from draft_store import DraftNotFound, get_store as get_draft_store
+from export_cache import get_cache as get_export_cache
+from pipeline import Pipeline, PipelineAborted
+from prevalidation import decides_locally, prevalidate
+from quality_scorer import is_ambiguous, resolve_quality_mode, score_text, score_ticket
+from sharded_analysis import generate_sharded_analysis, resolve_mode, stream_sharded_analysis
+from similarity_index import SIMILAR_INDEX_ENABLED, SIMILAR_REUSE_THRESHOLD, changes_meaning, get_index, wording_diff
+
+# Start the refinement call while validation is still running and cancel it
+# if the input is rejected. Trades wasted tokens on rejects for latency.
+REFINE_SPECULATIVE = os.getenv("REFINE_SPECULATIVE", "true").lower() in ("1", "true", "yes")
+
+
+def _create_quality_assessment_text(refined: dict) -> str:
+    """Create a comprehensive text summary of the refined requirement for quality scoring."""
+    parts = []
+
+    # Add requirement summary
+    if 'requirement_summary' in refined:
+        summary = refined['requirement_summary']
+        parts.append(f"REQUIREMENT: {summary.get('original_requirement', '')}")
+        parts.append(f"ID: {summary.get('requirement_id', '')}")
+
+    # Add classification
+    if 'classification' in refined:
+        cls = refined['classification']
+        parts.append(f"\nCLASSIFICATION:")
+        parts.append(f"Type: {cls.get('requirement_type', '')}")
+        parts.append(f"Priority: {cls.get('priority', '')}")
+        parts.append(f"Complexity: {cls.get('complexity', '')}")
+
+    # Add acceptance criteria
+    if 'acceptance_criteria' in refined and refined['acceptance_criteria']:
+        parts.append(f"\nACCEPTANCE CRITERIA ({len(refined['acceptance_criteria'])} criteria):")
+        for idx, ac in enumerate(refined['acceptance_criteria'][:5], 1):  # Limit to first 5
+            if isinstance(ac, dict):
+                parts.append(f"AC{idx}: {ac.get('title', '')}")
+                parts.append(f"  Given {ac.get('given', '')}")
+                parts.append(f"  When {ac.get('when', '')}")
+                parts.append(f"  Then {ac.get('then', '')}")
+
+    # Add user stories count
+    if 'user_stories' in refined and refined['user_stories']:
+        parts.append(f"\nUSER STORIES: {len(refined['user_stories'])} stories defined")
+        for story in refined['user_stories'][:3]:  # First 3 stories
+            parts.append(f"- {story.get('title', '')}")
+
+    # Add test cases count
+    if 'test_cases' in refined and refined['test_cases']:
+        parts.append(f"\nTEST CASES: {len(refined['test_cases'])} test cases defined")
+
+    # Add edge cases
+    if 'edge_cases' in refined and refined['edge_cases']:
+        parts.append(f"\nEDGE CASES: {len(refined['edge_cases'])} scenarios covered")
+
+    # Add dependencies and risks
+    if 'dependencies_and_risks' in refined:
+        dr = refined['dependencies_and_risks']
+        if dr.get('dependencies'):
+            parts.append(f"\nDEPENDENCIES: {len(dr['dependencies'])} dependencies identified")
+        if dr.get('risks'):
+            parts.append(f"RISKS: {len(dr['risks'])} risks with mitigation plans")
+
+    # Add effort estimation
+    if 'effort_estimation' in refined:
+        effort = refined['effort_estimation']
+        parts.append(f"\nESTIMATED EFFORT: {effort.get('total_estimated_effort', '')}")
+
+    return "\n".join(parts)
+
+
+async def _quality_score(local, llm_text, quality_mode: str | None) -> dict:
+    """Score with the local rules and/or the LLM scorer, depending on the quality mode.
+
+    ``local`` and ``llm_text`` are callables so only the scorer that is used
+    does any work.
+    """
+    mode = resolve_quality_mode(quality_mode)
+    result = None
+    if mode != "deep":
+        result = local()
+        if mode == "local" or not is_ambiguous(result["score"]):
+            metrics.QUALITY_SCORES.inc(scorer="local")
+            return result
+    deep = await get_quality_score(llm_text())
+    if result is not None and ("score" not in deep or deep.get("error")):
+        # The LLM scorer failed; the ambiguous local score is still better than none
+        metrics.QUALITY_SCORES.inc(scorer="local")
+        return result
+    metrics.QUALITY_SCORES.inc(scorer="llm")
+    return {**deep, "scorer": "llm", **({"local_score": result["score"]} if result else {})}
+
+
+@metrics.timed("score_before")
+async def score_before(user_input: str, quality_mode: str | None = None) -> dict:
+    try:
+        return await _quality_score(lambda: score_text(user_input), lambda: user_input, quality_mode)
+    except Exception as e:
+        print(f"Quality before score failed: {e}")
+        return {"score": 0, "reason": "Score calculation failed"}
+
+
+@metrics.timed("score_after")
+async def score_after(refined: dict, quality_mode: str | None = None) -> dict:
+    # The LLM scorer gets a comprehensive text summary; the local one reads the ticket itself
+    try:
+        return await _quality_score(
+            lambda: score_ticket(refined), lambda: _create_quality_assessment_text(refined), quality_mode
+        )
+    except Exception as e:
+        print(f"Quality after score failed: {e}")
+        return {"score": 0, "reason": "Score calculation failed"}
+
+
+@metrics.timed("save_draft")
+async def save_draft(ticket: dict, user_input: str, index: bool = False) -> dict:
+    """Keep the new report server-side so follow-ups and downloads can refer to it by id.
+
+    With ``index`` the input is also added to the near-duplicate index, so
+    rewordings of it can reuse this draft. The downloads are pre-rendered
+    when ``EXPORT_PRERENDER`` is on.
+    """
+    get_export_cache().prerender(ticket)
+    try:
+        draft_id, version = await get_draft_store().create(ticket, user_input)
+    except Exception as e:
+        print(f"Draft could not be saved: {e}")
+        return {}
+    if index and SIMILAR_INDEX_ENABLED:
+        get_index().insert(user_input, draft_id, version)
+    return {"draft_id": draft_id, "version": version}
+
+
+async def find_prior(user_input: str, image_base64: str | None = None, reuse: bool = True) -> dict | None:
+    """Index entry and ticket of an earlier near-duplicate of ``user_input``, if any.
+
+    Inputs with an image are never matched, and neither are requests that
+    bypass the LLM cache.
+    """
+    if not (SIMILAR_INDEX_ENABLED and reuse) or image_base64 or llm_cache.is_bypassed():
+        return None
+    index = get_index()
+    match = index.lookup(user_input)
+    if match is None:
+        return None
+    try:
+        draft = await get_draft_store().get(match["draft_id"], match["version"])
+    except DraftNotFound:
+        index.remove(match["id"])
+        return None
+    return {**match, "ticket": draft["ticket"]}
+
+
+def _reword_instruction(before: str, after: str, diff: dict) -> str:
+    changes = "; ".join(
+        [f'removed "{text}"' for text in diff["removed"]] + [f'added "{text}"' for text in diff["added"]]
+    )
+    return (
+        "The requirement has been reworded since this draft was written.\n"
+        f"Previous wording: {before}\n"
+        f"New wording: {after}\n"
+        f"Wording changes: {changes or 'none'}\n"
+        "Update the draft so it matches the new wording. Keep everything the change does not affect."
+    )
+
+
+async def refine_from_prior(user_input: str, prior: dict, quality_mode: str | None = None) -> dict | None:
+    """Answer a near-duplicate from its earlier draft instead of analysing it from scratch.
+
+    At ``SIMILAR_REUSE_THRESHOLD`` or above the earlier ticket is returned as
+    is, unless the rewording changes a number, quantity or negation; otherwise
+    the ticket is refined with the wording changes as a follow-up instruction.
+    Returns None when that refinement fails, so the caller can fall back to a
+    full analysis.
+    """
+    started = time.perf_counter()
+    index = get_index()
+    diff = wording_diff(prior["text"], user_input)
+    if prior["similarity"] >= SIMILAR_REUSE_THRESHOLD and not changes_meaning(diff):
+        outcome = "reused"
+        ticket = copy.deepcopy(prior["ticket"])
+        if isinstance(ticket.get("requirement_summary"), dict):
+            ticket["requirement_summary"]["original_requirement"] = user_input
+    else:
+        outcome = "seeded"
+        try:
+            ticket = await refine_followup(
+                user_input, prior["ticket"], _reword_instruction(prior["text"], user_input, diff), "full"
+            )
+        except Exception as e:
+            print(f"Seeded refinement failed, analysing from scratch: {e}")
+            return None
+        if ticket.get("error", False):
+            return None
+    index.count(outcome)
+
+    quality_before, quality_after = await asyncio.gather(
+        score_before(user_input, quality_mode), score_after(ticket, quality_mode)
+    )
+    return {
+        "is_valid": True,
+        "ticket": ticket,
+        **await save_draft(ticket, user_input, index=outcome == "seeded"),
+        "quality_before": quality_before,
+        "quality_after": quality_after,
+        "reused_from": {
+            "draft_id": prior["draft_id"],
+            "version": prior["version"],
+            "original_requirement": prior["text"],
+            "similarity": prior["similarity"],
+            "outcome": outcome,
+            "wording_diff": diff,
+        },
+        "timings": {"wall_ms": round((time.perf_counter() - started) * 1000, 1), "mode": outcome},
+    }
+
+
+async def run_refine(
+    user_input: str,
+    image_base64: str | None = None,
+    mode: str | None = None,
+    quality_mode: str | None = None,
+    reuse: bool = True,
+) -> dict:
+    """Validate, refine and score a requirement, running independent calls in parallel.
+
+    The "before" score only needs the raw input, so it runs alongside
+    validation and refinement; only the "after" score waits for the report.
+    ``mode`` selects single or sharded report generation and ``quality_mode``
+    the quality scorer. Near-duplicates of earlier requirements are answered
+    from their drafts unless ``reuse`` is off.
+    """
+    generate = generate_sharded_analysis if resolve_mode(mode) == "sharded" else generate_analysis
+    quality_mode = resolve_quality_mode(quality_mode)
+    prior = await find_prior(user_input, image_base64, reuse)
+    if prior is not None:
+        result = await refine_from_prior(user_input, prior, quality_mode)
+        if result is not None:
+            return result
+
+    # Speculation only pays off while validation waits on the LLM
+    gate = prevalidate(user_input)
+    speculative = REFINE_SPECULATIVE and not decides_locally(gate)
+    pipeline = Pipeline()
+    pipeline.add(
+        "validate",
+        lambda: validate_requirement(user_input, gate),
+        gate=lambda validation: validation.get("is_valid", False),
+    )
+    pipeline.add(
+        "refine",
+        lambda **_: generate(user_input, image_base64),
+        deps=() if speculative else ("validate",),
+    )
+    pipeline.add("quality_before", lambda: score_before(user_input, quality_mode))
+    pipeline.add("quality_after", lambda refine: score_after(refine, quality_mode), deps=("refine",))
+
+    try:
+        run = await pipeline.run()
+    except PipelineAborted as aborted:
+        return {
+            "is_valid": False,
+            "reason": aborted.result.get("reason", "Input does not appear to be a valid requirement.")
+        }
+
+    return {
+        "is_valid": True,
+        "ticket": run.results["refine"],
+        **await save_draft(run.results["refine"], user_input, index=not image_base64),
+        "quality_before": run.results["quality_before"],
+        "quality_after": run.results["quality_after"],
+        "timings": {**run.report(), "mode": resolve_mode(mode)},
+    }
+
+
+async def stream_refine(
+    user_input: str,
+    image_base64: str | None = None,
+    mode: str | None = None,
+    quality_mode: str | None = None,
+    reuse: bool = True,
+):
+    """Event stream version of ``run_refine`` for progressive rendering.
+
+    Yields dicts with an ``event`` field: ``section`` for each report section
+    as soon as the model closes it, ``quality_before``, then ``done`` with the
+    full ticket, scores and timings (including time to first section).
+    Rejected input yields a single ``invalid`` event; failures yield ``error``.
+    A near-duplicate answered from an earlier draft yields all its sections
+    at once.
+    """
+    stream = stream_sharded_analysis if resolve_mode(mode) == "sharded" else stream_analysis
+    quality_mode = resolve_quality_mode(quality_mode)
+    started = time.perf_counter()
+
+    prior = await find_prior(user_input, image_base64, reuse)
+    result = await refine_from_prior(user_input, prior, quality_mode) if prior is not None else None
+    if result is not None:
+        for key, value in result["ticket"].items():
+            yield {"event": "section", "key": key, "value": value, "elapsed_ms": result["timings"]["wall_ms"]}
+        yield {"event": "quality_before", **result["quality_before"]}
+        yield {"event": "done", **result}
+        return
+
+    def elapsed_ms() -> float:
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for item in stream(user_input, image_base64):
+                await queue.put(item)
+        except Exception as e:
+            await queue.put(("error", None, e))
+
+    gate = prevalidate(user_input)
+    validate_task = asyncio.ensure_future(validate_requirement(user_input, gate))
+    before_task = asyncio.ensure_future(score_before(user_input, quality_mode))
+    pump_task = asyncio.ensure_future(pump()) if REFINE_SPECULATIVE and not decides_locally(gate) else None
+
+    try:
+        # Sections generated speculatively stay queued until validation passes
+        validation = await validate_task
+        if not validation.get("is_valid", False):
+            yield {
+                "event": "invalid",
+                "is_valid": False,
+                "reason": validation.get("reason", "Input does not appear to be a valid requirement.")
+            }
+            return
+        if pump_task is None:
+            pump_task = asyncio.ensure_future(pump())
+
+        first_section_ms = None
+        before_sent = False
+        while True:
+            kind, key, value = await queue.get()
+            if kind == "error":
+                print("REFINE STREAM ERROR:", str(value))
+                yield {"event": "error", **refine_error_response(value)}
+                return
+            if kind == "report":
+                ticket = value
+                break
+            if first_section_ms is None:
+                first_section_ms = elapsed_ms()
+            yield {"event": "section", "key": key, "value": value, "elapsed_ms": elapsed_ms()}
+            if not before_sent and before_task.done():
+                before_sent = True
+                yield {"event": "quality_before", **before_task.result()}
+
+        quality_before = await before_task
+        if not before_sent:
+            yield {"event": "quality_before", **quality_before}
+        quality_after = await score_after(ticket, quality_mode)
+
+        yield {
+            "event": "done",
+            "is_valid": True,
+            "ticket": ticket,
+            **await save_draft(ticket, user_input, index=not image_base64),
+            "quality_before": quality_before,
+            "quality_after": quality_after,
+            "timings": {
+                "time_to_first_section_ms": first_section_ms,
+                "total_ms": elapsed_ms(),
+                "mode": resolve_mode(mode),
+            },
+        }
+    finally:
+        for task in (validate_task, before_task, pump_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+def is_rate_limited(e: Exception) -> bool:
+    """Whether ``e`` is the gateway still answering 429 after our retries."""
+    return isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429
+
+
+def refine_error_response(e: Exception) -> dict:
+    """Map a failure in the refine flow to a user-friendly error payload."""
+    error_msg = str(e)
+    error_response = {
+        "is_valid": False,
+        "error": True,
+        "reason": "Unable to process your requirement"
+    }
+
+    # Provide specific guidance based on error type
+    if is_rate_limited(e):
+        error_response["reason"] = "The AI service is handling too many requests right now. Please wait a minute and try again."
+    elif isinstance(e, httpx.TimeoutException) or "timeout" in error_msg.lower():
+        error_response["reason"] = "The AI service took too long to respond. Please try again in a moment."
+    elif "400" in error_msg:
+        error_response["reason"] = "There was an issue processing your request. Please check your input and try again."
+    elif "401" in error_msg or "403" in error_msg:
+        error_response["reason"] = "Authentication issue. Please contact support."
+    elif "image" in error_msg.lower():
+        error_response["reason"] = "The image could not be processed. Please try with a different image or remove it."
+    else:
+        error_response["reason"] = "An unexpected error occurred. Please try again or contact support if the problem persists."
+
+    return error_response
@@ -0,0 +1,244 @@
+"""Bulk refinement of many requirements behind /refine-batch.
+
+A batch is stored in a local sqlite file before any work starts, and every
+item's result is written as soon as it finishes. Items run through a small
+pool of workers, each running the regular /refine flow, with a token-bucket
+limiter on how fast new items start. If the client disconnects, the batch can
+be resumed by its id: finished items are replayed and only the rest run.
+"""
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from analysis import refine_error_response, run_refine
+from llm_service import decode_text, read_table
+from rate_limiter import TokenBucket
+
+# Items refined at the same time within one batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Items started per minute across all batches (0 = unlimited)
+BATCH_RATE_PER_MINUTE = float(os.getenv("BATCH_RATE_PER_MINUTE", "60"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_DB_PATH = os.getenv("BATCH_DB_PATH", str(Path(__file__).resolve().parent / ".cache" / "batches.sqlite3"))
+
+# Column names tried, in order, when picking the requirement text out of a CSV/XLSX file
+REQUIREMENT_COLUMNS = ("requirement", "requirements", "description", "summary", "title", "story", "text")
+
+ITEM_STATUSES = ("pending", "succeeded", "invalid", "failed")
+
+
+class BatchNotFound(Exception):
+    pass
+
+
+class BatchBusy(Exception):
+    """The batch is already being processed by another connection."""
+
+
+class BatchStore:
+    """Batches and their per-item results in a sqlite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS batches (
+                id TEXT PRIMARY KEY, mode TEXT, total INTEGER NOT NULL, created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS batch_items (
+                batch_id TEXT NOT NULL, idx INTEGER NOT NULL, input TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending', result TEXT, finished_at REAL,
+                PRIMARY KEY (batch_id, idx)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def create(self, requirements: list[str], mode: str | None) -> str:
+        batch_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO batches (id, mode, total, created_at) VALUES (?, ?, ?, ?)",
+                (batch_id, mode, len(requirements), time.time()),
+            )
+            self._conn.executemany(
+                "INSERT INTO batch_items (batch_id, idx, input) VALUES (?, ?, ?)",
+                [(batch_id, idx, text) for idx, text in enumerate(requirements)],
+            )
+            self._conn.commit()
+        return batch_id
+
+    def get(self, batch_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT mode, total FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            if row is None:
+                return None
+            counts = dict(
+                self._conn.execute(
+                    "SELECT status, COUNT(*) FROM batch_items WHERE batch_id = ? GROUP BY status", (batch_id,)
+                ).fetchall()
+            )
+        return {"batch_id": batch_id, "mode": row[0], "total": row[1], **{s: counts.get(s, 0) for s in ITEM_STATUSES}}
+
+    def items(self, batch_id: str) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, input, status, result FROM batch_items WHERE batch_id = ? ORDER BY idx", (batch_id,)
+            ).fetchall()
+        return [
+            {"index": idx, "input": text, "status": status, "result": json.loads(result) if result else None}
+            for idx, text, status, result in rows
+        ]
+
+    def record(self, batch_id: str, idx: int, status: str, result: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batch_items SET status = ?, result = ?, finished_at = ? WHERE batch_id = ? AND idx = ?",
+                (status, json.dumps(result), time.time(), batch_id, idx),
+            )
+            self._conn.commit()
+
+
+_store: BatchStore | None = None
+_limiter = TokenBucket(BATCH_RATE_PER_MINUTE / 60, BATCH_CONCURRENCY)
+# Batches currently being processed by a connection in this process
+_running: set[str] = set()
+
+
+def get_store() -> BatchStore:
+    global _store
+    if _store is None:
+        _store = BatchStore(BATCH_DB_PATH)
+    return _store
+
+
+def extract_requirements(file_base64: str, file_name: str) -> list[str]:
+    """One requirement per row of a CSV/XLSX file, or per non-empty line of a text file.
+
+    Blocking (pandas); call it in a thread. A file that cannot be read raises ``ValueError``.
+    """
+    file_bytes = base64.b64decode(file_base64)
+    file_name = file_name.lower()
+
+    if file_name.endswith((".xlsx", ".xls", ".csv")):
+        try:
+            df = read_table(file_bytes, file_name, dtype=str)
+        except ImportError:
+            # openpyxl/xlrd missing: a server problem, not a bad file
+            raise
+        except Exception as e:
+            # Corrupt workbooks raise zipfile.BadZipFile, unreadable CSVs pandas' own errors
+            raise ValueError(f"Could not read {file_name}: {e}") from e
+        if df.columns.empty:
+            raise ValueError("No requirements found in the batch")
+        columns = {str(c).strip().lower(): c for c in df.columns}
+        column = next((columns[name] for name in REQUIREMENT_COLUMNS if name in columns), None)
+        if column is None:
+            # Fall back to the column with the most text in it
+            column = max(df.columns, key=lambda c: df[c].fillna("").str.len().sum())
+        values = df[column].dropna().astype(str)
+        return [value.strip() for value in values if value.strip()]
+
+    if file_name.endswith((".txt", ".log")):
+        text = decode_text(file_bytes)
+        return [line.strip() for line in text.splitlines() if line.strip()]
+
+    raise ValueError("Batch files must be CSV, XLSX/XLS or TXT")
+
+
+def create_batch(requirements: list[str], mode: str | None = None) -> str:
+    requirements = [r.strip() for r in requirements if r and r.strip()]
+    if not requirements:
+        raise ValueError("No requirements found in the batch")
+    if len(requirements) > BATCH_MAX_ITEMS:
+        raise ValueError(f"A batch may contain at most {BATCH_MAX_ITEMS} requirements")
+    return get_store().create(requirements, mode)
+
+
+async def _refine_item(text: str, mode: str | None) -> tuple[str, dict]:
+    try:
+        result = await run_refine(text, None, mode)
+    except Exception as e:
+        print("BATCH ITEM ERROR:", str(e))
+        return "failed", refine_error_response(e)
+    if result.get("error"):
+        return "failed", result
+    return ("succeeded" if result.get("is_valid") else "invalid"), result
+
+
+async def run_batch(batch_id: str, replay: bool = True):
+    """Process the unfinished items of a batch, yielding NDJSON-ready events.
+
+    Events: ``batch`` (progress so far), one ``item`` per requirement in
+    completion order (finished items from an earlier run first, marked
+    ``replayed``, when ``replay`` is set) and a final ``done``.
+    """
+    store = get_store()
+    info = await asyncio.to_thread(store.get, batch_id)
+    if info is None:
+        raise BatchNotFound(batch_id)
+    if batch_id in _running:
+        raise BatchBusy(batch_id)
+    _running.add(batch_id)
+
+    started = time.perf_counter()
+    try:
+        yield {"event": "batch", **info}
+
+        items = await asyncio.to_thread(store.items, batch_id)
+        if replay:
+            for item in items:
+                if item["status"] != "pending":
+                    yield {"event": "item", "batch_id": batch_id, **item, "replayed": True}
+
+        pending: asyncio.Queue = asyncio.Queue()
+        for item in items:
+            if item["status"] == "pending":
+                pending.put_nowait(item)
+        finished: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            while True:
+                try:
+                    item = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    await _limiter.acquire()
+                    status, result = await _refine_item(item["input"], info["mode"])
+                except Exception as e:
+                    status, result = "failed", refine_error_response(e)
+                try:
+                    await asyncio.to_thread(store.record, batch_id, item["index"], status, result)
+                except Exception as e:
+                    # Still report the result; the item reruns if the batch is resumed
+                    print(f"Batch {batch_id} item {item['index']} could not be saved: {e}")
+                await finished.put({**item, "status": status, "result": result})
+
+        count = pending.qsize()
+        workers = [asyncio.ensure_future(worker()) for _ in range(min(BATCH_CONCURRENCY, count))]
+        try:
+            for _ in range(count):
+                item = await finished.get()
+                yield {"event": "item", "batch_id": batch_id, **item, "replayed": False}
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        summary = await asyncio.to_thread(store.get, batch_id)
+        yield {"event": "done", **summary, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+    finally:
+        _running.discard(batch_id)
@@ -0,0 +1,117 @@
+"""Concurrent export throughput: in-thread rendering vs the process pool.
+
+Renders ``--renders`` documents of ``data/sample_report.json`` (and the large
+variant from ``bench_micro``) with ``--concurrency`` of them in flight,
+through ``export_pool.ExportPool`` with ``engine="thread"`` (the old
+``run_in_threadpool`` path) and ``engine="process"``. Meanwhile a probe
+coroutine stands in for the worker's other requests: every 10 ms it
+serialises the sample report and records how late it ran, which is the delay
+rendering adds to unrelated requests.
+
+    cd backend
+    python benchmarks/bench_exports.py
+    python benchmarks/bench_exports.py --workers 4 --concurrency 16 --renders 64 --format pdf
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from export_pool import ExportPool  # noqa: E402
+from bench_micro import REPEATED_SECTIONS  # noqa: E402
+
+PROBE_INTERVAL = 0.01
+
+
+def load_reports() -> list[dict]:
+    report = json.loads((HERE / "data" / "sample_report.json").read_text(encoding="utf-8"))
+    large = {**report, **{key: report.get(key, []) * 10 for key in REPEATED_SECTIONS}}
+    # Mostly regular reports with the odd large one, as in practice
+    return [large if i % 4 == 3 else report for i in range(4)]
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def probe(report: dict, lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        due = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        json.dumps(report)
+        lags.append(time.perf_counter() - due)
+
+
+async def run(engine: str, args, reports: list[dict], scratch: str) -> dict:
+    pool = ExportPool(engine, args.workers, args.renders, 0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        await pool.start()
+        # Warm-up outside the measurement: imports, fonts and style caches of every worker
+        await asyncio.gather(*[
+            pool.render_to(fmt, reports[0], os.path.join(scratch, f"warm-{fmt}-{i}"))
+            for fmt in args.format for i in range(args.workers)
+        ])
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, lags, stop = [], [], asyncio.Event()
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            fmt = args.format[i % len(args.format)]
+            await pool.render_to(fmt, reports[i % len(reports)], os.path.join(scratch, f"{i}.{fmt}"))
+            latencies.append(time.perf_counter() - started)
+
+    prober = asyncio.ensure_future(probe(reports[0], lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(args.renders)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    pool.shutdown()
+    return {
+        "engine": engine,
+        "throughput": args.renders / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": percentile(latencies, 0.95),
+        "lag_p50": statistics.median(lags) if lags else 0.0,
+        "lag_p95": percentile(lags, 0.95),
+        "lag_max": max(lags, default=0.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--renders", type=int, default=32)
+    parser.add_argument("--format", nargs="+", choices=("docx", "pdf"), default=["pdf", "docx"])
+    args = parser.parse_args()
+
+    reports = load_reports()
+    scratch = tempfile.mkdtemp(prefix="bench_exports_")
+    print(f"{args.renders} renders of {'/'.join(args.format)}, {args.concurrency} in flight, "
+          f"{args.workers} pool processes, {os.cpu_count()} CPUs")
+    print(f"{'engine':<10}{'renders/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'probe lag p50':>15}{'p95':>9}{'max':>9}")
+    for engine in ("thread", "process"):
+        r = asyncio.run(run(engine, args, reports, scratch))
+        print(f"{r['engine']:<10}{r['throughput']:>11.1f}{r['p50'] * 1000:>10.0f}{r['p95'] * 1000:>10.0f}"
+              f"{r['lag_p50'] * 1000:>15.1f}{r['lag_p95'] * 1000:>9.1f}{r['lag_max'] * 1000:>9.1f}")
+    shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
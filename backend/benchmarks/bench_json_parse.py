@@ -0,0 +1,86 @@
+"""Microbenchmark: single-pass safe_json_parse vs the legacy multi-scan repair.
+
+Builds a corpus from a full analysis report (``data/sample_report.json``) cut
+off at many points, as happens when a completion hits ``max_tokens``, plus
+fenced and prose-wrapped variants. Captured real responses can be added with
+``--corpus DIR`` (every ``*.txt`` file is one raw completion).
+
+    cd backend
+    python benchmarks/bench_json_parse.py --cuts 200 --repeat 5
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+from legacy_json_parse import legacy_safe_json_parse  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from llm_service import safe_json_parse  # noqa: E402
+
+
+def build_corpus(cuts: int, seed: int, corpus_dir: Path | None) -> dict[str, list[str]]:
+    report = (HERE / "data" / "sample_report.json").read_text(encoding="utf-8")
+    rng = random.Random(seed)
+    offsets = sorted(rng.randrange(len(report) // 10, len(report)) for _ in range(cuts))
+
+    corpus = {
+        "complete": [report],
+        "fenced": [f"```json\n{report}\n```"],
+        "wrapped in prose": [f"Here is the analysis:\n{report}\nLet me know if you need changes."],
+        "bracket in prose": [f"Here is [the analysis]:\n{report}"],
+        "truncated": [report[:cut] for cut in offsets],
+        "truncated + fenced": [f"```json\n{report[:cut]}" for cut in offsets[::4]],
+    }
+    if corpus_dir is not None:
+        corpus["captured"] = [p.read_text(encoding="utf-8") for p in sorted(corpus_dir.glob("*.txt"))]
+    return corpus
+
+
+def run(parse, texts: list[str], repeat: int) -> tuple[float, list[dict]]:
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            results = [parse(text) for text in texts]
+        elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(texts)), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cuts", type=int, default=200, help="number of truncation points")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--corpus", type=Path, help="directory of captured raw completions (*.txt)")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.cuts, args.seed, args.corpus)
+
+    header = f"{'variant':<20}{'n':>5}{'legacy us':>12}{'new us':>10}{'speedup':>9}{'legacy ok':>11}{'new ok':>8}{'more keys':>11}"
+    print(header)
+    print("-" * len(header))
+    for name, texts in corpus.items():
+        if not texts:
+            continue
+        legacy_time, legacy_results = run(legacy_safe_json_parse, texts, args.repeat)
+        new_time, new_results = run(safe_json_parse, texts, args.repeat)
+        legacy_ok = sum("error" not in r for r in legacy_results)
+        new_ok = sum("error" not in r for r in new_results)
+        # How often the new parser recovers more top-level sections than the legacy one
+        richer = sum(len(n) > len(o) for n, o in zip(new_results, legacy_results))
+        print(
+            f"{name:<20}{len(texts):>5}{legacy_time * 1e6:>12.1f}{new_time * 1e6:>10.1f}"
+            f"{legacy_time / new_time:>8.1f}x{legacy_ok:>11}{new_ok:>8}{richer:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
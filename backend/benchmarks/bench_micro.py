@@ -0,0 +1,101 @@
+"""Microbenchmarks of the CPU-bound helpers on a full analysis report.
+
+Times ``safe_json_parse`` (complete and truncated completions),
+``create_word``, ``create_pdf`` and ``_create_quality_assessment_text`` on
+``data/sample_report.json`` and reports per-call latency percentiles and the
+peak memory allocated by one call. Word rendering is measured with both
+engines (``docx_renderer`` and python-docx), also on a large report with ten
+times the edge cases, acceptance criteria, stories and test cases. PDF
+rendering is measured on a small report (one item per list), the sample
+report and the large one. The text formats of ``exporters`` (Markdown, HTML,
+Jira JSON, test case CSV) are measured on the sample and the large report.
+
+    cd backend
+    python benchmarks/bench_micro.py --repeat 50
+    python benchmarks/bench_micro.py --only create_word create_pdf
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from analysis import _create_quality_assessment_text  # noqa: E402
+    from llm_service import create_pdf, create_word, create_word_python_docx, safe_json_parse  # noqa: E402
+    import exporters  # noqa: E402
+
+# Sections repeated in the large report
+REPEATED_SECTIONS = ("edge_cases", "acceptance_criteria", "user_stories", "test_cases")
+
+
+def build_cases() -> dict:
+    text = (HERE / "data" / "sample_report.json").read_text(encoding="utf-8")
+    report = json.loads(text)
+    truncated = text[: int(len(text) * 0.6)]
+    large = {**report, **{key: report.get(key, []) * 10 for key in REPEATED_SECTIONS}}
+    small = {key: value[:1] if isinstance(value, list) else value for key, value in report.items()}
+    return {
+        "safe_json_parse": lambda: safe_json_parse(text),
+        "safe_json_parse (truncated)": lambda: safe_json_parse(truncated),
+        "create_word": lambda: create_word(report),
+        "create_word (python-docx)": lambda: create_word_python_docx(report),
+        "create_word large": lambda: create_word(large),
+        "create_word large (python-docx)": lambda: create_word_python_docx(large),
+        "create_pdf small": lambda: create_pdf(small),
+        "create_pdf": lambda: create_pdf(report),
+        "create_pdf large": lambda: create_pdf(large),
+        "_create_quality_assessment_text": lambda: _create_quality_assessment_text(report),
+        **{
+            f"export {fmt}{suffix}": (lambda fmt=fmt, ticket=ticket: b"".join(exporters.stream(fmt, ticket)))
+            for fmt in ("markdown", "html", "jira", "test_cases_csv")
+            for suffix, ticket in (("", report), (" large", large))
+        },
+    }
+
+
+def measure(func, repeat: int) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()  # warm-up: imports, font and style caches
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - started)
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    times.sort()
+    pick = lambda q: times[min(len(times) - 1, int(round(q * (len(times) - 1))))]  # noqa: E731
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "mean": sum(times) / len(times), "peak": peak}
+
+
+def main():
+    cases = build_cases()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", nargs="+", choices=sorted(cases), help="run only these cases")
+    args = parser.parse_args()
+
+    header = f"{'function':<32}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'calls/s':>10}{'peak KiB':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, func in cases.items():
+        if args.only and name not in args.only:
+            continue
+        r = measure(func, args.repeat)
+        print(
+            f"{name:<32}{r['p50'] * 1000:>10.3f}{r['p95'] * 1000:>10.3f}{r['p99'] * 1000:>10.3f}"
+            f"{1 / r['mean']:>10.0f}{r['peak'] / 1024:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Prompt size and prompt-cache benchmark for the ``full`` and ``compact`` variants.
+
+Offline it reports the static prompt tokens of every variant and the total
+prompt tokens of a fixed corpus of requirements (``data/requirements.txt``).
+With ``--live`` it also sends each requirement to the gateway once per
+variant and pass, bypassing the LLM response cache, and reports the prompt
+tokens the gateway billed, how many of them were served from its prompt
+cache and the latency. Calls use ``max_tokens=1`` by default so only prompt
+processing is measured.
+
+    cd backend
+    python benchmarks/bench_prompts.py
+    python benchmarks/bench_prompts.py --live --passes 2 --prompt SYSTEM_PROMPT
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import llm_cache  # noqa: E402
+    import prompts  # noqa: E402
+    from llm_client import close_client  # noqa: E402
+    from llm_service import post_chat  # noqa: E402
+
+
+def load_corpus(path: Path) -> list[str]:
+    return [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+def offline_report(corpus: list[str], prompt_name: str) -> None:
+    report = prompts.token_report()
+    print(f"Tokenizer: {report['tokenizer']}")
+    print(f"{'prompt':<22}" + "".join(f"{variant:>12}" for variant in prompts.PROMPT_VARIANTS) + f"{'saved':>9}")
+    for name, variants in report["prompts"].items():
+        full, compact = variants["full"]["tokens"], variants["compact"]["tokens"]
+        print(f"{name:<22}{full:>12}{compact:>12}{1 - compact / full:>9.1%}")
+
+    print(f"\nCorpus of {len(corpus)} requirements with {prompt_name}:")
+    for variant in prompts.PROMPT_VARIANTS:
+        system = prompts.count_tokens(prompts.get_prompt(prompt_name, variant))
+        total = sum(system + prompts.count_tokens(text) for text in corpus)
+        print(f"  {variant:<8} {total:>8} prompt tokens ({system} static per call)")
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def live_run(corpus: list[str], prompt_name: str, variant: str, passes: int, max_tokens: int) -> dict:
+    prompts.PROMPT_VARIANT = variant
+    latencies, billed, cached = [], 0, 0
+    with llm_cache.bypass():
+        for _ in range(passes):
+            for text in corpus:
+                payload = {
+                    "model": "gpt-4o-mini",
+                    "temperature": 0,
+                    "messages": prompts.build_messages(prompt_name, {"role": "user", "content": text}),
+                    "max_tokens": max_tokens,
+                }
+                started = time.perf_counter()
+                data = await post_chat(prompt_name, payload, timeout=60)
+                latencies.append((time.perf_counter() - started) * 1000)
+                usage = data.get("usage") or {}
+                billed += usage.get("prompt_tokens") or 0
+                cached += (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    return {
+        "calls": len(latencies),
+        "prompt_tokens": billed,
+        "cached_tokens": cached,
+        "cached_ratio": cached / billed if billed else 0.0,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": _percentile(latencies, 0.95),
+    }
+
+
+async def live_report(corpus: list[str], prompt_name: str, passes: int, max_tokens: int) -> None:
+    print(f"\nLive: {passes} pass(es) over the corpus per variant, max_tokens={max_tokens}")
+    print(f"{'variant':<10}{'calls':>7}{'prompt tok':>12}{'cached tok':>12}{'cached':>8}{'p50 ms':>9}{'p95 ms':>9}")
+    try:
+        for variant in prompts.PROMPT_VARIANTS:
+            r = await live_run(corpus, prompt_name, variant, passes, max_tokens)
+            print(
+                f"{variant:<10}{r['calls']:>7}{r['prompt_tokens']:>12}{r['cached_tokens']:>12}"
+                f"{r['cached_ratio']:>8.1%}{r['p50_ms']:>9.0f}{r['p95_ms']:>9.0f}"
+            )
+    finally:
+        await close_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, default=HERE / "data" / "requirements.txt")
+    parser.add_argument("--prompt", default="SYSTEM_PROMPT", choices=sorted(prompts.PROMPTS))
+    parser.add_argument("--live", action="store_true", help="call the gateway (needs backend/.env)")
+    parser.add_argument("--passes", type=int, default=2, help="live passes per variant; later passes hit the prompt cache")
+    parser.add_argument("--max-tokens", type=int, default=1)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    offline_report(corpus, args.prompt)
+    if args.live:
+        asyncio.run(live_report(corpus, args.prompt, args.passes, args.max_tokens))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Evaluate (and retrain) the local pre-validation gate against LLM labels.
+
+Labels are JSONL records with ``input`` and ``is_valid`` (the LLM's
+decision), as written to ``VALIDATION_LOG_PATH``; a small hand-labelled seed
+set ships in ``data/validation_labels.jsonl``. Reports precision and recall of
+the gate's local accepts and rejects against the LLM, and the share of LLM
+validation calls it saves (inputs decided locally).
+
+    cd backend
+    python benchmarks/eval_prevalidation.py
+    python benchmarks/eval_prevalidation.py --labels .cache/validation_log.jsonl --show-errors
+    python benchmarks/eval_prevalidation.py --labels .cache/validation_log.jsonl --train weights.json
+    PREVALIDATION_WEIGHTS=weights.json uvicorn main:app
+"""
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+import prevalidation  # noqa: E402
+
+
+def load_labels(paths: list[Path]) -> list[tuple[str, bool]]:
+    samples = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    # The latest label for an input wins
+                    samples[record["input"]] = bool(record["is_valid"])
+    return list(samples.items())
+
+
+def evaluate(samples: list[tuple[str, bool]], weights: dict | None) -> dict:
+    counts = {"accept": [0, 0], "reject": [0, 0], "uncertain": [0, 0]}  # decision -> [llm valid, llm invalid]
+    errors = []
+    for text, label in samples:
+        decision = prevalidation.prevalidate(text, weights)["decision"]
+        counts[decision][0 if label else 1] += 1
+        if (decision == "accept" and not label) or (decision == "reject" and label):
+            errors.append((decision, text))
+
+    valid = sum(1 for _, label in samples if label)
+    invalid = len(samples) - valid
+    accepted_ok, accepted_bad = counts["accept"]
+    rejected_bad, rejected_ok = counts["reject"]
+    ratio = lambda a, b: a / b if b else None  # noqa: E731
+    return {
+        "samples": len(samples),
+        "calls_saved": ratio(accepted_ok + accepted_bad + rejected_ok + rejected_bad, len(samples)),
+        "accept_precision": ratio(accepted_ok, accepted_ok + accepted_bad),
+        "accept_recall": ratio(accepted_ok, valid),
+        "reject_precision": ratio(rejected_ok, rejected_ok + rejected_bad),
+        "reject_recall": ratio(rejected_ok, invalid),
+        "local_accuracy": ratio(accepted_ok + rejected_ok, accepted_ok + accepted_bad + rejected_ok + rejected_bad),
+        "errors": errors,
+    }
+
+
+def print_report(title: str, result: dict, show_errors: bool) -> None:
+    fmt = lambda v: "-" if v is None else f"{v:.1%}"  # noqa: E731
+    print(f"{title} ({result['samples']} labelled inputs)")
+    print(f"  LLM calls saved      {fmt(result['calls_saved'])}")
+    print(f"  local accept         precision {fmt(result['accept_precision'])}  recall {fmt(result['accept_recall'])}")
+    print(f"  local reject         precision {fmt(result['reject_precision'])}  recall {fmt(result['reject_recall'])}")
+    print(f"  local decisions      accuracy {fmt(result['local_accuracy'])}, {len(result['errors'])} disagree with the LLM")
+    if show_errors:
+        for decision, text in result["errors"]:
+            print(f"    wrongly {decision}ed: {text[:100]!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", type=Path, nargs="+", default=[HERE / "data" / "validation_labels.jsonl"])
+    parser.add_argument("--weights", help="weights file to evaluate (default: PREVALIDATION_WEIGHTS or built-in)")
+    parser.add_argument("--train", type=Path, help="fit weights on the labels and write them here")
+    parser.add_argument("--holdout", type=float, default=0.3, help="share of labels kept out of training")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    samples = load_labels(args.labels)
+    weights = prevalidation.load_weights(args.weights) if args.weights else None
+
+    if not args.train:
+        print_report("Pre-validation gate", evaluate(samples, weights), args.show_errors)
+        return
+
+    random.Random(args.seed).shuffle(samples)
+    split = int(len(samples) * (1 - args.holdout))
+    train, test = samples[:split], samples[split:] or samples
+    fitted = prevalidation.fit(train)
+    print_report("Current weights, held-out", evaluate(test, weights), args.show_errors)
+    print_report("Fitted weights, held-out", evaluate(test, fitted), args.show_errors)
+    args.train.write_text(json.dumps(prevalidation.fit(samples), indent=2))
+    print(f"Weights fitted on all {len(samples)} labels written to {args.train}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""The multi-scan safe_json_parse that json_stream.TolerantJSONParser replaced.
+
+Kept only as the baseline for bench_json_parse.py.
+"""
+import json
+
+
+def legacy_safe_json_parse(content: str) -> dict:
+    """Safely parse JSON from LLM response, handling markdown fences and errors."""
+    # Remove markdown code fences if present
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content[7:]  # Remove ```json
+    elif content.startswith("```"):
+        content = content[3:]  # Remove ```
+    
+    if content.endswith("```"):
+        content = content[:-3]  # Remove closing ```
+    
+    content = content.strip()
+    
+    try:
+        parsed = json.loads(content)
+        # Ensure parsed result is a dictionary
+        if not isinstance(parsed, dict):
+            print(f"Warning: LLM returned non-dict JSON: {type(parsed)}")
+            return {"error": "Invalid JSON structure", "raw_content": str(parsed)[:500]}
+        return parsed
+    except json.JSONDecodeError as e:
+        print(f"JSON Parse Error: {e}")
+        print(f"Error at position {e.pos}: {content[max(0, e.pos-50):e.pos+50]}")
+        
+        # Advanced repair strategies
+        repair_attempts = [
+            lambda c: _repair_unterminated_string(c),
+            lambda c: _repair_truncated_json(c),
+            lambda c: _extract_complete_json(c),
+        ]
+        
+        for attempt_num, repair_func in enumerate(repair_attempts, 1):
+            try:
+                repaired = repair_func(content)
+                if repaired:
+                    parsed = json.loads(repaired)
+                    if isinstance(parsed, dict):
+                        print(f"Successfully repaired JSON using strategy {attempt_num}")
+                        return parsed
+            except Exception as repair_error:
+                print(f"Repair attempt {attempt_num} failed: {repair_error}")
+                continue
+        
+        # Return a default error response
+        print(f"All JSON parsing attempts failed. Content length: {len(content)}")
+        print(f"Content preview: {content[:300]}...")
+        return {
+            "error": "Failed to parse JSON response",
+            "raw_content": content[:500]  # Include first 500 chars for debugging
+        }
+
+def _repair_unterminated_string(content: str) -> str:
+    """Attempt to repair unterminated strings by closing them properly."""
+    # Find the last occurrence of an opening quote that's not closed
+    in_string = False
+    escape_next = False
+    last_quote_pos = -1
+    brace_depth = 0
+    
+    for i, char in enumerate(content):
+        if escape_next:
+            escape_next = False
+            continue
+            
+        if char == '\\':
+            escape_next = True
+            continue
+            
+        if char == '"' and not in_string:
+            in_string = True
+            last_quote_pos = i
+        elif char == '"' and in_string:
+            in_string = False
+            last_quote_pos = -1
+        elif char == '{' and not in_string:
+            brace_depth += 1
+        elif char == '}' and not in_string:
+            brace_depth -= 1
+    
+    # If we're still in a string at the end, close it
+    if in_string and last_quote_pos > 0:
+        # Close the string and any open objects
+        repaired = content + '"'
+        # Add closing braces as needed
+        while brace_depth > 0:
+            repaired += '}'
+            brace_depth -= 1
+        return repaired
+    
+    return content
+
+def _repair_truncated_json(content: str) -> str:
+    """Try to close JSON by adding missing closing braces and terminating strings."""
+    # Count open braces and brackets
+    brace_depth = 0
+    bracket_depth = 0
+    in_string = False
+    escape_next = False
+    
+    for char in content:
+        if escape_next:
+            escape_next = False
+            continue
+            
+        if char == '\\':
+            escape_next = True
+            continue
+            
+        if char == '"':
+            in_string = not in_string
+        elif not in_string:
+            if char == '{':
+                brace_depth += 1
+            elif char == '}':
+                brace_depth -= 1
+            elif char == '[':
+                bracket_depth += 1
+            elif char == ']':
+                bracket_depth -= 1
+    
+    # Build repair string
+    repaired = content
+    
+    # Close unterminated string
+    if in_string:
+        repaired += '"'
+    
+    # Close arrays
+    while bracket_depth > 0:
+        repaired += ']'
+        bracket_depth -= 1
+    
+    # Close objects
+    while brace_depth > 0:
+        repaired += '}'
+        brace_depth -= 1
+    
+    return repaired
+
+def _extract_complete_json(content: str) -> str:
+    """Extract the longest valid JSON object from the content."""
+    start_idx = content.find('{')
+    if start_idx == -1:
+        return ""
+    
+    # Try to find a complete JSON object
+    depth = 0
+    in_string = False
+    escape_next = False
+    
+    for i in range(start_idx, len(content)):
+        char = content[i]
+        
+        if escape_next:
+            escape_next = False
+            continue
+            
+        if char == '\\':
+            escape_next = True
+            continue
+            
+        if char == '"':
+            in_string = not in_string
+        elif not in_string:
+            if char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    # Found a complete object
+                    return content[start_idx:i+1]
+    
+    return ""
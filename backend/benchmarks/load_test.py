@@ -0,0 +1,226 @@
+"""Load driver for /refine, /refine-followup, /download-word and /download-pdf.
+
+Sends ``--requests`` calls per scenario with ``--concurrency`` in flight and
+reports throughput, p50/p95/p99 latency, errors and the backend's resident
+memory (peak and after the scenario, sampled from ``/proc``).
+
+With ``--spawn`` it starts ``mock_llm_server.py`` and a backend pointed at it
+(response cache off, so every call reaches the mock) and shuts both down
+afterwards, so it runs without the real gateway, e.g. in CI. Otherwise it
+targets ``--url`` and reads memory of ``--pid`` when given.
+
+    cd backend
+    python benchmarks/load_test.py --spawn --concurrency 8 --requests 50
+    python benchmarks/load_test.py --spawn --scenarios refine --mock-args="--latency fixed:200 --truncate-rate 0.1"
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --pid 12345 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+HERE = Path(__file__).resolve().parent
+BACKEND_DIR = HERE.parent
+
+SCENARIOS = ("refine", "followup", "download-word", "download-pdf")
+
+INSTRUCTIONS = (
+    "Add an edge case for losing the network connection mid-request",
+    "Make the acceptance criteria measurable with concrete thresholds",
+    "Add a risk about third-party API rate limits",
+    "Split the largest user story into two smaller ones",
+)
+
+
+def load_inputs() -> tuple[list[str], dict]:
+    requirements = [
+        line.strip()
+        for line in (HERE / "data" / "requirements.txt").read_text(encoding="utf-8").splitlines()
+        if line.strip()
+    ]
+    report = json.loads((HERE / "data" / "sample_report.json").read_text(encoding="utf-8"))
+    return requirements, report
+
+
+def build_scenarios(requirements: list[str], report: dict) -> dict:
+    """Scenario name -> (path, function from request number to JSON body)."""
+    return {
+        "refine": ("/refine", lambda i: {"user_input": requirements[i % len(requirements)]}),
+        "followup": (
+            "/refine-followup",
+            lambda i: {
+                "original_requirement": requirements[i % len(requirements)],
+                "current_draft": report,
+                "instruction": INSTRUCTIONS[i % len(INSTRUCTIONS)],
+            },
+        ),
+        "download-word": ("/download-word", lambda i: {"ticket": report}),
+        "download-pdf": ("/download-pdf", lambda i: {"ticket": report}),
+    }
+
+
+def rss_bytes(pid: int | None) -> int | None:
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def run_scenario(client: httpx.AsyncClient, path: str, body, requests: int, concurrency: int, pid: int | None) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    next_index = 0
+    peak_rss = rss_bytes(pid) or 0
+    done = asyncio.Event()
+
+    async def sample_memory():
+        nonlocal peak_rss
+        while not done.is_set():
+            peak_rss = max(peak_rss, rss_bytes(pid) or 0)
+            await asyncio.sleep(0.1)
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=body(index))
+                content = response.content
+                failed = response.status_code >= 400
+                if not failed and response.headers.get("content-type", "").startswith("application/json"):
+                    failed = "error" in json.loads(content)
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    sampler = asyncio.ensure_future(sample_memory())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    done.set()
+    await sampler
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": requests / wall,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "peak_rss_mb": peak_rss / 2**20 if pid else None,
+        "end_rss_mb": (rss_bytes(pid) or 0) / 2**20 if pid else None,
+    }
+
+
+def spawn(args) -> tuple[list[subprocess.Popen], str, int]:
+    mock_port, backend_port = args.port + 1, args.port
+    mock = subprocess.Popen(
+        [sys.executable, str(HERE / "mock_llm_server.py"), "--port", str(mock_port), *shlex.split(args.mock_args)],
+        cwd=BACKEND_DIR,
+    )
+    env = {
+        **os.environ,
+        "LLM_API_URL": f"http://127.0.0.1:{mock_port}/chat/completions",
+        "LLM_CACHE_BACKEND": "none",
+        "JOB_WORKERS": "0",
+        "METRICS_SLOW_REQUEST_MS": "0",
+    }
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(backend_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    return [backend, mock], f"http://127.0.0.1:{backend_port}", backend.pid
+
+
+async def wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url + "/")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Backend at {url} did not start within {timeout}s")
+
+
+async def run(args, url: str, pid: int | None) -> dict:
+    requirements, report = load_inputs()
+    scenarios = build_scenarios(requirements, report)
+    await wait_ready(url)
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        for name in args.scenarios:
+            path, body = scenarios[name]
+            results[name] = await run_scenario(client, path, body, args.requests, args.concurrency, pid)
+            print_row(name, results[name])
+    return results
+
+
+def print_row(name: str, r: dict) -> None:
+    memory = f"{r['peak_rss_mb']:>10.1f}{r['end_rss_mb']:>10.1f}" if r["peak_rss_mb"] is not None else f"{'-':>10}{'-':>10}"
+    print(
+        f"{name:<15}{r['requests']:>6}{r['errors']:>7}{r['throughput_rps']:>9.1f}"
+        f"{r['p50_ms']:>9.0f}{r['p95_ms']:>9.0f}{r['p99_ms']:>9.0f}{memory}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--pid", type=int, help="backend process id, for memory readings")
+    parser.add_argument("--spawn", action="store_true", help="start the mock LLM server and a backend")
+    parser.add_argument("--port", type=int, default=8900, help="backend port with --spawn (mock uses port+1)")
+    parser.add_argument("--mock-args", default="--latency lognormal:300,0.3", help="extra mock_llm_server.py arguments")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    processes = []
+    url, pid = args.url, args.pid
+    if args.spawn:
+        processes, url, pid = spawn(args)
+    try:
+        print(f"{'scenario':<15}{'n':>6}{'errors':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'peak MB':>10}{'end MB':>10}")
+        results = asyncio.run(run(args, url, pid))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    if args.json:
+        args.json.write_text(json.dumps({"concurrency": args.concurrency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Local chat-completions server that replays recorded LLM responses.
+
+Point the backend at it with ``LLM_API_URL`` to benchmark without the real
+gateway. The prompt a request was built from (validation, analysis, follow-up,
+patch, quality) is recognised from its system message and answered with one of
+the recordings in ``data/recorded/<kind>/*.txt``, picked by a hash of the user
+message so a run is repeatable. Analysis and full follow-up calls fall back to
+``data/sample_report.json``; sharded calls get only the sections they ask for.
+Captured real completions can simply be dropped into those directories.
+
+Faults are injected at configurable rates: truncated completions (cut off as
+if ``max_tokens`` ran out), malformed ones (wrapped in prose or markdown
+fences) and 429 responses with ``Retry-After``. Latency follows a fixed,
+uniform or lognormal distribution; streamed responses spread it over the
+chunks.
+
+    cd backend
+    python benchmarks/mock_llm_server.py --port 8901 --latency lognormal:800,0.4 --truncate-rate 0.05
+    LLM_API_URL=http://127.0.0.1:8901/chat/completions uvicorn main:app --port 8000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+HERE = Path(__file__).resolve().parent
+RECORDED_DIR = HERE / "data" / "recorded"
+SAMPLE_REPORT = HERE / "data" / "sample_report.json"
+
+# Phrases that identify the prompt a request was built from, checked in order
+PROMPT_KINDS = (
+    ("validation expert", "validation"),
+    ("quality auditor", "quality"),
+    ("RFC 6902 JSON Patch", "patch"),
+    ("elite senior business analyst", "followup"),
+    ("Requirements Analysis Agent", "analysis"),
+)
+
+STREAM_CHUNKS = 40
+
+
+def parse_latency(spec: str):
+    """``fixed:MS``, ``uniform:MIN,MAX`` or ``lognormal:MEDIAN,SIGMA`` -> sampler returning seconds."""
+    name, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if name == "fixed" and len(values) == 1:
+        return lambda rng: values[0] / 1000
+    if name == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if name == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise argparse.ArgumentTypeError(f"Invalid latency spec '{spec}'")
+
+
+def load_recordings(directory: Path) -> dict[str, list[str]]:
+    recordings = {kind: [] for _, kind in PROMPT_KINDS}
+    for kind in recordings:
+        if (directory / kind).is_dir():
+            recordings[kind] = [p.read_text(encoding="utf-8") for p in sorted((directory / kind).glob("*.txt"))]
+    report = SAMPLE_REPORT.read_text(encoding="utf-8")
+    for kind in ("analysis", "followup"):
+        if not recordings[kind]:
+            recordings[kind] = [report]
+    return recordings
+
+
+def classify(messages: list[dict]) -> str:
+    system = str(messages[0].get("content", "")) if messages else ""
+    for phrase, kind in PROMPT_KINDS:
+        if phrase in system:
+            return kind
+    return "analysis"
+
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return str(content)
+
+
+def shard_sections(messages: list[dict]) -> list[str] | None:
+    """Top-level keys a sharded analysis call asks for, from its shard instruction."""
+    for message in messages[1:-1]:
+        content = _text(message.get("content"))
+        if "SECTIONED GENERATION" in content:
+            start = content.index("{", content.index("SECTIONED GENERATION"))
+            skeleton, _ = json.JSONDecoder().raw_decode(content, start)
+            return list(skeleton)
+    return None
+
+
+class MockLLM:
+    def __init__(self, args):
+        self.args = args
+        self.recordings = load_recordings(args.recordings)
+        self.latency = parse_latency(args.latency)
+        self.rng = random.Random(args.seed)
+        self.counters = {"requests": 0, "streamed": 0, "truncated": 0, "malformed": 0, "rate_limited": 0}
+
+    def completion(self, payload: dict) -> tuple[str, str]:
+        """Recorded completion text for ``payload`` (with any injected fault) and its finish reason."""
+        messages = payload.get("messages") or []
+        kind = classify(messages)
+        user = _text(messages[-1].get("content")) if messages else ""
+        options = self.recordings[kind]
+        digest = int(hashlib.sha256(user.encode("utf-8")).hexdigest(), 16)
+        text = options[digest % len(options)]
+
+        sections = shard_sections(messages) if kind == "analysis" else None
+        if sections is not None:
+            try:
+                report = json.loads(text)
+                text = json.dumps({key: report[key] for key in sections if key in report}, indent=2)
+            except json.JSONDecodeError:
+                pass
+
+        if self.rng.random() < self.args.truncate_rate:
+            self.counters["truncated"] += 1
+            return text[: self.rng.randrange(len(text) // 3, len(text))], "length"
+        if self.rng.random() < self.args.malformed_rate:
+            self.counters["malformed"] += 1
+            if self.rng.random() < 0.5:
+                return f"Here is the result:\n{text}\nLet me know if you need anything else.", "stop"
+            return f"```json\n{text}\n```", "stop"
+        return text, "stop"
+
+    @staticmethod
+    def usage(payload: dict, text: str) -> dict:
+        prompt = sum(len(_text(m.get("content"))) for m in payload.get("messages") or []) // 4
+        completion = len(text) // 4
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    async def handle(self, request: Request):
+        payload = await request.json()
+        self.counters["requests"] += 1
+        if self.rng.random() < self.args.error_rate:
+            self.counters["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                status_code=429,
+                headers={"retry-after-ms": str(self.args.retry_after_ms)},
+            )
+
+        text, finish_reason = self.completion(payload)
+        usage = self.usage(payload, text)
+        delay = self.latency(self.rng)
+
+        if payload.get("stream"):
+            self.counters["streamed"] += 1
+            return StreamingResponse(self.stream(text, finish_reason, usage, delay), media_type="text/event-stream")
+
+        await asyncio.sleep(delay)
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "model": payload.get("model", "mock"),
+            "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}
+            ],
+            "usage": usage,
+        }
+
+    async def stream(self, text: str, finish_reason: str, usage: dict, delay: float):
+        size = max(1, -(-len(text) // STREAM_CHUNKS))
+        for start in range(0, len(text), size):
+            await asyncio.sleep(delay / STREAM_CHUNKS)
+            chunk = {"choices": [{"index": 0, "delta": {"content": text[start:start + size]}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {}, 'finish_reason': finish_reason}]})}\n\n"
+        yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+
+def create_app(args) -> FastAPI:
+    mock = MockLLM(args)
+    app = FastAPI(title="Mock chat completions")
+
+    @app.post("/{path:path}")
+    async def chat_completions(request: Request, path: str):
+        return await mock.handle(request)
+
+    @app.get("/stats")
+    def stats():
+        return mock.counters
+
+    return app
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--recordings", type=Path, default=RECORDED_DIR)
+    parser.add_argument("--latency", default="lognormal:800,0.4", help="fixed:MS | uniform:MIN,MAX | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after-ms", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    parse_latency(args.latency)
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
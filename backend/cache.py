@@ -0,0 +1,286 @@
+"""Pluggable key/value cache backends with TTL.
+
+All backends store raw bytes and share the same async interface:
+``get(key)``, ``set(key, value, ttl)`` and ``delete(key)``.
+
+- ``MemoryCache``: in-process LRU bounded by a byte budget
+- ``SqliteCache``: on-disk store shared by every uvicorn worker on the host
+- ``FileCache``: one file per entry, on-disk LRU bounded by a byte budget
+- ``RedisCache``: shared across hosts, needs the optional ``redis`` package
+"""
+import asyncio
+import contextlib
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryCache:
+    """LRU cache that evicts least recently used entries once ``max_bytes`` is exceeded."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, tuple[float | None, bytes]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> bytes | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        if len(value) > self.max_bytes:
+            return
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._remove(key)
+            self._items[key] = (expires_at, value)
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._items))
+                self._remove(oldest)
+
+    async def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._size -= len(item[1])
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "entries": len(self._items), "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+class SqliteCache:
+    """Cache table in a local sqlite file; WAL mode lets several processes share it."""
+
+    # Purge expired rows once every this many writes
+    PURGE_EVERY = 200
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+        )
+        self._conn.commit()
+
+    def _get(self, key: str) -> bytes | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return value
+
+    def _set(self, key: str, value: bytes, ttl: float | None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+            self._conn.commit()
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    async def get(self, key: str) -> bytes | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone()
+        return {"backend": "sqlite", "path": self.path, "entries": entries, "bytes": size}
+
+
+class FileCache:
+    """One file per key in a directory shared by every worker on the host.
+
+    Reads refresh a file's mtime, and once the directory outgrows
+    ``max_bytes`` the least recently used files are removed. Entries do not
+    expire otherwise: ``ttl`` is accepted for interface parity and ignored.
+    """
+
+    # Seconds after which an unadopted temporary file counts as abandoned
+    TMP_MAX_AGE = 3600
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = self._scan()[1]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def _scan(self) -> tuple[list[tuple[float, int, str]], int]:
+        files = []
+        stale = time.time() - self.TMP_MAX_AGE
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if not entry.name.endswith(".tmp"):
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                elif stat.st_mtime < stale:
+                    # Left behind by a writer that crashed
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(entry.path)
+        return files, sum(size for _, size, _ in files)
+
+    def tmp_path(self) -> str:
+        """A new file in the cache directory for ``adopt``, ignored until then."""
+        fd, path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        return path
+
+    def adopt(self, key: str, path: str) -> None:
+        """Move a file written elsewhere in this directory into the cache under ``key``."""
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            os.unlink(path)
+            return
+        os.replace(path, self._path(key))
+        with self._lock:
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _locate(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def _set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(value)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(value)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Other workers write here too, so re-read the real total before removing anything
+        files, self._size = self._scan()
+        for _, size, path in sorted(files):
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def _delete(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    async def get(self, key: str) -> bytes | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        await asyncio.to_thread(self._set, key, value)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    async def locate(self, key: str) -> str | None:
+        """Path of the file cached under ``key``, counted as a use, so large values can be streamed from it."""
+        return await asyncio.to_thread(self._locate, key)
+
+    def stats(self) -> dict:
+        files, size = self._scan()
+        return {
+            "backend": "files", "path": self.directory, "entries": len(files), "bytes": size, "max_bytes": self.max_bytes
+        }
+
+
+class RedisCache:
+    def __init__(self, url: str, prefix: str):
+        import redis.asyncio as redis  # optional dependency
+
+        self._redis = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._redis.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        await self._redis.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(self.prefix + key)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "prefix": self.prefix}
+
+
+def build_backend(kind: str, *, max_bytes: int, sqlite_path: str, redis_url: str, prefix: str):
+    """Create a backend by name ("memory", "sqlite", "redis" or "none")."""
+    kind = kind.lower()
+    if kind in ("", "none", "off"):
+        return None
+    if kind == "sqlite":
+        return SqliteCache(sqlite_path)
+    if kind == "redis":
+        try:
+            return RedisCache(redis_url, prefix)
+        except ImportError:
+            print("Redis cache requested but the 'redis' package is not installed, using memory cache")
+    return MemoryCache(max_bytes)
@@ -0,0 +1,224 @@
+"""Fast DOCX rendering without python-docx's per-paragraph object model.
+
+``create_word`` lays the report out with ``add_heading``/``add_paragraph``
+calls. Run against python-docx every call builds lxml elements and looks the
+style up again, which dominates the render time of large reports.
+``BodyWriter`` takes the same calls but appends pre-built XML strings, and
+``render`` splices them into the default template's ``document.xml`` and zips
+it together with the template's other parts.
+
+The template is loaded once (``preload`` at startup, or on first use). Its
+static parts are deflated at that point, so only ``document.xml`` is
+compressed per report. The parts are the ones python-docx writes for the same
+calls; only the zip container differs (fixed timestamps, so the same ticket
+always renders to the same bytes).
+
+The zip is written to the output as it is produced: the static parts that
+precede ``document.xml`` right away, then each paragraph is deflated as it is
+added, and the rest on ``save``. ``document.xml``'s checksum and sizes follow
+its data in a data descriptor, so neither the paragraphs nor the compressed
+body are held in memory, whatever the size of the report.
+"""
+import re
+import struct
+import threading
+import zipfile
+import zlib
+from io import BytesIO
+
+import docx
+from docx.enum.style import WD_STYLE_TYPE
+
+DOCUMENT_PART = "word/document.xml"
+
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+_RUN_BREAKS = re.compile(r"(\t|\r|\n)")
+_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+# 1980-01-01 00:00 in DOS date/time format
+_DOS_TIME, _DOS_DATE = 0, (0 << 9) | (1 << 5) | 1
+# General purpose flag: checksum and sizes follow the data
+_DATA_DESCRIPTOR = 0x08
+
+
+class _Template:
+    def __init__(self):
+        document = docx.Document()
+        self._part = document.part
+        buffer = BytesIO()
+        document.save(buffer)
+        buffer.seek(0)
+
+        with zipfile.ZipFile(buffer) as archive:
+            self.members = [(info.filename, archive.read(info.filename)) for info in archive.infolist()]
+        blob = dict(self.members)[DOCUMENT_PART].decode("utf-8")
+        # New paragraphs go before the body's closing section properties
+        split = blob.rindex("<w:sectPr")
+        self.head, self.tail = blob[:split], blob[split:]
+        self.compressed = {name: _deflate(data) for name, data in self.members if name != DOCUMENT_PART}
+        self._styles: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def paragraph_open(self, style: str | None) -> str:
+        """``<w:p>`` plus the paragraph properties for ``style`` (a style name, as python-docx takes it)."""
+        if style is None:
+            return "<w:p>"
+        opening = self._styles.get(style)
+        if opening is None:
+            with self._lock:
+                style_id = self._part.get_style_id(style, WD_STYLE_TYPE.PARAGRAPH)
+            opening = "<w:p>" if style_id is None else f'<w:p><w:pPr><w:pStyle w:val="{style_id}"/></w:pPr>'
+            self._styles[style] = opening
+        return opening
+
+
+_template: _Template | None = None
+_template_lock = threading.Lock()
+
+
+def preload() -> None:
+    """Load and pre-compress the template parts, so the first download does not pay for it."""
+    global _template
+    with _template_lock:
+        if _template is None:
+            _template = _Template()
+
+
+def _get_template() -> _Template:
+    if _template is None:
+        preload()
+    return _template
+
+
+def _deflate(data: bytes) -> tuple[bytes, int, int]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(), zlib.crc32(data), len(data)
+
+
+def _run_xml(text: str) -> str:
+    """``<w:r>`` content for ``text`` as python-docx builds it: tabs and line breaks become elements."""
+    if _INVALID_XML.search(text):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+    parts = []
+    for piece in _RUN_BREAKS.split(text):
+        if piece == "\t":
+            parts.append("<w:tab/>")
+        elif piece in ("\r", "\n"):
+            parts.append("<w:br/>")
+        elif piece:
+            space = ' xml:space="preserve"' if len(piece.strip()) < len(piece) else ""
+            parts.append(f"<w:t{space}>{piece.translate(_ESCAPES)}</w:t>")
+    return f"<w:r>{''.join(parts)}</w:r>"
+
+
+class _ZipWriter:
+    """Deflated zip entries written straight to a file object, with fixed timestamps."""
+
+    def __init__(self, out):
+        self.out = out
+        self.offset = 0
+        self.directory: list[bytes] = []
+        self._compressor = None
+
+    def _write(self, data: bytes) -> None:
+        self.out.write(data)
+        self.offset += len(data)
+
+    @staticmethod
+    def _directory_entry(encoded: bytes, flags: int, crc: int, compressed: int, size: int, offset: int) -> bytes:
+        return struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, 20, 20, flags, 8, _DOS_TIME, _DOS_DATE, crc, compressed, size,
+            len(encoded), 0, 0, 0, 0, 0, offset,
+        ) + encoded
+
+    def _header(self, encoded: bytes, flags: int, crc: int, compressed: int, size: int) -> None:
+        self.directory.append(self._directory_entry(encoded, flags, crc, compressed, size, self.offset))
+        self._write(struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 20, flags, 8, _DOS_TIME, _DOS_DATE,
+            *((0, 0, 0) if flags & _DATA_DESCRIPTOR else (crc, compressed, size)), len(encoded), 0,
+        ))
+        self._write(encoded)
+
+    def add(self, name: str, data: bytes, crc: int, size: int) -> None:
+        """An entry whose deflated ``data`` is already known."""
+        self._header(name.encode("utf-8"), 0, crc, len(data), size)
+        self._write(data)
+
+    def begin(self, name: str) -> None:
+        """Start an entry whose content follows through ``write``."""
+        self._name, self._start = name.encode("utf-8"), self.offset
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        self._crc = self._compressed = self._size = 0
+        self._header(self._name, _DATA_DESCRIPTOR, 0, 0, 0)
+
+    def write(self, data: bytes) -> None:
+        compressed = self._compressor.compress(data)
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        if compressed:
+            self._compressed += len(compressed)
+            self._write(compressed)
+
+    def end(self) -> None:
+        tail = self._compressor.flush()
+        self._compressed += len(tail)
+        self._write(tail)
+        self._write(struct.pack("<IIII", 0x08074B50, self._crc, self._compressed, self._size))
+        # The directory entry was packed before the checksum and sizes were known
+        self.directory[-1] = self._directory_entry(
+            self._name, _DATA_DESCRIPTOR, self._crc, self._compressed, self._size, self._start
+        )
+        self._compressor = None
+
+    def close(self) -> None:
+        start = self.offset
+        for entry in self.directory:
+            self._write(entry)
+        self._write(struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, len(self.directory), len(self.directory), self.offset - start, start, 0
+        ))
+
+
+class BodyWriter:
+    """Takes the subset of python-docx's ``Document`` API the report uses and writes the .docx to ``out``."""
+
+    def __init__(self, out=None):
+        self._template = _get_template()
+        self._buffer = BytesIO() if out is None else None
+        self._zip = _ZipWriter(out if out is not None else self._buffer)
+        self._rest = list(self._template.members)
+        # Parts ahead of document.xml in the template go out before the first paragraph
+        while self._rest:
+            name, _ = self._rest.pop(0)
+            if name == DOCUMENT_PART:
+                break
+            self._zip.add(name, *self._template.compressed[name])
+        self._zip.begin(DOCUMENT_PART)
+        self._zip.write(self._template.head.encode("utf-8"))
+
+    def add_heading(self, text: str = "", level: int = 1) -> None:
+        if not 0 <= level <= 9:
+            raise ValueError("level must be in range 0-9, got %d" % level)
+        self.add_paragraph(text, "Title" if level == 0 else "Heading %d" % level)
+
+    def add_paragraph(self, text: str = "", style: str | None = None) -> None:
+        run = _run_xml(text) if text else ""
+        self._zip.write(f"{self._template.paragraph_open(style)}{run}</w:p>".encode("utf-8"))
+
+    def add_page_break(self) -> None:
+        self._zip.write(b'<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+
+    def save(self):
+        """Finish the file; returns its bytes when no ``out`` was given."""
+        self._zip.write(self._template.tail.encode("utf-8"))
+        self._zip.end()
+        for name, _ in self._rest:
+            self._zip.add(name, *self._template.compressed[name])
+        self._zip.close()
+        return self._buffer.getvalue() if self._buffer is not None else None
+
+
+def render(layout, out=None):
+    """Run ``layout(writer)`` against a ``BodyWriter`` writing to ``out``; returns the bytes without ``out``."""
+    writer = BodyWriter(out)
+    layout(writer)
+    return writer.save()
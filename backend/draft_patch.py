@@ -0,0 +1,152 @@
+"""Helpers for patch-based follow-up refinement.
+
+Instead of sending the whole report and getting a whole new one back, a
+follow-up sends only the sections its instruction targets and asks for an
+RFC 6902 JSON Patch against them, which is applied here.
+"""
+import copy
+import re
+
+# Instruction keywords -> report sections they refer to
+SECTION_KEYWORDS = (
+    (r"edge|corner case|exception scenario|failure scenario", ("edge_cases",)),
+    (r"acceptance|criteri|given.?when.?then|\bac\b", ("acceptance_criteria",)),
+    (r"test stor", ("test_stories",)),
+    (r"test|\bqa\b|coverage", ("test_cases", "test_coverage_summary")),
+    (r"user stor|\bstor(y|ies)\b|breakdown|definition of done", ("user_stories",)),
+    (r"\bepic", ("epic",)),
+    (r"risk|dependenc|mitigat", ("dependencies_and_risks",)),
+    (r"effort|estimat|sprint|story points", ("effort_estimation",)),
+    (r"question|clarif|ambigu", ("clarification_questions",)),
+    (r"security|performance|hardware|\bui\b|\bux\b|hmi|backend|api|compliance|privacy|non.?functional|detailed analysis",
+     ("detailed_analysis",)),
+    (r"option|approach|alternative|solution", ("implementation_options", "recommendation")),
+    (r"recommend", ("recommendation",)),
+    (r"next step|action item", ("next_steps",)),
+    (r"classif|priority|complexity|domain|stakeholder|category|scope", ("classification",)),
+    (r"summary|title|requirement id", ("requirement_summary",)),
+)
+
+# Words that ask for a change across the whole report rather than specific sections
+GLOBAL_KEYWORDS = re.compile(r"\b(everything|entire|whole|all sections|overall|throughout|rewrite)\b", re.IGNORECASE)
+
+
+class PatchError(Exception):
+    pass
+
+
+def target_sections(instruction: str, draft: dict) -> list[str]:
+    """Sections of ``draft`` the instruction refers to, or [] when it is general."""
+    if GLOBAL_KEYWORDS.search(instruction):
+        return []
+    text = instruction.lower()
+    found: list[str] = []
+    # Sections mentioned by name ("next_steps", "next steps")
+    for key in draft:
+        if key in text or key.replace("_", " ") in text:
+            found.append(key)
+    for pattern, sections in SECTION_KEYWORDS:
+        if re.search(pattern, text):
+            found.extend(sections)
+    return [key for key in dict.fromkeys(found) if key in draft]
+
+
+def _parse_pointer(path: str) -> list[str]:
+    if not isinstance(path, str) or not path.startswith("/"):
+        raise PatchError(f"Invalid JSON pointer '{path}'")
+    return [part.replace("~1", "/").replace("~0", "~") for part in path[1:].split("/")]
+
+
+def _parent(doc, parts: list[str]):
+    target = doc
+    for part in parts[:-1]:
+        try:
+            target = target[int(part)] if isinstance(target, list) else target[part]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise PatchError(f"Path segment '{part}' does not exist")
+    return target, parts[-1]
+
+
+def _index(container: list, key: str, allow_end: bool) -> int:
+    if key == "-" and allow_end:
+        return len(container)
+    try:
+        index = int(key)
+    except ValueError:
+        raise PatchError(f"Invalid list index '{key}'")
+    if not 0 <= index <= len(container) - (0 if allow_end else 1):
+        raise PatchError(f"List index {index} out of range")
+    return index
+
+
+def _get(doc, parts: list[str]):
+    container, key = _parent(doc, parts)
+    try:
+        return container[_index(container, key, False)] if isinstance(container, list) else container[key]
+    except (KeyError, TypeError):
+        raise PatchError(f"Path '/{'/'.join(parts)}' does not exist")
+
+
+def _remove(doc, parts: list[str]):
+    container, key = _parent(doc, parts)
+    if isinstance(container, list):
+        return container.pop(_index(container, key, False))
+    if not isinstance(container, dict) or key not in container:
+        raise PatchError(f"Path '/{'/'.join(parts)}' does not exist")
+    return container.pop(key)
+
+
+def _add(doc, parts: list[str], value) -> None:
+    container, key = _parent(doc, parts)
+    if isinstance(container, list):
+        container.insert(_index(container, key, True), value)
+    elif isinstance(container, dict):
+        container[key] = value
+    else:
+        raise PatchError(f"Cannot add to '/{'/'.join(parts[:-1])}'")
+
+
+def apply_patch(doc: dict, operations: list, allowed_sections: list[str]) -> dict:
+    """Apply JSON Patch ``operations`` to a copy of ``doc``.
+
+    Only paths inside ``allowed_sections`` may be touched. The patch is
+    applied all-or-nothing; ``PatchError`` is raised on the first bad op.
+    """
+    if not isinstance(operations, list):
+        raise PatchError("Patch must be a list of operations")
+    result = copy.deepcopy(doc)
+    for op in operations:
+        if not isinstance(op, dict):
+            raise PatchError("Patch operations must be objects")
+        name = op.get("op")
+        parts = _parse_pointer(op.get("path"))
+        if parts[0] not in allowed_sections:
+            raise PatchError(f"Patch touches section '{parts[0]}' that was not sent")
+
+        if name in ("add", "replace") and "value" not in op:
+            raise PatchError(f"'{name}' operation without a value")
+        if name == "add":
+            if len(parts) == 1:
+                result[parts[0]] = op["value"]
+            else:
+                _add(result, parts, op["value"])
+        elif name == "replace":
+            if len(parts) == 1:
+                result[parts[0]] = op["value"]
+            else:
+                _remove(result, parts)
+                _add(result, parts, op["value"])
+        elif name == "remove":
+            _remove(result, parts)
+        elif name in ("move", "copy"):
+            source = _parse_pointer(op.get("from"))
+            if source[0] not in allowed_sections:
+                raise PatchError(f"Patch reads section '{source[0]}' that was not sent")
+            value = _remove(result, source) if name == "move" else copy.deepcopy(_get(result, source))
+            _add(result, parts, value)
+        elif name == "test":
+            if _get(result, parts) != op.get("value"):
+                raise PatchError(f"Test failed at '{op.get('path')}'")
+        else:
+            raise PatchError(f"Unsupported patch operation '{name}'")
+    return result
@@ -0,0 +1,168 @@
+"""Server-side store for report drafts and their refinement history.
+
+Each draft gets an id when it is first generated; follow-ups and downloads
+can then refer to it by id (and optionally a version) instead of uploading the
+whole report again. Every refinement adds a version. Versions list their
+top-level sections by content hash and the section bodies are stored once per
+draft, so a follow-up that edits one section only adds that section.
+
+Drafts live in one of the ``cache`` backends: the memory backend evicts least
+recently used drafts past its byte budget, and every write renews the TTL.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+import weakref
+from pathlib import Path
+
+from cache import MemoryCache, build_backend
+
+DRAFT_STORE_BACKEND = os.getenv("DRAFT_STORE_BACKEND", "memory")
+DRAFT_TTL = float(os.getenv("DRAFT_TTL", "86400"))
+DRAFT_STORE_MAX_BYTES = int(os.getenv("DRAFT_STORE_MAX_BYTES", str(64 * 1024 * 1024)))
+DRAFT_STORE_SQLITE_PATH = os.getenv(
+    "DRAFT_STORE_SQLITE_PATH", str(Path(__file__).resolve().parent / ".cache" / "drafts.sqlite3")
+)
+# Older versions beyond this many are dropped from a draft's history
+DRAFT_MAX_VERSIONS = int(os.getenv("DRAFT_MAX_VERSIONS", "50"))
+
+
+class DraftNotFound(Exception):
+    pass
+
+
+class VersionConflict(Exception):
+    """A write was based on a version that is no longer the latest."""
+
+    def __init__(self, latest: int):
+        super().__init__(f"Draft has moved on to version {latest}")
+        self.latest = latest
+
+
+def _section_hash(key: str, value) -> str:
+    encoded = json.dumps([key, value], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:32]
+
+
+class DraftStore:
+    def __init__(self, backend):
+        self._backend = backend
+        self._locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+        self._counters = {"created": 0, "versions": 0, "reads": 0, "misses": 0, "conflicts": 0}
+
+    async def _load(self, draft_id: str) -> dict:
+        raw = await self._backend.get(draft_id)
+        if raw is None:
+            self._counters["misses"] += 1
+            raise DraftNotFound(draft_id)
+        return json.loads(raw)
+
+    async def _save(self, draft_id: str, record: dict) -> None:
+        await self._backend.set(draft_id, json.dumps(record, ensure_ascii=False).encode("utf-8"), DRAFT_TTL)
+
+    def _lock(self, draft_id: str) -> asyncio.Lock:
+        lock = self._locks.get(draft_id)
+        if lock is None:
+            lock = self._locks[draft_id] = asyncio.Lock()
+        return lock
+
+    @staticmethod
+    def _add_version(record: dict, ticket: dict, **meta) -> int:
+        sections = {}
+        for key, value in ticket.items():
+            digest = _section_hash(key, value)
+            record["blobs"].setdefault(digest, value)
+            sections[key] = digest
+        version = record["versions"][-1]["version"] + 1 if record["versions"] else 1
+        record["versions"].append({"version": version, "created_at": time.time(), **meta, "sections": sections})
+
+        if len(record["versions"]) > DRAFT_MAX_VERSIONS:
+            record["versions"] = record["versions"][-DRAFT_MAX_VERSIONS:]
+            live = {digest for v in record["versions"] for digest in v["sections"].values()}
+            record["blobs"] = {digest: value for digest, value in record["blobs"].items() if digest in live}
+        return version
+
+    async def create(self, ticket: dict, original_requirement: str | None = None) -> tuple[str, int]:
+        draft_id = uuid.uuid4().hex
+        record = {"original_requirement": original_requirement, "created_at": time.time(), "versions": [], "blobs": {}}
+        version = self._add_version(record, ticket, instruction=None, base_version=None)
+        await self._save(draft_id, record)
+        self._counters["created"] += 1
+        return draft_id, version
+
+    async def get(self, draft_id: str, version: int | None = None) -> dict:
+        """The draft's ticket at ``version`` (default latest) plus its metadata."""
+        record = await self._load(draft_id)
+        self._counters["reads"] += 1
+        latest = record["versions"][-1]
+        entry = latest if version is None else next((v for v in record["versions"] if v["version"] == version), None)
+        if entry is None:
+            raise DraftNotFound(f"{draft_id} version {version}")
+        return {
+            "draft_id": draft_id,
+            "version": entry["version"],
+            "latest_version": latest["version"],
+            "original_requirement": record["original_requirement"],
+            "ticket": {key: record["blobs"][digest] for key, digest in entry["sections"].items()},
+        }
+
+    async def commit(self, draft_id: str, ticket: dict, base_version: int, instruction: str | None = None) -> int:
+        """Store ``ticket`` as the next version; ``base_version`` must still be the latest."""
+        async with self._lock(draft_id):
+            record = await self._load(draft_id)
+            latest = record["versions"][-1]["version"]
+            if base_version != latest:
+                self._counters["conflicts"] += 1
+                raise VersionConflict(latest)
+            version = self._add_version(record, ticket, instruction=instruction, base_version=base_version)
+            await self._save(draft_id, record)
+        self._counters["versions"] += 1
+        return version
+
+    async def history(self, draft_id: str) -> list[dict]:
+        record = await self._load(draft_id)
+        return [
+            {key: v.get(key) for key in ("version", "created_at", "instruction", "base_version")}
+            | {"changed_sections": self._changed(record["versions"], i)}
+            for i, v in enumerate(record["versions"])
+        ]
+
+    @staticmethod
+    def _changed(versions: list[dict], index: int) -> list[str]:
+        current = versions[index]["sections"]
+        if index == 0:
+            return list(current)
+        previous = versions[index - 1]["sections"]
+        return [key for key in current if current[key] != previous.get(key)] + [
+            key for key in previous if key not in current
+        ]
+
+    @property
+    def shared(self) -> bool:
+        """Whether other workers and later processes see the same drafts."""
+        return not isinstance(self._backend, MemoryCache)
+
+    def stats(self) -> dict:
+        return {**self._counters, "ttl_seconds": DRAFT_TTL, "storage": self._backend.stats()}
+
+
+_store: DraftStore | None = None
+
+
+def get_store() -> DraftStore:
+    global _store
+    if _store is None:
+        backend = build_backend(
+            DRAFT_STORE_BACKEND,
+            max_bytes=DRAFT_STORE_MAX_BYTES,
+            sqlite_path=DRAFT_STORE_SQLITE_PATH,
+            redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            prefix="draft:",
+        )
+        if backend is None:
+            backend = build_backend("memory", max_bytes=DRAFT_STORE_MAX_BYTES, sqlite_path="", redis_url="", prefix="")
+        _store = DraftStore(backend)
+    return _store
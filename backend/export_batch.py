@@ -0,0 +1,126 @@
+"""Reports of many tickets in one download, for ``/download-batch``.
+
+As a zip, every ticket is rendered through the export cache, so cached
+documents are not rendered again and new ones are cached for single
+downloads. Up to ``EXPORT_BATCH_CONCURRENCY`` renders run at once, spread over
+the render processes, and each document becomes a zip entry as soon as it is
+complete, so the archive streams out while the rest still renders. Entries
+are stored without compression (DOCX and PDF are compressed already) and
+written with data descriptors, so the archive is never held in memory: the
+API only holds the documents that finished but are not written yet, spooled
+to disk when large.
+
+A ticket that fails to render does not abort the archive; it is listed in an
+``ERRORS.txt`` entry at the end instead. When the render queue is full, batch
+renders wait for room rather than failing.
+
+Combined, all reports go into a single DOCX or PDF after a contents list
+(the ``docx_combined`` and ``pdf_combined`` writers of ``export_pool``). A
+document cannot be split across processes, so that is one render, downloaded
+and cached like any other export.
+"""
+import asyncio
+import os
+import re
+import tempfile
+import time
+import zipfile
+from typing import AsyncIterator
+
+from export_cache import CHUNK_SIZE, EXPORT_CACHE_MEMORY_ITEM_MAX_BYTES, get_cache
+from export_pool import EXPORT_TIMEOUT, EXPORT_WORKERS, ExportBusy
+from exporters import EXPORTERS
+from report_sections import report_title
+
+EXPORT_BATCH_MAX_TICKETS = int(os.getenv("EXPORT_BATCH_MAX_TICKETS", "200"))
+# Renders of one batch in flight at once
+EXPORT_BATCH_CONCURRENCY = int(os.getenv("EXPORT_BATCH_CONCURRENCY", str(EXPORT_WORKERS * 2)))
+
+# How long a batch render waits before asking the full render queue again
+BUSY_RETRY_INTERVAL = 0.5
+
+
+class _Sink:
+    """Write-only, unseekable target for ``zipfile`` whose output is collected between entries."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def entry_name(index: int, ticket: dict, fmt: str) -> str:
+    """``001-REQ-2041-users-must-be-able.docx``: position in the batch, then the requirement."""
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", report_title(ticket)).strip("-")[:48].rstrip("-")
+    return f"{index:03d}-{slug or 'report'}.{EXPORTERS[fmt].extension}"
+
+
+async def _collect(fmt: str, ticket: dict):
+    """The finished document as a file object positioned at its start."""
+    deadline = time.monotonic() + (EXPORT_TIMEOUT or float("inf"))
+    while True:
+        try:
+            body, _, _ = await get_cache().open(fmt, ticket)
+            break
+        except ExportBusy:
+            if time.monotonic() >= deadline:
+                raise
+            await asyncio.sleep(BUSY_RETRY_INTERVAL)
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_CACHE_MEMORY_ITEM_MAX_BYTES)
+    if isinstance(body, bytes):
+        spool.write(body)
+    else:
+        async for chunk in body:
+            spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+async def stream_zip(fmt: str, tickets: list[dict]) -> AsyncIterator[bytes]:
+    """The zip archive of every ticket's ``fmt`` report, entries in the order they finish rendering."""
+    semaphore = asyncio.Semaphore(max(1, EXPORT_BATCH_CONCURRENCY))
+
+    async def render(index: int, ticket: dict):
+        async with semaphore:
+            try:
+                return index, ticket, await _collect(fmt, ticket), None
+            except Exception as e:
+                return index, ticket, None, e
+
+    tasks = [asyncio.ensure_future(render(index, ticket)) for index, ticket in enumerate(tickets, 1)]
+    sink = _Sink()
+    errors = []
+    try:
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+            for next_done in asyncio.as_completed(tasks):
+                index, ticket, document, error = await next_done
+                name = entry_name(index, ticket, fmt)
+                if error is not None:
+                    print(f"Batch export of {name} failed: {error!r}")
+                    errors.append(f"{name}: {error or type(error).__name__}")
+                    continue
+                with document, archive.open(zipfile.ZipInfo(name, time.localtime()[:6]), "w") as entry:
+                    while chunk := document.read(CHUNK_SIZE):
+                        entry.write(chunk)
+                        if data := sink.drain():
+                            yield data
+                if data := sink.drain():
+                    yield data
+            if errors:
+                archive.writestr("ERRORS.txt", "\n".join(errors) + "\n")
+        yield sink.drain()
+    finally:
+        # The client went away: stop waiting (renders already started still finish into the cache)
+        for task in tasks:
+            task.cancel()
+
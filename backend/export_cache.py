@@ -0,0 +1,287 @@
+"""Rendered report documents keyed by a canonical hash of the ticket.
+
+A ticket is hashed from its JSON with sorted keys, so the same report always
+maps to the same key however its dict was built. Rendered documents are kept
+in a byte-budgeted in-memory LRU in front of an on-disk one shared by every
+worker on the host. Documents above ``EXPORT_CACHE_MEMORY_ITEM_MAX_BYTES``
+only live on disk and are streamed from there.
+
+The hash doubles as the download's ``ETag``: a client repeating a download
+with ``If-None-Match`` gets a ``304`` without the ticket being rendered or
+even looked up. Keys and tags include a fingerprint of the rendering code,
+so a deploy that changes the layout does not serve stale documents.
+
+On a miss the document is rendered into a temporary file (in the cache
+directory, so finishing it is a rename) and the download follows that file
+as it grows: it starts with the renderer's first bytes and never holds the
+document in memory. Concurrent downloads of the same ticket follow the same
+render.
+
+With ``EXPORT_PRERENDER`` both formats are rendered in the background as soon
+as a ticket is produced, so the first download is a cache hit as well.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator
+
+import docx_renderer
+import exporters
+import llm_service
+import metrics
+import pdf_renderer
+import report_sections
+from cache import FileCache, MemoryCache
+from export_pool import get_pool
+from llm_service import DOCX_RENDERER
+
+EXPORT_CACHE_ENABLED = os.getenv("EXPORT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Larger documents are kept on disk only
+EXPORT_CACHE_MEMORY_ITEM_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MEMORY_ITEM_MAX_BYTES", str(1024 * 1024)))
+# Empty keeps rendered documents in memory only
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", str(Path(__file__).resolve().parent / ".cache" / "exports"))
+EXPORT_CACHE_DISK_MAX_BYTES = int(os.getenv("EXPORT_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+EXPORT_PRERENDER = os.getenv("EXPORT_PRERENDER", "false").lower() in ("1", "true", "yes")
+# Background renders beyond this many are skipped rather than queued
+EXPORT_PRERENDER_MAX_PENDING = int(os.getenv("EXPORT_PRERENDER_MAX_PENDING", "8"))
+
+MEDIA_TYPES = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+}
+
+CHUNK_SIZE = 64 * 1024
+# How often a download following a render checks the file for new bytes
+FOLLOW_INTERVAL = 0.02
+
+
+def _renderer_version() -> str:
+    digest = hashlib.sha256(DOCX_RENDERER.encode("utf-8"))
+    for module in (report_sections, exporters, docx_renderer, pdf_renderer, llm_service):
+        digest.update(Path(module.__file__).read_bytes())
+    return digest.hexdigest()[:8]
+
+
+RENDERER_VERSION = _renderer_version()
+
+
+def ticket_hash(ticket: dict) -> str:
+    canonical = json.dumps(ticket, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def etag(fmt: str, ticket: dict) -> str:
+    return f'"{fmt}-{RENDERER_VERSION}-{ticket_hash(ticket)[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, tag: str) -> bool:
+    """Whether an ``If-None-Match`` header value covers ``tag`` (weak comparison, as RFC 9110 asks)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == tag for candidate in if_none_match.split(","))
+
+
+async def _read_file(f) -> AsyncIterator[bytes]:
+    try:
+        while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+            yield chunk
+    finally:
+        f.close()
+
+
+async def _follow_file(f, render: asyncio.Task) -> AsyncIterator[bytes]:
+    """Chunks of a file while ``render`` is still writing it, until it is complete."""
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            if chunk:
+                yield chunk
+            elif render.done():
+                # Raises if the render failed, which aborts the download mid-stream
+                render.result()
+                while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+                    yield chunk
+                return
+            else:
+                await asyncio.wait({render}, timeout=FOLLOW_INTERVAL)
+    finally:
+        f.close()
+
+
+async def _primed(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Wait for the first chunk, so an early failure raises before the response starts."""
+    try:
+        first = await anext(chunks)
+    except StopAsyncIteration:
+        first = b""
+
+    async def resume():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return resume()
+
+
+def _log_failure(render: asyncio.Task) -> None:
+    if not render.cancelled() and render.exception() is not None:
+        print(f"Export render failed: {render.exception()!r}")
+
+
+class ExportCache:
+    def __init__(self, memory: MemoryCache | None, disk: FileCache | None):
+        self.memory = memory
+        self.disk = disk
+        # Renders in progress: cache key -> (task, file being written)
+        self._renders: dict[str, tuple[asyncio.Task, str]] = {}
+        self._pending: set[asyncio.Task] = set()
+        self._counters = {
+            "memory_hits": 0, "disk_hits": 0, "coalesced": 0, "renders": 0, "prerenders": 0, "prerenders_skipped": 0
+        }
+
+    def _count(self, fmt: str, outcome: str, counter: str) -> None:
+        self._counters[counter] += 1
+        metrics.EXPORT_CACHE.inc(format=fmt, outcome=outcome)
+
+    async def open(self, fmt: str, ticket: dict) -> tuple[bytes | AsyncIterator[bytes], int | None, str]:
+        """The document as bytes or as chunks, its size when known, and its ``ETag``.
+
+        A document that is not cached is streamed while it renders. Raises
+        ``ExportBusy`` or ``ExportTimeout`` if that fails before the first chunk.
+        """
+        tag = etag(fmt, ticket)
+        key = tag.strip('"')
+        if self.memory is not None:
+            data = await self.memory.get(key)
+            if data is not None:
+                self._count(fmt, "memory", "memory_hits")
+                return data, len(data), tag
+        if self.disk is not None:
+            cached = await self._open_cached(key)
+            if cached is not None:
+                self._count(fmt, "disk", "disk_hits")
+                size = os.fstat(cached.fileno()).st_size
+                if size > EXPORT_CACHE_MEMORY_ITEM_MAX_BYTES:
+                    return _read_file(cached), size, tag
+                with cached:
+                    data = await asyncio.to_thread(cached.read)
+                await self.memory.set(key, data)
+                return data, len(data), tag
+
+        render = self._renders.get(key)
+        if render is not None:
+            self._count(fmt, "coalesced", "coalesced")
+        else:
+            render = self._start(fmt, key, ticket)
+        task, path = render
+        # Opened before any await: the render cannot finish and move the file in between
+        f = open(path, "rb")
+        return await _primed(_follow_file(f, task)), None, tag
+
+    async def _open_cached(self, key: str):
+        path = await self.disk.locate(key)
+        if path is None:
+            return None
+        try:
+            return open(path, "rb")
+        except FileNotFoundError:  # evicted in between
+            return None
+
+    def _start(self, fmt: str, key: str, ticket: dict) -> tuple[asyncio.Task, str]:
+        self._count(fmt, "miss", "renders")
+        if self.disk is not None:
+            path = self.disk.tmp_path()
+        else:
+            fd, path = tempfile.mkstemp(suffix=".tmp")
+            os.close(fd)
+        task = asyncio.ensure_future(self._render(fmt, key, ticket, path))
+        task.add_done_callback(_log_failure)
+        self._renders[key] = (task, path)
+        return task, path
+
+    async def _render(self, fmt: str, key: str, ticket: dict, path: str) -> None:
+        try:
+            size = await get_pool().render_to(fmt, ticket, path)
+            if self.memory is not None and size <= EXPORT_CACHE_MEMORY_ITEM_MAX_BYTES:
+                await self.memory.set(key, await asyncio.to_thread(Path(path).read_bytes))
+            if self.disk is not None:
+                try:
+                    self.disk.adopt(key, path)
+                    path = None
+                except OSError as e:
+                    print(f"Export cache could not be written: {e}")
+        finally:
+            self._renders.pop(key, None)
+            if path is not None:
+                # Downloads still following the file keep their open handle
+                with contextlib.suppress(OSError):
+                    os.unlink(path)
+
+    async def ensure(self, fmt: str, ticket: dict) -> None:
+        """Render the document into the cache unless it is there already."""
+        key = etag(fmt, ticket).strip('"')
+        if self.memory is not None and await self.memory.get(key) is not None:
+            return
+        if self.disk is not None and await self.disk.locate(key) is not None:
+            return
+        task, _ = self._renders.get(key) or self._start(fmt, key, ticket)
+        await asyncio.shield(task)
+
+    def prerender(self, ticket: dict) -> None:
+        """Render every format in the background if ``EXPORT_PRERENDER`` is on."""
+        if not (EXPORT_PRERENDER and EXPORT_CACHE_ENABLED):
+            return
+        if len(self._pending) >= EXPORT_PRERENDER_MAX_PENDING:
+            self._counters["prerenders_skipped"] += 1
+            return
+        self._counters["prerenders"] += 1
+        task = asyncio.ensure_future(self._prerender(ticket))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _prerender(self, ticket: dict) -> None:
+        for fmt in MEDIA_TYPES:
+            # Leave the render pool's capacity to downloads someone is waiting for
+            if get_pool().saturated(0.5):
+                self._counters["prerenders_skipped"] += 1
+                return
+            try:
+                await self.ensure(fmt, ticket)
+            except Exception as e:
+                print(f"Pre-rendering {fmt} export failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "enabled": EXPORT_CACHE_ENABLED,
+            "prerender": EXPORT_PRERENDER,
+            "prerenders_pending": len(self._pending),
+            "renders_in_progress": len(self._renders),
+            "renderer_version": RENDERER_VERSION,
+            "memory": self.memory.stats() if self.memory is not None else None,
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+_cache: ExportCache | None = None
+
+
+def get_cache() -> ExportCache:
+    global _cache
+    if _cache is None:
+        if EXPORT_CACHE_ENABLED:
+            _cache = ExportCache(
+                MemoryCache(EXPORT_CACHE_MAX_BYTES),
+                FileCache(EXPORT_CACHE_DIR, EXPORT_CACHE_DISK_MAX_BYTES) if EXPORT_CACHE_DIR else None,
+            )
+        else:
+            # Downloads are still rendered into a file and streamed from it, just not kept
+            _cache = ExportCache(None, None)
+    return _cache
@@ -0,0 +1,182 @@
+"""Execution engine for report rendering.
+
+``create_word`` and ``create_pdf`` are CPU-bound pure Python. Run on the
+API's threadpool, a large PDF holds the GIL and slows every other request of
+the worker. With ``EXPORT_ENGINE=process`` (the default) renders go to a
+bounded pool of separate processes instead, started at boot with the Word
+template and PDF styles preloaded, so the event loop only waits on a pipe.
+Documents are written to a file named by the caller rather than sent back,
+so the API can stream the file while it grows and never holds it in memory.
+
+Renders beyond ``EXPORT_QUEUE_MAX`` in flight (running or queued) are refused
+with ``ExportBusy`` rather than piling up, and a render is abandoned after
+``EXPORT_TIMEOUT`` seconds with ``ExportTimeout``. In the pool the timeout
+also interrupts the render itself, so the process is free for the next one.
+``EXPORT_ENGINE=thread`` keeps the previous in-thread rendering, with the
+same limits (a timed-out thread finishes its render in the background).
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import docx_renderer
+import metrics
+import pdf_renderer
+from exporters import EXPORTERS
+from llm_service import DOCX_RENDERER, write_pdf_combined, write_word_combined
+
+EXPORT_ENGINE = os.getenv("EXPORT_ENGINE", "process").lower()
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXPORT_QUEUE_MAX = int(os.getenv("EXPORT_QUEUE_MAX", str(EXPORT_WORKERS * 8)))
+EXPORT_TIMEOUT = float(os.getenv("EXPORT_TIMEOUT", "60"))
+
+# Besides the formats of ``exporters.EXPORTERS``: a list of tickets in one document (``/download-batch``)
+COMBINED_WRITERS = {"docx_combined": write_word_combined, "pdf_combined": write_pdf_combined}
+
+
+class ExportBusy(Exception):
+    """Too many renders are already running or queued."""
+
+
+class ExportTimeout(Exception):
+    """A render took longer than ``EXPORT_TIMEOUT``."""
+
+
+def _write(fmt: str, ticket: dict, path: str) -> tuple[int, float]:
+    """Render into ``path``; returns the size and render time for the API process's metrics."""
+    started = time.perf_counter()
+    with open(path, "wb") as out:
+        write = COMBINED_WRITERS.get(fmt) or EXPORTERS[fmt].write
+        write(ticket, out)
+        size = out.tell()
+    return size, time.perf_counter() - started
+
+
+def _on_alarm(signum, frame):
+    raise TimeoutError("render timed out")
+
+
+def _warm() -> None:
+    """Pool process initializer: load what the first render would otherwise pay for."""
+    if DOCX_RENDERER == "fast":
+        docx_renderer.preload()
+    pdf_renderer.styles()
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, _on_alarm)
+
+
+def _write_in_worker(fmt: str, ticket: dict, path: str, timeout: float) -> tuple[int, float]:
+    alarm = hasattr(signal, "setitimer") and timeout > 0
+    if alarm:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return _write(fmt, ticket, path)
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class ExportPool:
+    def __init__(self, engine: str, workers: int, queue_max: int, timeout: float):
+        self.engine = engine
+        self.workers = workers
+        self.queue_max = queue_max
+        self.timeout = timeout
+        self._executor: ProcessPoolExecutor | None = None
+        self._in_flight = 0
+        self._counters = {"renders": 0, "rejected": 0, "timeouts": 0, "failures": 0, "restarts": 0}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Not fork: the API process has threads and an event loop a child should not inherit
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_warm
+            )
+        return self._executor
+
+    async def start(self) -> None:
+        """Start and warm every pool process before the first download."""
+        if self.engine != "process":
+            return
+        loop = asyncio.get_running_loop()
+        pool = self._pool()
+        pids = await asyncio.gather(*[loop.run_in_executor(pool, _ping) for _ in range(self.workers)])
+        print(f"Export pool: {len(set(pids))} render processes ready")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def saturated(self, share: float = 1.0) -> bool:
+        """Whether ``share`` of ``EXPORT_QUEUE_MAX`` is in flight."""
+        return self._in_flight >= self.queue_max * share
+
+    async def render_to(self, fmt: str, ticket: dict, path: str) -> int:
+        """Render the document into ``path`` and return its size; raises ``ExportBusy`` or ``ExportTimeout``."""
+        if self.saturated():
+            self._counters["rejected"] += 1
+            raise ExportBusy(f"{self._in_flight} exports in progress")
+        self._in_flight += 1
+        self._counters["renders"] += 1
+        try:
+            if self.engine == "process":
+                size, seconds = await self._write_in_pool(fmt, ticket, path)
+            else:
+                size, seconds = await asyncio.wait_for(
+                    asyncio.to_thread(_write, fmt, ticket, path), self.timeout or None
+                )
+            metrics.EXPORT_SECONDS.observe(seconds, format=fmt)
+            metrics.EXPORT_BYTES.inc(size, format=fmt)
+            return size
+        except (asyncio.TimeoutError, TimeoutError):
+            self._counters["timeouts"] += 1
+            raise ExportTimeout(f"{fmt} export took longer than {self.timeout:g}s")
+        except (ExportBusy, ExportTimeout):
+            raise
+        except Exception:
+            self._counters["failures"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
+
+    async def _write_in_pool(self, fmt: str, ticket: dict, path: str) -> tuple[int, float]:
+        loop = asyncio.get_running_loop()
+        args = (_write_in_worker, fmt, ticket, path, self.timeout)
+        try:
+            future = loop.run_in_executor(self._pool(), *args)
+        except BrokenProcessPool:
+            # A render process died (e.g. killed for memory); start over with fresh ones
+            self._counters["restarts"] += 1
+            self.shutdown()
+            future = loop.run_in_executor(self._pool(), *args)
+        # The worker interrupts itself at the timeout; this only guards against a wedged process
+        return await asyncio.wait_for(future, self.timeout + 5 if self.timeout else None)
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "engine": self.engine,
+            "workers": self.workers if self.engine == "process" else None,
+            "in_flight": self._in_flight,
+            "queue_max": self.queue_max,
+            "timeout": self.timeout,
+        }
+
+
+_pool: ExportPool | None = None
+
+
+def get_pool() -> ExportPool:
+    global _pool
+    if _pool is None:
+        _pool = ExportPool(EXPORT_ENGINE, EXPORT_WORKERS, EXPORT_QUEUE_MAX, EXPORT_TIMEOUT)
+    return _pool
@@ -0,0 +1,332 @@
+"""Registry of report export formats.
+
+Every format is an ``Exporter`` registered under its name: Word and PDF
+(``write_word`` and ``pdf_renderer.write``), and the lightweight text formats
+defined here: Markdown, HTML, a Jira bulk-create payload, and CSV of the test
+cases or user stories. Another format is one ``register`` call away; the
+render processes of ``export_pool`` look formats up here as well, so register
+it in a module that ``export_pool`` imports.
+
+Text exporters are generators over ``report_sections.walk``: each block is
+formatted and handed on as soon as it is produced, with no document model in
+between. ``stream`` batches their output into ``CHUNK_SIZE`` pieces of UTF-8,
+so a download costs one write per chunk rather than per line. They are fast
+enough to run in the API process itself; Word and PDF go through the render
+pool and the export cache.
+"""
+import csv
+import functools
+import html
+import io
+import json
+import os
+import re
+from dataclasses import dataclass
+from json.encoder import encode_basestring
+from typing import BinaryIO, Callable, Iterator
+
+import pdf_renderer
+import report_sections
+from llm_service import write_word
+from report_sections import Bullet, Field, Heading, Label, Table, Text
+
+EXPORT_JIRA_PROJECT_KEY = os.getenv("EXPORT_JIRA_PROJECT_KEY", "REQ")
+EXPORT_JIRA_ISSUE_TYPE = os.getenv("EXPORT_JIRA_ISSUE_TYPE", "Story")
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass(frozen=True)
+class Exporter:
+    name: str
+    media_type: str
+    extension: str
+    # Download name of a single report
+    filename: str
+    # Writes the document to a binary file object
+    write: Callable[[dict, BinaryIO], None]
+    # Text formats only: the document as it is produced
+    text: Callable[[dict], Iterator[str]] | None = None
+
+
+EXPORTERS: dict[str, Exporter] = {}
+
+
+def _write_text(text: Callable[[dict], Iterator[str]], ticket: dict, out: BinaryIO) -> None:
+    for chunk in _encoded(text(ticket)):
+        out.write(chunk)
+
+
+def register(
+    name: str,
+    media_type: str,
+    extension: str,
+    filename: str | None = None,
+    write: Callable[[dict, BinaryIO], None] | None = None,
+    text: Callable[[dict], Iterator[str]] | None = None,
+) -> Exporter:
+    """Add a format: a binary one with ``write(ticket, out)``, or a text one with ``text(ticket)``."""
+    if write is None and text is None:
+        raise ValueError("An exporter needs write or text")
+    exporter = Exporter(
+        name,
+        media_type,
+        extension,
+        filename or f"jira_requirement.{extension}",
+        write or functools.partial(_write_text, text),
+        text,
+    )
+    EXPORTERS[name] = exporter
+    return exporter
+
+
+def get_exporter(name: str) -> Exporter | None:
+    return EXPORTERS.get(name)
+
+
+def _encoded(pieces: Iterator[str]) -> Iterator[bytes]:
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def stream(name: str, ticket: dict) -> Iterator[bytes]:
+    """A text format's document in chunks of about ``CHUNK_SIZE`` bytes."""
+    return _encoded(EXPORTERS[name].text(ticket))
+
+
+# Markdown
+
+_MARKDOWN_ESCAPES = {char: "\\" + char for char in "\\`*_[]<|"}
+_MARKDOWN_LINE = str.maketrans({**_MARKDOWN_ESCAPES, "\n": "  \n"})
+_MARKDOWN_CELL = str.maketrans({**_MARKDOWN_ESCAPES, "\n": " "})
+
+
+def _md(value: str) -> str:
+    value = value.translate(_MARKDOWN_LINE)
+    # Only special at the start of a line (a heading)
+    return "\\" + value if value.startswith("#") else value
+
+
+def _md_cell(value: str) -> str:
+    return value.translate(_MARKDOWN_CELL)
+
+
+def markdown(ticket: dict) -> Iterator[str]:
+    # "line" after a paragraph line, "list" after a list item: either needs a blank line before
+    # something else. Headings and tables end with one.
+    previous = None
+    for block in report_sections.walk(ticket):
+        if isinstance(block, Heading):
+            if previous is not None:
+                yield "\n"
+            yield f"{'#' * block.level} {_md(block.text)}\n\n"
+            previous = None
+        elif isinstance(block, Table):
+            if previous is not None:
+                yield "\n"
+            yield "| " + " | ".join(_md_cell(column) for column in block.columns) + " |\n"
+            yield "|" + "---|" * len(block.columns) + "\n"
+            for row in block.rows:
+                yield "| " + " | ".join(_md_cell(cell) for cell in row) + " |\n"
+            yield "\n"
+            previous = None
+        elif isinstance(block, Bullet):
+            if previous == "line":
+                yield "\n"
+            marker = f"{block.number}." if block.number is not None else "-"
+            yield f"{'  ' * (block.depth - 1)}{marker} {_md(block.text)}\n"
+            previous = "list"
+        else:
+            if previous == "list":
+                yield "\n"
+            if isinstance(block, Field):
+                yield f"**{_md(block.label)}{':' if block.colon else ''}** {_md(block.value)}  \n"
+            elif isinstance(block, Label):
+                yield f"**{_md(block.text)}:**  \n"
+            else:
+                yield f"{_md(block.text)}  \n"
+            previous = "line"
+
+
+# HTML
+
+_HTML_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: Helvetica, Arial, sans-serif; max-width: 50rem; margin: 2rem auto; line-height: 1.4; }}
+p {{ margin: 0.2rem 0; }}
+table {{ border-collapse: collapse; margin: 0.5rem 0; font-size: 0.85rem; }}
+th, td {{ border: 1px solid #999; padding: 0.2rem 0.4rem; text-align: left; vertical-align: top; }}
+th {{ background: #e8edf3; }}
+</style>
+</head>
+<body>
+"""
+
+
+def _html(value: str) -> str:
+    return html.escape(value).replace("\n", "<br>")
+
+
+def html_document(ticket: dict) -> Iterator[str]:
+    yield _HTML_HEAD.format(title=html.escape(report_sections.report_title(ticket)))
+    # Tags of the lists open at each depth
+    lists: list[str] = []
+
+    def close_lists(depth: int = 0) -> str:
+        closing = []
+        while len(lists) > depth:
+            closing.append(f"</li></{lists.pop()}>")
+        return "".join(closing)
+
+    for block in report_sections.walk(ticket):
+        if isinstance(block, Bullet):
+            tag = "ol" if block.number is not None else "ul"
+            parts = [close_lists(block.depth)]
+            if len(lists) == block.depth:
+                parts.append("</li>" if lists[-1] == tag else close_lists(block.depth - 1))
+            while len(lists) < block.depth:
+                parts.append(f"<{tag}>")
+                lists.append(tag)
+            yield "".join(parts) + f"<li>{_html(block.text)}\n"
+            continue
+        yield close_lists()
+        if isinstance(block, Heading):
+            yield f"<h{block.level}>{_html(block.text)}</h{block.level}>\n"
+        elif isinstance(block, Field):
+            yield f"<p><b>{_html(block.label)}{':' if block.colon else ''}</b> {_html(block.value)}</p>\n"
+        elif isinstance(block, Label):
+            yield f"<p><b>{_html(block.text)}:</b></p>\n"
+        elif isinstance(block, Text):
+            yield f"<p>{_html(block.text)}</p>\n"
+        elif isinstance(block, Table):
+            yield "<table>\n<thead><tr>" + "".join(f"<th>{_html(column)}</th>" for column in block.columns)
+            yield "</tr></thead>\n<tbody>\n"
+            for row in block.rows:
+                yield "<tr>" + "".join(f"<td>{_html(cell)}</td>" for cell in row) + "</tr>\n"
+            yield "</tbody>\n</table>\n"
+    yield close_lists() + "</body>\n</html>\n"
+
+
+# Jira
+
+_JIRA_ESCAPES = str.maketrans({**{char: "\\" + char for char in "{}[]|*_"}, "\n": " \\\\ "})
+_JIRA_PRIORITIES = {
+    "critical": "Highest", "highest": "Highest", "high": "High", "medium": "Medium", "low": "Low", "lowest": "Lowest",
+}
+
+
+def _wiki(value: str) -> str:
+    return value.translate(_JIRA_ESCAPES)
+
+
+def jira_wiki(blocks: Iterator[report_sections.Block]) -> Iterator[str]:
+    """Lines of Jira wiki markup, the format of an issue description in Jira's REST API v2."""
+    for block in blocks:
+        if isinstance(block, Heading):
+            yield f"h{block.level}. {_wiki(block.text)}"
+        elif isinstance(block, Field):
+            yield f"*{_wiki(block.label)}{':' if block.colon else ''}* {_wiki(block.value)}"
+        elif isinstance(block, Label):
+            yield f"*{_wiki(block.text)}:*"
+        elif isinstance(block, Text):
+            yield _wiki(block.text)
+        elif isinstance(block, Bullet):
+            yield f"{('#' if block.number is not None else '*') * block.depth} {_wiki(block.text)}"
+        elif isinstance(block, Table):
+            yield "||" + "||".join(_wiki(column) for column in block.columns) + "||"
+            for row in block.rows:
+                yield "|" + "|".join(_wiki(cell) or " " for cell in row) + "|"
+
+
+def _label(value) -> str:
+    # Jira labels cannot contain spaces
+    return re.sub(r"\s+", "-", str(value).strip())
+
+
+def _issue(summary: str, priority, labels: list[str], description: Iterator[str]) -> Iterator[str]:
+    """One entry of ``issueUpdates``, its description escaped line by line as it is produced."""
+    fields = {
+        "project": {"key": EXPORT_JIRA_PROJECT_KEY},
+        "issuetype": {"name": EXPORT_JIRA_ISSUE_TYPE},
+        # Jira's limit for a summary
+        "summary": summary[:255],
+        "labels": labels,
+    }
+    jira_priority = _JIRA_PRIORITIES.get(str(priority or "").strip().lower())
+    if jira_priority:
+        fields["priority"] = {"name": jira_priority}
+    yield '{"fields": ' + json.dumps(fields, ensure_ascii=False)[:-1] + ', "description": "'
+    for line in description:
+        # A JSON string's content, without its quotes
+        yield encode_basestring(line + "\n")[1:-1]
+    yield '"}}'
+
+
+def jira_issues(ticket: dict) -> Iterator[str]:
+    """Payload of Jira's bulk create (``POST /rest/api/2/issue/bulk``): the requirement, then one issue per story.
+
+    The requirement's description is the whole report; each story's is its own
+    section of it. All issues share the requirement ID as a label.
+    """
+    summary = ticket.get('requirement_summary')
+    requirement_id = summary.get('requirement_id') if isinstance(summary, dict) else None
+    labels = ["requirement-analysis"] + ([_label(requirement_id)] if requirement_id else [])
+    classification = ticket.get('classification')
+    priority = classification.get('priority') if isinstance(classification, dict) else None
+
+    yield '{"issueUpdates": [\n'
+    yield from _issue(report_sections.report_title(ticket), priority, labels, jira_wiki(report_sections.walk(ticket)))
+    for story in ticket.get('user_stories') or []:
+        if not isinstance(story, dict):
+            continue
+        yield ",\n"
+        blocks = report_sections.user_story(story)
+        # The story's heading is the issue summary
+        title = next(blocks).text
+        yield from _issue(title, story.get('priority'), labels, jira_wiki(blocks))
+    yield "\n]}\n"
+
+
+# CSV
+
+# Spreadsheets run cells starting with these as formulas
+_FORMULA_START = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _cell(value: str) -> str:
+    return "'" + value if value.startswith(_FORMULA_START) else value
+
+
+def _csv(name: str, ticket: dict) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in report_sections.TABLES[name]])
+    for row in report_sections.rows(ticket.get(name), name):
+        writer.writerow([_cell(cell) for cell in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+register("docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "docx", write=write_word)
+register("pdf", "application/pdf", "pdf", write=pdf_renderer.write)
+register("markdown", "text/markdown; charset=utf-8", "md", text=markdown)
+register("html", "text/html; charset=utf-8", "html", text=html_document)
+register("jira", "application/json", "json", "jira_issues.json", text=jira_issues)
+register("test_cases_csv", "text/csv; charset=utf-8", "csv", "test_cases.csv",
+         text=functools.partial(_csv, "test_cases"))
+register("user_stories_csv", "text/csv; charset=utf-8", "csv", "user_stories.csv",
+         text=functools.partial(_csv, "user_stories"))
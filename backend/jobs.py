@@ -0,0 +1,358 @@
+"""Background job queue for long-running analyses.
+
+``POST /jobs/refine`` stores the request in a local sqlite job store and
+returns at once; a pool of worker tasks in each uvicorn process claims queued
+jobs and runs them. A running job holds a lease that its worker keeps
+renewing, so a job whose worker died (crash, restart, deploy) is picked up
+again once the lease runs out. Results are read by polling the job or by
+subscribing to its server-sent events.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from analysis import refine_error_response, run_refine
+
+# Worker tasks per process (0 = only accept jobs, never run them here)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", str(Path(__file__).resolve().parent / ".cache" / "jobs.sqlite3"))
+# A running job whose lease is not renewed for this long is handed to another worker
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "90"))
+# Give up on a job that was started this many times without finishing
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# How often idle workers and event streams look for changes made by other processes
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Finished jobs are deleted after this many seconds
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 86400)))
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+async def _refine_job(payload: dict) -> dict:
+    return await run_refine(
+        payload["user_input"],
+        payload.get("image_base64"),
+        payload.get("mode"),
+        payload.get("quality_mode"),
+        payload.get("reuse", True),
+    )
+
+
+# Job kind -> coroutine producing the job's result from its payload
+HANDLERS: dict[str, Callable[[dict], Awaitable[dict]]] = {
+    "refine": _refine_job,
+}
+
+
+def _percentile(values: list[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class JobStore:
+    """Jobs, their leases and results in a sqlite file shared by all workers."""
+
+    # Purge expired jobs once every this many finished jobs
+    PURGE_EVERY = 200
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._finished = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode so claims can take an explicit write lock
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_until REAL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def enqueue(self, kind: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(payload), time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+        if row["status"] == "queued":
+            job["queue_position"] = self._queue_position(row["created_at"])
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        return job
+
+    def _queue_position(self, created_at: float) -> int:
+        with self._lock:
+            (ahead,) = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (created_at,)
+            ).fetchone()
+        return ahead + 1
+
+    def claim(self, worker: str) -> dict | None:
+        """Take the oldest queued job, or a running job whose lease expired."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self._conn.execute(
+                        """
+                        SELECT id, kind, payload, attempts FROM jobs
+                        WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)
+                        ORDER BY created_at LIMIT 1
+                        """,
+                        (now,),
+                    ).fetchone()
+                    if row is None or row["attempts"] < JOB_MAX_ATTEMPTS:
+                        break
+                    result = {"is_valid": False, "error": True, "reason": "The job was interrupted too many times."}
+                    self._conn.execute(
+                        """
+                        UPDATE jobs SET status = 'failed', result = ?, finished_at = ?, worker = NULL, lease_until = NULL
+                        WHERE id = ?
+                        """,
+                        (json.dumps(result), now, row["id"]),
+                    )
+                if row is not None:
+                    self._conn.execute(
+                        """
+                        UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1,
+                            started_at = COALESCE(started_at, ?)
+                        WHERE id = ?
+                        """,
+                        (worker, now + JOB_LEASE_SECONDS, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"id": row["id"], "kind": row["kind"], "payload": json.loads(row["payload"])}
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + JOB_LEASE_SECONDS, job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id: str, worker: str, status: str, result: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE jobs SET status = ?, result = ?, finished_at = ?, worker = NULL, lease_until = NULL
+                WHERE id = ? AND worker = ?
+                """,
+                (status, json.dumps(result), time.time(), job_id, worker),
+            )
+            self._finished += 1
+            if self._finished % self.PURGE_EVERY == 0:
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                    (time.time() - JOB_RETENTION_SECONDS,),
+                )
+
+    def release(self, job_id: str, worker: str) -> None:
+        """Put an interrupted job back in the queue without counting the attempt."""
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, attempts = attempts - 1
+                WHERE id = ? AND worker = ? AND status = 'running'
+                """,
+                (job_id, worker),
+            )
+
+    def stats(self, window: int = 500) -> dict:
+        """Queue depth plus wait and service times over the most recent finished jobs."""
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            (oldest,) = self._conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()
+            rows = self._conn.execute(
+                """
+                SELECT created_at, started_at, finished_at FROM jobs
+                WHERE finished_at IS NOT NULL AND started_at IS NOT NULL
+                ORDER BY finished_at DESC LIMIT ?
+                """,
+                (window,),
+            ).fetchall()
+        waits = [started - created for created, started, _ in rows]
+        services = [finished - started for _, started, finished in rows]
+
+        def summary(values: list[float]) -> dict:
+            return {
+                "mean_ms": round(sum(values) / len(values) * 1000, 1) if values else None,
+                "p50_ms": round(_percentile(values, 0.5) * 1000, 1) if values else None,
+                "p95_ms": round(_percentile(values, 0.95) * 1000, 1) if values else None,
+            }
+
+        span = rows[0][2] - rows[-1][2] if len(rows) > 1 else 0
+        return {
+            "queue_depth": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "succeeded": counts.get("succeeded", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_queued_age_ms": round((now - oldest) * 1000, 1) if oldest else None,
+            "wait_time": summary(waits),
+            "service_time": summary(services),
+            "throughput_per_minute": round(len(rows) / span * 60, 2) if span > 0 else None,
+            "sample_size": len(rows),
+        }
+
+
+class JobQueue:
+    """Worker pool of one process, claiming jobs from the shared ``JobStore``."""
+
+    def __init__(self, store: JobStore, workers: int):
+        self.store = store
+        self.workers = workers
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._tasks: list[asyncio.Task] = []
+        self._wake: asyncio.Event | None = None
+        self._changed: asyncio.Condition | None = None
+
+    async def start(self) -> None:
+        self._wake = asyncio.Event()
+        self._changed = asyncio.Condition()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, payload: dict) -> dict:
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        job_id = await asyncio.to_thread(self.store.enqueue, kind, payload)
+        if self._wake is not None:
+            self._wake.set()
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _notify(self) -> None:
+        if self._changed is not None:
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self.store.claim, self.worker_id)
+            except Exception as e:
+                print(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._notify()
+            await self._run(job)
+            await self._notify()
+
+    async def _run(self, job: dict) -> None:
+        heartbeat = asyncio.ensure_future(self._heartbeat(job["id"]))
+        try:
+            result: Any = await HANDLERS[job["kind"]](job["payload"])
+            status = "failed" if result.get("error") else "succeeded"
+        except asyncio.CancelledError:
+            # Shutting down: hand the job straight back instead of waiting for the lease to expire
+            self.store.release(job["id"], self.worker_id)
+            raise
+        except Exception as e:
+            print(f"JOB ERROR ({job['id']}):", str(e))
+            status, result = "failed", refine_error_response(e)
+        finally:
+            heartbeat.cancel()
+        await asyncio.to_thread(self.store.finish, job["id"], self.worker_id, status, result)
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                await asyncio.to_thread(self.store.renew, job_id, self.worker_id)
+            except Exception as e:
+                print(f"Job lease renewal failed for {job_id}: {e}")
+
+    async def events(self, job_id: str):
+        """Yield a snapshot of the job each time its status changes, ending at a final status."""
+        last = None
+        while True:
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is None:
+                return
+            state = (job["status"], job.get("queue_position"))
+            if state != last:
+                last = state
+                yield job
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            # Woken by local workers; the timeout catches changes made by other processes
+            if self._changed is None:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+            async with self._changed:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stats(self) -> dict:
+        return {**self.store.stats(), "workers": self.workers, "worker_id": self.worker_id}
+
+
+_queue: JobQueue | None = None
+
+
+def get_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(JobStore(JOB_DB_PATH), JOB_WORKERS)
+    return _queue
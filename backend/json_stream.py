@@ -0,0 +1,226 @@
+"""Single-pass, tolerant JSON parsing for LLM output.
+
+``TolerantJSONParser`` walks the completion text once, tracking string,
+brace and bracket state as it goes. It can be fed the whole text at once or
+chunk by chunk while a response streams in, and serves two purposes:
+
+- it reports every top-level key of the root object as soon as its value is
+  closed, so report sections can be shown while the rest is still generating;
+- once the text ends, ``result()`` builds the best-effort object directly from
+  the tracked state: surrounding prose is dropped, an unterminated string
+  value is closed, and a truncated tail is cut back to the last complete
+  value before the open containers are closed.
+
+The root is the first ``{``: reports are objects, and a preamble such as
+"Here is [the report]:" may contain brackets. Only text without any ``{`` is
+parsed from its first ``[``.
+
+The scanner is regex-tokenised, so whole strings and literals are matched in
+one step instead of walking the text a character at a time.
+"""
+import json
+import re
+from typing import Any
+
+# One match per key (with its colon), opening bracket, or value (with the
+# comma after it), so a typical report needs only a few hundred matches
+_STRING = r'"(?:[^"\\]|\\.)*"'
+_TOKEN = re.compile(
+    rf"""
+    \s*(?:
+      (?P<key>{_STRING})\s*:
+    | (?P<open>[{{\[])
+    | (?P<sep>,)
+    | (?:
+          (?P<value>{_STRING}|-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null)
+        | (?P<close>[}}\]])
+      )\s*(?P<comma>,)?\s*
+    )
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+_WHITESPACE = re.compile(r"\s*")
+
+_LITERAL_PREFIX = re.compile(r"-?[\d.eE+-]*|t(?:r(?:ue?)?)?|f(?:a(?:l(?:se?)?)?)?|n(?:u(?:ll?)?)?")
+
+# A dangling backslash or partial \u escape at the very end of a cut-off string
+_PARTIAL_ESCAPE = re.compile(r"\\(?:u[0-9a-fA-F]{0,3})?$")
+
+_CLOSER = {"{": "}", "[": "]"}
+
+
+class TolerantJSONParser:
+    def __init__(self, sections: bool = True):
+        """``sections=False`` skips decoding top-level sections when only ``result()`` is needed."""
+        self.text = ""
+        self._decode_sections = sections
+        self.finished = False
+        self._pos = 0
+        self._root_start = -1
+        # Where the search for the root's "{" continues
+        self._search = 0
+        # Closing characters for the open containers, innermost first
+        self._closers = ""
+        # Whether the next token in the innermost container is a value (vs. a key)
+        self._expect_value = True
+        # Last position the text can be cut at, and what closes it from there
+        self._cut = (-1, "")
+        self._key: str | None = None
+        self._section_start = -1
+        self._sections: list[tuple[str, Any]] = []
+
+    def feed(self, chunk: str) -> list[tuple[str, Any]]:
+        """Add a chunk of text; returns the (key, value) sections completed by it."""
+        self.text += chunk
+        self._scan(final=False)
+        return self._take()
+
+    def close(self) -> list[tuple[str, Any]]:
+        """Mark the end of the text and flush a trailing value with nothing after it."""
+        self._scan(final=True)
+        return self._take()
+
+    def result(self) -> tuple[Any, str]:
+        """Best-effort value for everything fed so far, plus the strategy that produced it.
+
+        Strategies: ``extracted`` (complete value, surrounding text dropped),
+        ``closed_string`` (unterminated string value closed), ``truncated``
+        (cut back to the last complete value) or ``failed``.
+        """
+        self.close()
+        if self._root_start < 0:
+            return None, "failed"
+
+        text = self.text
+        if self.finished:
+            candidates = [(text[self._root_start:self._pos], "extracted")]
+        else:
+            candidates = []
+            if text.startswith('"', self._pos) and self._expect_value:
+                body = _PARTIAL_ESCAPE.sub("", text[self._pos:])
+                candidates.append((text[self._root_start:self._pos] + body + '"' + self._closers, "closed_string"))
+            cut, closers = self._cut
+            if cut >= 0:
+                candidates.append((text[self._root_start:cut] + closers, "truncated"))
+
+        for candidate, strategy in candidates:
+            try:
+                return json.loads(candidate, strict=False), strategy
+            except json.JSONDecodeError:
+                continue
+        return None, "failed"
+
+    def _take(self) -> list[tuple[str, Any]]:
+        sections, self._sections = self._sections, []
+        return sections
+
+    def _scan(self, final: bool) -> None:
+        text = self.text
+        end = len(text)
+        pos = self._pos
+
+        if self.finished:
+            return
+        if self._root_start < 0:
+            start = text.find("{", self._search)
+            if start < 0 and final:
+                start = text.find("[", pos)
+            if start < 0:
+                self._search = end
+                return
+            pos = self._root_start = start
+
+        match_token = _TOKEN.match
+        while pos < end:
+            match = match_token(text, pos)
+            if match is None:
+                pos = _WHITESPACE.match(text, pos).end()
+                if pos >= end or self._is_partial(text, pos):
+                    # Wait for the rest of the token; at the end it stays as the unparsed tail
+                    break
+                pos += 1  # Skip a stray character
+                continue
+
+            token_end = match.end()
+            value = match.group("value")
+            # A value at the end of the buffer may still be growing or be a key
+            # whose colon has not arrived yet
+            if value is not None and token_end == end and not final:
+                break
+
+            key = match.group("key")
+            if key is not None:
+                if self._closers == "}":
+                    self._key = json.loads(key, strict=False)
+                self._expect_value = True
+                pos = token_end
+                continue
+
+            opener = match.group("open")
+            if opener is not None:
+                if self._closers == "}":
+                    self._section_start = match.start("open")
+                self._closers = _CLOSER[opener] + self._closers
+                self._expect_value = opener == "["
+                self._cut = (token_end, self._closers)
+                pos = token_end
+                continue
+
+            if match.group("sep") is not None:
+                self._expect_value = self._closers.startswith("]")
+                pos = token_end
+                continue
+
+            if value is not None and not self._expect_value:
+                # A string where a key belongs: a key cut off before its colon
+                if token_end == end:
+                    break
+                pos = token_end
+                continue
+
+            if match.group("close") is not None:
+                if not self._closers:
+                    pos = token_end
+                    continue
+                self._closers = self._closers[1:]
+                value_end = match.end("close")
+            else:
+                if self._closers == "}":
+                    self._section_start = match.start("value")
+                value_end = match.end("value")
+            pos = token_end
+
+            if not self._closers:
+                # The root value is complete; anything after it is ignored
+                self.finished = True
+                pos = value_end
+                break
+            self._cut = (value_end, self._closers)
+            self._expect_value = self._closers.startswith("]") and match.group("comma") is not None
+            if self._decode_sections and self._closers == "}" and self._key is not None:
+                self._emit_section(value_end)
+
+        self._pos = pos
+
+    @staticmethod
+    def _is_partial(text: str, pos: int) -> bool:
+        """Whether the unmatched text at ``pos`` could be the start of a token."""
+        if text[pos] == '"':
+            return True
+        return _LITERAL_PREFIX.fullmatch(text, pos) is not None
+
+    def _emit_section(self, end: int) -> None:
+        raw = self.text[self._section_start:end]
+        try:
+            self._sections.append((self._key, json.loads(raw, strict=False)))
+        except json.JSONDecodeError:
+            pass
+        self._key = None
+        self._section_start = -1
+
+
+def repair_json(text: str) -> tuple[Any, str]:
+    """Parse possibly truncated or wrapped JSON in a single pass; see ``TolerantJSONParser.result``."""
+    parser = TolerantJSONParser(sections=False)
+    parser.feed(text)
+    return parser.result()
@@ -0,0 +1,162 @@
+"""Content-addressed cache for chat-completions responses.
+
+The key is a SHA-256 over the prompt name and everything in the payload that
+affects the output (model, messages, temperature, max_tokens), so editing a
+prompt constant or changing a parameter naturally misses the old entries.
+
+Only temperature-0 calls are cached by default: a sampled answer stored for a
+day would hand every retry the same draft. Responses cut off at
+``max_tokens`` or whose content is not a JSON object are never stored, so
+asking again makes a fresh attempt.
+"""
+import hashlib
+import json
+import os
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from cache import RedisCache, SqliteCache, build_backend
+from json_stream import repair_json
+
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_SQLITE_PATH = os.getenv(
+    "LLM_CACHE_SQLITE_PATH", str(Path(__file__).resolve().parent / ".cache" / "llm_cache.sqlite3")
+)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Only cache temperature-0 calls (validation, quality scoring)
+LLM_CACHE_DETERMINISTIC_ONLY = os.getenv("LLM_CACHE_DETERMINISTIC_ONLY", "true").lower() in ("1", "true", "yes")
+
+# Request header that skips the cache for a single request
+BYPASS_HEADER = "X-LLM-Cache"
+
+_backend = build_backend(
+    LLM_CACHE_BACKEND,
+    max_bytes=LLM_CACHE_MAX_BYTES,
+    sqlite_path=LLM_CACHE_SQLITE_PATH,
+    redis_url=REDIS_URL,
+    prefix="llm:",
+)
+_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+_counters = {"hits": 0, "misses": 0, "stores": 0, "bypassed": 0, "uncacheable": 0, "rejected": 0, "errors": 0}
+
+
+def cache_key(prompt_name: str, payload: dict) -> str:
+    material = {
+        "prompt": prompt_name,
+        "model": payload.get("model"),
+        "messages": payload.get("messages"),
+        "temperature": payload.get("temperature"),
+        "max_tokens": payload.get("max_tokens"),
+    }
+    encoded = json.dumps(material, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip()
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    return value
+
+
+def flight_key(prompt_name: str, payload: dict) -> str:
+    """Like ``cache_key`` but insensitive to whitespace differences in the messages."""
+    return cache_key(prompt_name, {**payload, "messages": _normalize(payload.get("messages"))})
+
+
+def is_shared() -> bool:
+    """Whether every worker on this host sees the same cache entries."""
+    return isinstance(_backend, (SqliteCache, RedisCache))
+
+
+@contextmanager
+def bypass(enabled: bool = True):
+    """Skip the cache for every LLM call made inside this block."""
+    token = _bypass.set(enabled)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def is_bypassed() -> bool:
+    return _bypass.get()
+
+
+def is_bypass_requested(header_value: str | None) -> bool:
+    return (header_value or "").strip().lower() in ("bypass", "no-cache", "off")
+
+
+def cacheable(payload: dict) -> bool:
+    """Whether responses to ``payload`` are looked up and stored."""
+    if _backend is None or _bypass.get():
+        return False
+    return not LLM_CACHE_DETERMINISTIC_ONLY or payload.get("temperature") == 0
+
+
+def _complete(data: dict) -> bool:
+    """Whether a response ran to its end and its content parses as a JSON object."""
+    try:
+        choice = data["choices"][0]
+        content = choice["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return False
+    if choice.get("finish_reason") == "length" or not isinstance(content, str):
+        return False
+    try:
+        return isinstance(json.loads(content), dict)
+    except ValueError:
+        # Fenced or wrapped in prose: accepted if the tolerant parser finds an object
+        return isinstance(repair_json(content)[0], dict)
+
+
+async def get(key: str, payload: dict) -> dict | None:
+    """Return the cached response for ``key`` or None on a miss."""
+    if not cacheable(payload):
+        # Requests that asked to skip the cache, apart from calls it never holds (e.g. non-zero temperature)
+        _counters["bypassed" if _bypass.get() else "uncacheable"] += 1
+        return None
+    try:
+        raw = await _backend.get(key)
+    except Exception as e:
+        print(f"LLM cache read failed: {e}")
+        _counters["errors"] += 1
+        return None
+    if raw is None:
+        _counters["misses"] += 1
+        return None
+    _counters["hits"] += 1
+    return json.loads(raw)
+
+
+async def put(key: str, payload: dict, data: dict) -> None:
+    if not cacheable(payload):
+        return
+    if not _complete(data):
+        _counters["rejected"] += 1
+        return
+    # Only what callers read back: the choices and the token usage
+    entry = {"choices": data.get("choices"), "usage": data.get("usage")}
+    try:
+        await _backend.set(key, json.dumps(entry).encode("utf-8"), LLM_CACHE_TTL)
+        _counters["stores"] += 1
+    except Exception as e:
+        print(f"LLM cache write failed: {e}")
+        _counters["errors"] += 1
+
+
+def stats() -> dict:
+    lookups = _counters["hits"] + _counters["misses"]
+    return {
+        **_counters,
+        "hit_ratio": round(_counters["hits"] / lookups, 3) if lookups else 0.0,
+        "ttl_seconds": LLM_CACHE_TTL,
+        "storage": _backend.stats() if _backend is not None else {"backend": "none"},
+    }
@@ -0,0 +1,158 @@
+"""Shared async HTTP client for the LLM gateway.
+
+Every chat-completions call goes through one pooled ``httpx.AsyncClient`` so
+connections are kept alive and reused instead of opening a fresh TCP/TLS
+connection per request. Pool sizes are configurable through the environment.
+Calls are throttled by the shared ``rate_limiter.limiter`` and retried with
+jittered backoff when the gateway is overloaded or unreachable.
+"""
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+
+import httpx
+
+import rate_limiter
+from rate_limiter import RETRY_STATUSES, backoff_delay, parse_retry_after
+
+# Total connections the pool may open, and how many idle ones it keeps alive
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+
+# Concurrent in-flight requests allowed against a single host (0 = no limit)
+LLM_MAX_PER_HOST = int(os.getenv("LLM_MAX_PER_HOST", "100"))
+
+# HTTP/2 multiplexing needs the optional 'h2' package
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() in ("1", "true", "yes")
+
+_client: httpx.AsyncClient | None = None
+_host_slots: dict[str, asyncio.Semaphore] = {}
+
+
+def _http2_enabled() -> bool:
+    if not LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("LLM_HTTP2 is set but the 'h2' package is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        )
+        _client = httpx.AsyncClient(limits=limits, http2=_http2_enabled())
+    return _client
+
+
+async def close_client() -> None:
+    """Close the pooled client and drop any per-host slots."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _host_slots.clear()
+
+
+@asynccontextmanager
+async def _host_slot(host: str):
+    if LLM_MAX_PER_HOST <= 0:
+        yield
+        return
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(LLM_MAX_PER_HOST)
+    async with slot:
+        yield
+
+
+async def _send(request: httpx.Request, payload: dict, stream: bool = False):
+    """Send ``request`` through the limiter, retrying overloads and connection failures.
+
+    Returns the final response with its still-unreleased permit.
+    """
+    limiter = rate_limiter.limiter
+    attempt = 0
+    while True:
+        permit = await limiter.acquire(payload)
+        retry_after = None
+        try:
+            response = await get_client().send(request, stream=stream)
+        except (httpx.ConnectError, httpx.RemoteProtocolError) as e:
+            limiter.release(permit)
+            if attempt >= rate_limiter.LLM_MAX_RETRIES:
+                raise
+            reason = type(e).__name__
+        except BaseException:
+            limiter.release(permit)
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt >= rate_limiter.LLM_MAX_RETRIES:
+                return response, permit
+            await response.aclose()
+            limiter.release(permit, status=response.status_code)
+            retry_after = parse_retry_after(response.headers)
+            if response.status_code == 429 and retry_after is not None:
+                limiter.pause(retry_after)
+            reason = f"HTTP {response.status_code}"
+
+        delay = backoff_delay(attempt, retry_after)
+        print(f"LLM gateway call failed ({reason}), retry {attempt + 1} in {delay:.1f}s")
+        limiter.record_retry()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def post_json(url: str, headers: dict, payload: dict, timeout: float) -> dict:
+    """POST a JSON payload and return the decoded JSON response.
+
+    Raises ``httpx.HTTPStatusError`` for non-2xx responses (after retries for
+    429/5xx) and ``httpx.TimeoutException`` when the upstream does not answer
+    in time.
+    """
+    request = get_client().build_request("POST", url, headers=headers, json=payload, timeout=timeout)
+    async with _host_slot(request.url.host):
+        response, permit = await _send(request, payload)
+    try:
+        response.raise_for_status()
+        data = response.json()
+    except BaseException:
+        rate_limiter.limiter.release(permit, status=response.status_code)
+        raise
+    rate_limiter.limiter.release(permit, status=response.status_code, usage=data.get("usage"))
+    return data
+
+
+async def stream_events(url: str, headers: dict, payload: dict, timeout: float):
+    """POST a streaming request and yield each decoded server-sent ``data:`` event."""
+    request = get_client().build_request("POST", url, headers=headers, json=payload, timeout=timeout)
+    async with _host_slot(request.url.host):
+        response, permit = await _send(request, payload, stream=True)
+        usage = None
+        try:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                if data:
+                    event = json.loads(data)
+                    usage = event.get("usage") or usage
+                    yield event
+        finally:
+            await response.aclose()
+            rate_limiter.limiter.release(permit, status=response.status_code, usage=usage)
@@ -1,16 +1,57 @@
+import asyncio
+import itertools
 import json
-from fastapi import FastAPI, HTTPException
+import time
+from contextlib import asynccontextmanager
+import httpx
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from llm_service import create_word, get_quality_score, refine_followup, refine_requirement
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from io import BytesIO
 import docx
 from docx.document import Document as DocxDocument
 from llm_service import create_word, create_pdf, refine_followup, refine_requirement
-from llm_service import extract_file_text
+from llm_service import DOCX_RENDERER, extract_file_text, singleflight_stats
+import docx_renderer
+import pdf_renderer
+from llm_client import close_client
+from analysis import is_rate_limited, refine_error_response, run_refine, score_after, stream_refine
+import rate_limiter
+import prompts
+import metrics
+from sharded_analysis import ANALYSIS_MODES
+from quality_scorer import QUALITY_MODES
+from jobs import get_queue
+from draft_store import DraftNotFound, VersionConflict, get_store as get_draft_store
+from batch import BatchBusy, BatchNotFound, create_batch, extract_requirements, get_store, run_batch
+import llm_cache
+from similarity_index import get_index as get_similarity_index
+from export_pool import COMBINED_WRITERS, EXPORT_ENGINE, ExportBusy, ExportTimeout, get_pool as get_export_pool
+from export_cache import EXPORT_CACHE_ENABLED, MEDIA_TYPES, etag as export_etag, etag_matches
+from export_cache import get_cache as get_export_cache
+from export_batch import EXPORT_BATCH_MAX_TICKETS, stream_zip as stream_export_zip
+from exporters import EXPORTERS, get_exporter, stream as stream_export
 
-app = FastAPI(title="Requirement Refiner API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prompts.print_token_report()
+    if EXPORT_ENGINE != "process" and DOCX_RENDERER == "fast":
+        docx_renderer.preload()
+    pdf_renderer.preload()
+    await get_export_pool().start()
+    await get_queue().start()
+    yield
+    # Hand running jobs back to the queue, then release pooled upstream connections
+    await get_queue().stop()
+    await close_client()
+    get_export_pool().shutdown()
+
+
+app = FastAPI(title="Requirement Refiner API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,136 +61,251 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    token = metrics.start_trace()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates keep the label set small ("/jobs/{job_id}", not every id)
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        elapsed = metrics.end_trace(token, f"{request.method} {route}", started)
+        metrics.HTTP_SECONDS.observe(elapsed, method=request.method, route=route, status=str(status))
+
+@app.middleware("http")
+async def llm_cache_bypass(request: Request, call_next):
+    # "X-LLM-Cache: bypass" forces fresh LLM calls for this request
+    with llm_cache.bypass(llm_cache.is_bypass_requested(request.headers.get(llm_cache.BYPASS_HEADER))):
+        return await call_next(request)
+
 class RequirementRequest(BaseModel):
     user_input: str
     image_base64: str | None = None
+    # "single" or "sharded"; defaults to ANALYSIS_MODE
+    mode: str | None = None
+    # "local", "hybrid" or "deep"; defaults to QUALITY_MODE
+    quality_mode: str | None = None
+    # Answer near-duplicates of earlier requirements from their drafts
+    reuse: bool = True
+
+def _check_mode(mode: str | None):
+    if mode is not None and mode.lower() not in ANALYSIS_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(ANALYSIS_MODES)}")
+
+def _check_quality_mode(quality_mode: str | None):
+    if quality_mode is not None and quality_mode.lower() not in QUALITY_MODES:
+        raise HTTPException(status_code=400, detail=f"quality_mode must be one of: {', '.join(QUALITY_MODES)}")
+
+class DraftRequest(BaseModel):
+    ticket: dict
+    original_requirement: str | None = None
+
+class BatchDownloadRequest(BaseModel):
+    # Tickets themselves or {"draft_id": ..., "version": ...} of stored drafts, in any mix
+    tickets: list[dict]
+    format: str = "docx"
+    # One document with a contents list instead of a zip with a document per ticket
+    combined: bool = False
+
+class BatchRequest(BaseModel):
+    # Either a list of requirements, a CSV/XLSX/TXT file, or the id of a batch to resume
+    requirements: list[str] | None = None
+    file_base64: str | None = None
+    file_name: str | None = None
+    batch_id: str | None = None
+    mode: str | None = None
+    # Re-send results finished before a resume
+    replay: bool = True
 
 class FollowupRequest(BaseModel):
-    original_requirement: str
-    current_draft: dict
     instruction: str
-
-def _create_quality_assessment_text(refined: dict) -> str:
-    """Create a comprehensive text summary of the refined requirement for quality scoring."""
-    parts = []
-    
-    # Add requirement summary
-    if 'requirement_summary' in refined:
-        summary = refined['requirement_summary']
-        parts.append(f"REQUIREMENT: {summary.get('original_requirement', '')}")
-        parts.append(f"ID: {summary.get('requirement_id', '')}")
-    
-    # Add classification
-    if 'classification' in refined:
-        cls = refined['classification']
-        parts.append(f"\nCLASSIFICATION:")
-        parts.append(f"Type: {cls.get('requirement_type', '')}")
-        parts.append(f"Priority: {cls.get('priority', '')}")
-        parts.append(f"Complexity: {cls.get('complexity', '')}")
-    
-    # Add acceptance criteria
-    if 'acceptance_criteria' in refined and refined['acceptance_criteria']:
-        parts.append(f"\nACCEPTANCE CRITERIA ({len(refined['acceptance_criteria'])} criteria):")
-        for idx, ac in enumerate(refined['acceptance_criteria'][:5], 1):  # Limit to first 5
-            if isinstance(ac, dict):
-                parts.append(f"AC{idx}: {ac.get('title', '')}")
-                parts.append(f"  Given {ac.get('given', '')}")
-                parts.append(f"  When {ac.get('when', '')}")
-                parts.append(f"  Then {ac.get('then', '')}")
-    
-    # Add user stories count
-    if 'user_stories' in refined and refined['user_stories']:
-        parts.append(f"\nUSER STORIES: {len(refined['user_stories'])} stories defined")
-        for story in refined['user_stories'][:3]:  # First 3 stories
-            parts.append(f"- {story.get('title', '')}")
-    
-    # Add test cases count
-    if 'test_cases' in refined and refined['test_cases']:
-        parts.append(f"\nTEST CASES: {len(refined['test_cases'])} test cases defined")
-    
-    # Add edge cases
-    if 'edge_cases' in refined and refined['edge_cases']:
-        parts.append(f"\nEDGE CASES: {len(refined['edge_cases'])} scenarios covered")
-    
-    # Add dependencies and risks
-    if 'dependencies_and_risks' in refined:
-        dr = refined['dependencies_and_risks']
-        if dr.get('dependencies'):
-            parts.append(f"\nDEPENDENCIES: {len(dr['dependencies'])} dependencies identified")
-        if dr.get('risks'):
-            parts.append(f"RISKS: {len(dr['risks'])} risks with mitigation plans")
-    
-    # Add effort estimation
-    if 'effort_estimation' in refined:
-        effort = refined['effort_estimation']
-        parts.append(f"\nESTIMATED EFFORT: {effort.get('total_estimated_effort', '')}")
-    
-    return "\n".join(parts)
+    # Either the full draft, or the id of a stored draft (and the version the edit is based on)
+    original_requirement: str | None = None
+    current_draft: dict | None = None
+    draft_id: str | None = None
+    base_version: int | None = None
+    # "patch" or "full"; defaults to FOLLOWUP_MODE
+    mode: str | None = None
+    quality_mode: str | None = None
 
 @app.post("/refine")
-def refine(req: RequirementRequest):
+async def refine(req: RequirementRequest):
+    _check_mode(req.mode)
+    _check_quality_mode(req.quality_mode)
     try:
-        refined = refine_requirement(req.user_input, req.image_base64)
+        return await run_refine(req.user_input, req.image_base64, req.mode, req.quality_mode, req.reuse)
+    except Exception as e:
+        print("REFINE ERROR:", str(e))
+        
+        # Return user-friendly error message
+        return refine_error_response(e)
+
+
+@app.post("/refine-stream")
+async def refine_stream(req: RequirementRequest):
+    """Same analysis as /refine, streamed as NDJSON events while the report is generated."""
+    _check_mode(req.mode)
+    _check_quality_mode(req.quality_mode)
+
+    async def events():
+        async for event in stream_refine(req.user_input, req.image_base64, req.mode, req.quality_mode, req.reuse):
+            yield json.dumps(event) + "\n"
 
-        # Check if validation failed
-        if not refined.get("is_valid", True):
-            return {
-                "is_valid": False,
-                "reason": refined.get("reason", "Input does not appear to be a valid requirement.")
-            }
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
-        # Get quality scores
+
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """Streams ``content`` and closes ``source`` however the response ends.
+
+    Starlette leaves the body of a response whose client went away to the
+    garbage collector; ``source`` may hold state, such as a batch marked as
+    running, that has to be released right away.
+    """
+
+    def __init__(self, content, source, **kwargs):
+        super().__init__(content, **kwargs)
+        self.source = source
+
+    async def __call__(self, scope, receive, send):
         try:
-            before_score = get_quality_score(req.user_input)
-        except Exception as e:
-            print(f"Quality before score failed: {e}")
-            before_score = {"score": 0, "reason": "Score calculation failed"}
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.source.aclose()
+
+
+@app.post("/refine-batch")
+async def refine_batch(req: BatchRequest):
+    """Refine many requirements, streaming NDJSON results in completion order.
 
-        # Create a comprehensive text summary for quality scoring
+    The first line carries the batch id; post it back as ``batch_id`` to
+    resume an interrupted batch.
+    """
+    _check_mode(req.mode)
+    batch_id = req.batch_id
+    if batch_id is None:
         try:
-            quality_text = _create_quality_assessment_text(refined)
-            after_score = get_quality_score(quality_text)
-        except Exception as e:
-            print(f"Quality after score failed: {e}")
-            after_score = {"score": 0, "reason": "Score calculation failed"}
+            requirements = list(req.requirements or [])
+            if req.file_base64 and req.file_name:
+                requirements += await asyncio.to_thread(extract_requirements, req.file_base64, req.file_name)
+            batch_id = create_batch(requirements, req.mode)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        return {
-            "is_valid": True,
-            "ticket": refined,
-            "quality_before": before_score,
-            "quality_after": after_score,
-        }
+    events = run_batch(batch_id, replay=req.replay)
+    try:
+        first = await events.__anext__()
+    except BatchNotFound:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    except BatchBusy:
+        raise HTTPException(status_code=409, detail="Batch is already being processed")
+
+    async def stream():
+        yield json.dumps(first) + "\n"
+        async for event in events:
+            yield json.dumps(event) + "\n"
+
+    return _ClosingStreamingResponse(stream(), events, media_type="application/x-ndjson")
+
+
+@app.get("/refine-batch/{batch_id}")
+def refine_batch_status(batch_id: str, include_results: bool = False):
+    store = get_store()
+    info = store.get(batch_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if include_results:
+        info["items"] = store.items(batch_id)
+    return info
 
-    except Exception as e:
-        error_msg = str(e)
-        print("REFINE ERROR:", error_msg)
-        
-        # Return user-friendly error message
-        error_response = {
-            "is_valid": False,
-            "error": True,
-            "reason": "Unable to process your requirement"
-        }
-        
-        # Provide specific guidance based on error type
-        if "timeout" in error_msg.lower():
-            error_response["reason"] = "The AI service took too long to respond. Please try again in a moment."
-        elif "400" in error_msg:
-            error_response["reason"] = "There was an issue processing your request. Please check your input and try again."
-        elif "401" in error_msg or "403" in error_msg:
-            error_response["reason"] = "Authentication issue. Please contact support."
-        elif "image" in error_msg.lower():
-            error_response["reason"] = "The image could not be processed. Please try with a different image or remove it."
-        else:
-            error_response["reason"] = "An unexpected error occurred. Please try again or contact support if the problem persists."
-        
-        return error_response
+
+
+@app.post("/jobs/refine", status_code=202)
+async def submit_refine_job(req: RequirementRequest):
+    """Queue a /refine analysis and return its job id immediately."""
+    _check_mode(req.mode)
+    _check_quality_mode(req.quality_mode)
+    job = await get_queue().submit("refine", req.model_dump())
+    return {
+        **job,
+        "status_url": f"/jobs/{job['job_id']}",
+        "events_url": f"/jobs/{job['job_id']}/events",
+    }
+
+
+@app.get("/jobs/stats")
+def job_stats():
+    return get_queue().stats()
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = get_queue().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events with the job's status; the last event carries the result."""
+    queue = get_queue()
+    if queue.store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async for job in queue.events(job_id):
+            yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
     
 @app.get("/")
 def root():
     return {"message": "Requirement Refiner API is running"}
 
+@app.get("/cache/stats")
+def cache_stats():
+    return llm_cache.stats()
+
+_LIMITER_GAUGE = metrics.Gauge("refiner_llm_concurrency", "Adaptive limiter: concurrency limit, calls in flight and waiting.", ("state",))
+
+def _collect_limiter_metrics():
+    state = rate_limiter.limiter.stats()
+    _LIMITER_GAUGE.set(state["concurrency_limit"], state="limit")
+    _LIMITER_GAUGE.set(state["in_flight"], state="in_flight")
+    _LIMITER_GAUGE.set(state["waiting"], state="waiting")
+
+metrics.register_collector(_collect_limiter_metrics)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/exports/stats")
+def export_stats():
+    return {**get_export_cache().stats(), "engine": get_export_pool().stats()}
+
+@app.get("/similar/stats")
+def similar_stats():
+    return get_similarity_index().stats()
+
+@app.get("/prompts/stats")
+def prompt_stats():
+    return prompts.stats()
+
+@app.get("/ratelimit/stats")
+def ratelimit_stats():
+    return rate_limiter.limiter.stats()
+
+@app.get("/singleflight/stats")
+def singleflight_stats_api():
+    return singleflight_stats()
+
 # @app.post("/refine-followup")
 # def refine_followup_api(req: FollowupRequest):
 #     return refine_followup(
@@ -159,30 +315,54 @@ def root():
 #     )
 
 @app.post("/refine-followup")
-def refine_followup_api(req: FollowupRequest):
+async def refine_followup_api(req: FollowupRequest):
+    if req.mode is not None and req.mode.lower() not in ("patch", "full"):
+        raise HTTPException(status_code=400, detail="mode must be one of: patch, full")
+    _check_quality_mode(req.quality_mode)
+    original_requirement, current_draft, base_version = req.original_requirement, req.current_draft, None
+    if req.draft_id is not None:
+        draft = await _load_draft(req.draft_id, req.base_version)
+        if req.base_version is not None and draft["version"] != draft["latest_version"]:
+            raise HTTPException(status_code=409, detail=f"Draft has moved on to version {draft['latest_version']}")
+        current_draft, base_version = draft["ticket"], draft["version"]
+        original_requirement = original_requirement or draft["original_requirement"] or ""
+    elif current_draft is None or original_requirement is None:
+        raise HTTPException(status_code=400, detail="Send either draft_id or original_requirement and current_draft")
+
     try:
-        refined = refine_followup(
-            req.original_requirement,
-            req.current_draft,
-            req.instruction
+        refined = await refine_followup(
+            original_requirement,
+            current_draft,
+            req.instruction,
+            req.mode.lower() if req.mode else None
         )
         
         # Check if refinement failed
         if refined.get("error", False):
             return refined
 
+        version = {}
+        if req.draft_id is not None:
+            try:
+                version = {
+                    "draft_id": req.draft_id,
+                    "version": await get_draft_store().commit(req.draft_id, refined, base_version, req.instruction),
+                }
+            except VersionConflict as e:
+                raise HTTPException(status_code=409, detail=str(e))
+
+        get_export_cache().prerender(refined)
+
         # Get quality score using comprehensive text summary
-        try:
-            quality_text = _create_quality_assessment_text(refined)
-            after_score = get_quality_score(quality_text)
-        except Exception as e:
-            print(f"Quality after score failed: {e}")
-            after_score = {"score": 0, "reason": "Score calculation failed"}
+        after_score = await score_after(refined, req.quality_mode)
 
         return {
             "ticket": refined,
+            **version,
             "quality_after": after_score,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = str(e)
         print("REFINE_FOLLOWUP ERROR:", error_msg)
@@ -193,32 +373,146 @@ def refine_followup_api(req: FollowupRequest):
             "reason": "Unable to refine the requirement"
         }
         
-        if "timeout" in error_msg.lower():
+        if is_rate_limited(e):
+            error_response["reason"] = "The AI service is handling too many requests right now. Please wait a minute and try again."
+        elif isinstance(e, httpx.TimeoutException) or "timeout" in error_msg.lower():
             error_response["reason"] = "The refinement took too long. Please try again."
         else:
             error_response["reason"] = "There was an issue refining your requirement. Please try again or try a different refinement."
         
         return error_response
 
+async def _load_draft(draft_id: str, version: int | None = None) -> dict:
+    try:
+        return await get_draft_store().get(draft_id, version)
+    except DraftNotFound:
+        raise HTTPException(status_code=404, detail="Draft not found or expired")
+
+
+async def _resolve_ticket(body: dict) -> dict:
+    # Either the ticket itself or {"draft_id": ..., "version": ...} of a stored draft
+    if "draft_id" in body:
+        return (await _load_draft(body["draft_id"], body.get("version")))["ticket"]
+    return body
+
+
+@app.post("/drafts")
+async def create_draft(req: DraftRequest):
+    draft_id, version = await get_draft_store().create(req.ticket, req.original_requirement)
+    return {"draft_id": draft_id, "version": version}
+
+
+@app.get("/drafts/stats")
+def draft_stats():
+    return get_draft_store().stats()
+
+
+@app.get("/drafts/{draft_id}")
+async def get_draft(draft_id: str, version: int | None = None):
+    return await _load_draft(draft_id, version)
+
+
+@app.get("/drafts/{draft_id}/history")
+async def draft_history(draft_id: str):
+    try:
+        return {"draft_id": draft_id, "versions": await get_draft_store().history(draft_id)}
+    except DraftNotFound:
+        raise HTTPException(status_code=404, detail="Draft not found or expired")
+
+
+async def _download(
+    fmt: str, filename: str, ticket: dict | list[dict], request: Request, media_type: str | None = None
+) -> Response:
+    """Stream a report download, from the export cache or while it renders, honouring ``If-None-Match``."""
+    media_type = media_type or MEDIA_TYPES[fmt]
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if EXPORT_CACHE_ENABLED:
+        tag = export_etag(fmt, ticket)
+        headers.update({"ETag": tag, "Cache-Control": "private, no-cache"})
+        if etag_matches(request.headers.get("if-none-match"), tag):
+            metrics.EXPORT_CACHE.inc(format=fmt, outcome="not_modified")
+            return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "private, no-cache"})
+    try:
+        body, size, _ = await get_export_cache().open(fmt, ticket)
+    except ExportBusy:
+        raise HTTPException(
+            status_code=503, detail="Too many exports in progress, retry shortly", headers={"Retry-After": "2"}
+        )
+    except ExportTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    if isinstance(body, bytes):
+        return Response(body, media_type=media_type, headers=headers)
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
 @app.post("/download-word")
-def download_word(ticket: dict):
-    file_stream = create_word(ticket)
+async def download_word(body: dict, request: Request):
+    ticket = await _resolve_ticket(body)
+    return await _download("docx", "jira_requirement.docx", ticket, request)
+
 
-    return StreamingResponse(
-        file_stream,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": "attachment; filename=jira_requirement.docx"}
-    )
-    
 @app.post("/download-pdf")
-def download_pdf(ticket: dict):
-    file_stream = create_pdf(ticket)
+async def download_pdf(body: dict, request: Request):
+    ticket = await _resolve_ticket(body)
+    return await _download("pdf", "jira_requirement.pdf", ticket, request)
+
+
+@app.get("/exports/formats")
+async def export_formats():
+    return [
+        {"name": exporter.name, "media_type": exporter.media_type, "filename": exporter.filename}
+        for exporter in EXPORTERS.values()
+    ]
 
+
+@app.post("/export/{fmt}")
+async def export_report(fmt: str, body: dict, request: Request):
+    """The report in any registered format; text formats are streamed as they are produced, without the pool."""
+    exporter = get_exporter(fmt)
+    if exporter is None:
+        raise HTTPException(status_code=404, detail=f"Unknown export format, use one of: {', '.join(EXPORTERS)}")
+    ticket = await _resolve_ticket(body)
+    if exporter.text is None:
+        return await _download(fmt, exporter.filename, ticket, request, exporter.media_type)
+    tag = export_etag(fmt, ticket)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{exporter.filename}"',
+        "ETag": tag,
+        "Cache-Control": "private, no-cache",
+    }
+    if etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "private, no-cache"})
+    chunks = stream_export(fmt, ticket)
+    # The first chunk is produced before the response starts, so a failure is still a clean error
+    first = await run_in_threadpool(next, chunks, b"")
+    return StreamingResponse(itertools.chain([first], chunks), media_type=exporter.media_type, headers=headers)
+
+
+@app.post("/download-batch")
+async def download_batch(req: BatchDownloadRequest, request: Request):
+    """A zip of every ticket's report, streamed as they finish, or with ``combined`` one document of all of them."""
+    fmt = req.format.lower()
+    if fmt not in EXPORTERS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORTERS)}")
+    if req.combined and f"{fmt}_combined" not in COMBINED_WRITERS:
+        raise HTTPException(status_code=400, detail="combined is only available for docx and pdf")
+    if not req.tickets:
+        raise HTTPException(status_code=400, detail="No tickets to export")
+    if len(req.tickets) > EXPORT_BATCH_MAX_TICKETS:
+        raise HTTPException(
+            status_code=400, detail=f"A batch export may contain at most {EXPORT_BATCH_MAX_TICKETS} tickets"
+        )
+    tickets = [await _resolve_ticket(item) for item in req.tickets]
+    if req.combined:
+        return await _download(f"{fmt}_combined", f"jira_requirements.{fmt}", tickets, request, MEDIA_TYPES[fmt])
+    if get_export_pool().saturated():
+        raise HTTPException(
+            status_code=503, detail="Too many exports in progress, retry shortly", headers={"Retry-After": "2"}
+        )
     return StreamingResponse(
-        file_stream,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": 'attachment; filename="jira_requirement.pdf"'
-        },
+        stream_export_zip(fmt, tickets),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="jira_requirements.zip"'},
     )
-
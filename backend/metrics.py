@@ -0,0 +1,294 @@
+"""In-process metrics and tracing spans, exposed in Prometheus text format at /metrics.
+
+Stages of the analysis flow run inside ``span(stage)`` (or are decorated with
+``timed(stage)``); each span feeds a per-stage latency histogram and, while an
+HTTP request is being handled, that request's trace, so slow requests can log
+where their time went. LLM calls also count their tokens from the response
+``usage``, JSON parsing counts which repair strategy was needed, and exports
+record their render time and size.
+
+Recording is a dictionary update under a lock, cheap enough to stay on in
+production; ``METRICS_ENABLED=false`` turns it off entirely.
+"""
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Log the span breakdown of requests slower than this (0 = never)
+METRICS_SLOW_REQUEST_MS = float(os.getenv("METRICS_SLOW_REQUEST_MS", "0"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+RENDER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry: list["_Metric"] = []
+_collectors: list = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._samples(items))
+        return lines
+
+    def _samples(self, items) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket counts (made cumulative when rendered), sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self, items) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("refiner_stage_duration_seconds", "Duration of analysis stages.", ("stage",))
+STAGE_ERRORS = Counter("refiner_stage_errors_total", "Analysis stages that raised an exception.", ("stage",))
+LLM_CALLS = Counter(
+    "refiner_llm_calls_total",
+    "LLM calls by prompt and how they were answered (gateway, cache or coalesced).",
+    ("prompt", "source"),
+)
+LLM_SECONDS = Histogram("refiner_llm_request_duration_seconds", "Duration of gateway calls, retries included.", ("prompt",))
+LLM_TOKENS = Counter(
+    "refiner_llm_tokens_total",
+    "Tokens reported by the gateway (prompt, completion, and prompt tokens served from its cache).",
+    ("prompt", "kind"),
+)
+JSON_PARSE = Counter(
+    "refiner_json_parse_total",
+    "Parsed LLM responses by the strategy that produced the result.",
+    ("strategy",),
+)
+QUALITY_SCORES = Counter(
+    "refiner_quality_scores_total",
+    "Quality scores by the scorer that produced them (local rules or the LLM).",
+    ("scorer",),
+)
+VALIDATIONS = Counter(
+    "refiner_validations_total",
+    "Requirement validations by decision and who made it (local pre-validation gate or the LLM).",
+    ("decision", "source"),
+)
+EXPORT_SECONDS = Histogram(
+    "refiner_export_render_seconds", "Time to render a report document.", ("format",), RENDER_BUCKETS
+)
+EXPORT_BYTES = Counter("refiner_export_bytes_total", "Size of rendered report documents.", ("format",))
+EXPORT_CACHE = Counter(
+    "refiner_export_cache_total",
+    "Report downloads by source: memory, disk, miss (rendered), coalesced (joined a render), not_modified (304).",
+    ("format", "outcome"),
+)
+HTTP_SECONDS = Histogram(
+    "refiner_http_request_duration_seconds",
+    "Time until the response starts, by route template.",
+    ("method", "route", "status"),
+)
+
+
+def register_collector(collect) -> None:
+    """Call ``collect()`` before every scrape, e.g. to refresh gauges from another module's state."""
+    _collectors.append(collect)
+
+
+def render() -> str:
+    for collect in _collectors:
+        try:
+            collect()
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Spans recorded while handling the current request: (stage, start, seconds)
+_trace: ContextVar[list | None] = ContextVar("metrics_trace", default=None)
+
+
+@contextmanager
+def span(stage: str):
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((stage, started, elapsed))
+
+
+def timed(stage: str):
+    """Run the decorated function (sync, async or async generator) inside ``span(stage)``."""
+
+    def decorate(func):
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                gen = func(*args, **kwargs)
+                try:
+                    with span(stage):
+                        async for item in gen:
+                            yield item
+                finally:
+                    await gen.aclose()
+
+        elif inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(stage):
+                    return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def timed_export(fmt: str):
+    """Record render time and output size of a function returning a document file object."""
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            with span(f"export_{fmt}"):
+                stream = func(*args, **kwargs)
+            EXPORT_SECONDS.observe(time.perf_counter() - started, format=fmt)
+            stream.seek(0, os.SEEK_END)
+            EXPORT_BYTES.inc(stream.tell(), format=fmt)
+            stream.seek(0)
+            return stream
+
+        return wrapper
+
+    return decorate
+
+
+def record_tokens(prompt: str, usage: dict | None) -> None:
+    if not usage:
+        return
+    LLM_TOKENS.inc(usage.get("prompt_tokens") or 0, prompt=prompt, kind="prompt")
+    LLM_TOKENS.inc(usage.get("completion_tokens") or 0, prompt=prompt, kind="completion")
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    if cached:
+        LLM_TOKENS.inc(cached, prompt=prompt, kind="cached")
+
+
+def start_trace():
+    """Begin collecting spans for the current request; returns the token for ``end_trace``."""
+    return _trace.set([])
+
+
+def end_trace(token, label: str, started: float) -> float:
+    """Stop collecting spans; log them if the request took too long. Returns its duration."""
+    elapsed = time.perf_counter() - started
+    trace = _trace.get()
+    _trace.reset(token)
+    if METRICS_SLOW_REQUEST_MS and elapsed * 1000 >= METRICS_SLOW_REQUEST_MS and trace:
+        parts = ", ".join(
+            f"{stage} at {(start - started) * 1000:.0f}ms took {seconds * 1000:.0f}ms"
+            for stage, start, seconds in sorted(trace, key=lambda item: item[1])
+        )
+        print(f"Slow request {label} ({elapsed * 1000:.0f}ms): {parts}")
+    return elapsed
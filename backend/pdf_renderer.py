@@ -0,0 +1,168 @@
+"""PDF rendering of analysis reports with ReportLab.
+
+The content is the ``"pdf"`` layout of ``report_sections.walk``. Style
+sheets are built once per process. Related lines are batched into one
+flowable instead of one ``Paragraph`` per line: each group of lines the
+layout marks out (a field group, list, story or test case) becomes a single
+paragraph with ``<br/>`` breaks, and spacing comes from the styles rather
+than separate ``Spacer`` flowables. The test case overview table has
+plain-string cells, which skip the markup parser entirely. All ticket text
+is escaped, so ``&`` or ``<`` in model output no longer breaks the markup.
+
+The document is written to a spooled temporary file that moves to disk once
+it outgrows ``PDF_SPOOL_MAX_BYTES``, so large downloads are not held in
+memory while they are streamed.
+
+Most of the remaining time is ReportLab measuring words for line breaking.
+Without its optional C accelerator (``pip install rl_accel``) that runs in
+pure Python; ``preload`` reports which one is in use.
+"""
+import functools
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors, rl_accel
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+import report_sections
+
+PDF_SPOOL_MAX_BYTES = int(os.getenv("PDF_SPOOL_MAX_BYTES", str(1024 * 1024)))
+
+
+@functools.lru_cache(maxsize=1)
+def styles() -> dict:
+    sample = getSampleStyleSheet()
+    normal = ParagraphStyle("Block", parent=sample["Normal"], spaceAfter=8)
+    return {
+        "title": sample["Title"],
+        "heading": ParagraphStyle("Section", parent=sample["Heading2"]),
+        "block": normal,
+        "item": ParagraphStyle("Item", parent=normal, leftIndent=20),
+        "table": TableStyle([
+            ("FONT", (0, 0), (-1, -1), "Helvetica", 8),
+            ("FONT", (0, 0), (-1, 0), "Helvetica-Bold", 8),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E8EDF3")),
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ]),
+    }
+
+
+def accelerated() -> bool:
+    """Whether ReportLab found its C accelerator for string widths and number formatting."""
+    return "instanceStringWidthT1" in rl_accel._c_funcs
+
+
+def preload() -> None:
+    """Build the style sheets before the first download."""
+    styles()
+    if not accelerated():
+        print("PDF export: ReportLab C accelerator not installed, using pure Python (pip install rl_accel)")
+
+
+# Overview table columns: width on the page and characters kept of a cell
+_COLUMNS = {
+    "ID": (0.9 * inch, 14),
+    "Title": (3.3 * inch, 60),
+    "Type": (0.9 * inch, 14),
+    "Priority": (0.7 * inch, 10),
+    "Automated": (0.7 * inch, 10),
+}
+
+
+def _clip(text: str, width: int) -> str:
+    return text if len(text) <= width else text[: width - 1] + "…"
+
+
+def _table(block: report_sections.Table) -> Table:
+    widths = [_COLUMNS.get(column, (inch, 20)) for column in block.columns]
+    rows = [list(block.columns)]
+    rows += [[_clip(cell, clip) for cell, (_, clip) in zip(row, widths)] for row in block.rows]
+    table = Table(rows, colWidths=[width for width, _ in widths], repeatRows=1)
+    table.setStyle(styles()["table"])
+    return table
+
+
+def _line(block) -> str:
+    """One line of a paragraph in ReportLab's markup."""
+    if isinstance(block, report_sections.Heading):
+        return f"<b>{escape(block.text)}</b>"
+    if isinstance(block, report_sections.Field):
+        return f"<b>{escape(block.label)}{':' if block.colon else ''}</b> {escape(block.value)}"
+    if isinstance(block, report_sections.Label):
+        return f"<b>{escape(block.text)}:</b>"
+    if isinstance(block, report_sections.Bullet):
+        return block.marker + escape(block.text)
+    return escape(block.text)
+
+
+def build_story(ticket: dict, title: str = report_sections.TITLE, anchor: str | None = None) -> list:
+    """Flowables of the report; ``anchor`` names its title as a link target."""
+    story = []
+    # Lines of the group being laid out, which become one paragraph
+    lines: list[str] = []
+    style = "block"
+
+    def flush():
+        if lines:
+            story.append(Paragraph("<br/>".join(lines), styles()[style]))
+            lines.clear()
+
+    for block in report_sections.walk(ticket, title, "pdf"):
+        if isinstance(block, report_sections.Break):
+            flush()
+            style = "item" if block.indent else "block"
+        elif isinstance(block, report_sections.Heading) and block.level < 3:
+            flush()
+            style = "block"
+            if block.level == 1:
+                target = f'<a name="{anchor}"/>' if anchor else ""
+                story.append(Paragraph(target + escape(block.text), styles()["title"]))
+                story.append(Spacer(1, 0.2 * inch))
+            else:
+                story.append(Paragraph(escape(block.text), styles()["heading"]))
+        elif isinstance(block, report_sections.Table):
+            flush()
+            story.append(_table(block))
+            story.append(Spacer(1, 0.15 * inch))
+        elif line := _line(block):
+            lines.append(line)
+    flush()
+    return story
+
+
+def write(ticket: dict, out) -> None:
+    """Write the PDF to the binary file object ``out``.
+
+    ReportLab lays out every page before it writes anything (the file ends in
+    a table of byte offsets of all objects), so the output arrives in one go.
+    """
+    SimpleDocTemplate(out, pagesize=letter).build(build_story(ticket))
+
+
+def write_combined(tickets: list[dict], titles: list[str], out) -> None:
+    """Write one PDF of several reports, each on a new page after a contents list linking to them."""
+    contents = [
+        f'<link href="#report-{idx}" color="blue">{idx}. {escape(title)}</link>' for idx, title in enumerate(titles, 1)
+    ]
+    story = [
+        Paragraph("REQUIREMENT ANALYSIS REPORTS", styles()["title"]),
+        Paragraph("Contents", styles()["heading"]),
+        Paragraph("<br/>".join(contents), styles()["block"]),
+    ]
+    for idx, (ticket, title) in enumerate(zip(tickets, titles), 1):
+        story.append(PageBreak())
+        story.extend(build_story(ticket, f"{idx}. {title}", f"report-{idx}"))
+    SimpleDocTemplate(out, pagesize=letter).build(story)
+
+
+def render(ticket: dict):
+    """The PDF as a file object positioned at its start (in memory up to ``PDF_SPOOL_MAX_BYTES``)."""
+    out = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_BYTES)
+    write(ticket, out)
+    out.seek(0)
+    return out
@@ -0,0 +1,148 @@
+"""Minimal DAG executor for running independent async stages concurrently.
+
+Stages declare the stages they depend on; everything else starts immediately.
+A stage may carry a ``gate`` predicate: when it returns False for the stage's
+result, every other stage still running is cancelled and the run aborts.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+
+class PipelineAborted(Exception):
+    """Raised when a gate stage rejects its result."""
+
+    def __init__(self, stage: str, result: Any):
+        super().__init__(f"Pipeline aborted by stage '{stage}'")
+        self.stage = stage
+        self.result = result
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[..., Awaitable[Any]]
+    deps: tuple[str, ...] = ()
+    gate: Callable[[Any], bool] | None = None
+
+
+@dataclass
+class PipelineResult:
+    results: dict[str, Any]
+    # stage name -> (start, end) in seconds relative to the start of the run
+    timings: dict[str, tuple[float, float]]
+    deps: dict[str, tuple[str, ...]]
+    wall: float
+    critical_path: list[str] = field(init=False)
+
+    def __post_init__(self):
+        self.critical_path = _critical_path(self.timings, self.deps)
+
+    def report(self) -> dict:
+        """Per-stage and critical-path latency in milliseconds."""
+        stages = {
+            name: {
+                "start_ms": round(start * 1000, 1),
+                "duration_ms": round((end - start) * 1000, 1),
+            }
+            for name, (start, end) in self.timings.items()
+        }
+        critical_ms = sum(self.timings[name][1] - self.timings[name][0] for name in self.critical_path)
+        return {
+            "stages": stages,
+            "critical_path": self.critical_path,
+            "critical_path_ms": round(critical_ms * 1000, 1),
+            "wall_ms": round(self.wall * 1000, 1),
+        }
+
+
+def _critical_path(timings: dict[str, tuple[float, float]], deps: dict[str, tuple[str, ...]]) -> list[str]:
+    """Longest chain of dependent stages by measured duration."""
+    longest: dict[str, tuple[float, list[str]]] = {}
+
+    def visit(name: str) -> tuple[float, list[str]]:
+        if name not in longest:
+            start, end = timings[name]
+            best = (0.0, [])
+            for dep in deps.get(name, ()):
+                if dep in timings:
+                    candidate = visit(dep)
+                    if candidate[0] > best[0]:
+                        best = candidate
+            longest[name] = (best[0] + (end - start), best[1] + [name])
+        return longest[name]
+
+    paths = [visit(name) for name in timings]
+    return max(paths, key=lambda p: p[0])[1] if paths else []
+
+
+class Pipeline:
+    def __init__(self):
+        self._stages: dict[str, Stage] = {}
+
+    def add(
+        self,
+        name: str,
+        func: Callable[..., Awaitable[Any]],
+        deps: tuple[str, ...] = (),
+        gate: Callable[[Any], bool] | None = None,
+    ) -> "Pipeline":
+        """Register a stage. ``func`` receives dependency results as keyword arguments."""
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage '{name}'")
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self._stages[name] = Stage(name, func, tuple(deps), gate)
+        return self
+
+    async def run(self) -> PipelineResult:
+        started = time.perf_counter()
+        timings: dict[str, tuple[float, float]] = {}
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: Stage):
+            inputs = {dep: await tasks[dep] for dep in stage.deps}
+            stage_start = time.perf_counter() - started
+            result = await stage.func(**inputs)
+            timings[stage.name] = (stage_start, time.perf_counter() - started)
+            if stage.gate is not None and not stage.gate(result):
+                raise PipelineAborted(stage.name, result)
+            return result
+
+        # Stages are registered after their deps, so insertion order is a valid topological order
+        for stage in self._stages.values():
+            tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+
+        try:
+            pending = set(tasks.values())
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        continue
+                    if not isinstance(error, PipelineAborted):
+                        # A gate verdict still takes precedence over a failure elsewhere
+                        error = await self._pending_gate_verdict(tasks) or error
+                    raise error
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        return PipelineResult(
+            results={name: task.result() for name, task in tasks.items()},
+            timings=timings,
+            deps={name: stage.deps for name, stage in self._stages.items()},
+            wall=time.perf_counter() - started,
+        )
+
+    async def _pending_gate_verdict(self, tasks: dict[str, asyncio.Task]) -> PipelineAborted | None:
+        gates = [tasks[name] for name, stage in self._stages.items() if stage.gate is not None]
+        for outcome in await asyncio.gather(*gates, return_exceptions=True):
+            if isinstance(outcome, PipelineAborted):
+                return outcome
+        return None
@@ -0,0 +1,182 @@
+"""Local pre-validation gate in front of ``validate_requirement``'s LLM call.
+
+A small logistic model over keyword and regex features estimates how likely
+the input is a requirement. Confident scores are accepted or rejected
+immediately; only inputs in between go to the LLM. Empty input, gibberish
+and bare greetings are rejected outright.
+
+The feature weights below are hand-set; ``benchmarks/eval_prevalidation.py
+--train`` fits new ones from logged LLM decisions (``VALIDATION_LOG_PATH``)
+and ``PREVALIDATION_WEIGHTS`` loads them.
+"""
+import json
+import math
+import os
+import re
+import time
+from pathlib import Path
+
+PREVALIDATION_ENABLED = os.getenv("PREVALIDATION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Probability bounds outside which the local decision is final
+PREVALIDATION_ACCEPT = float(os.getenv("PREVALIDATION_ACCEPT", "0.9"))
+PREVALIDATION_REJECT = float(os.getenv("PREVALIDATION_REJECT", "0.1"))
+# Share of confident decisions still sent to the LLM, so the log keeps labels for them too
+PREVALIDATION_AUDIT_RATE = float(os.getenv("PREVALIDATION_AUDIT_RATE", "0"))
+PREVALIDATION_WEIGHTS = os.getenv("PREVALIDATION_WEIGHTS", "")
+# JSONL log of LLM validation decisions, used to evaluate and retrain the gate ("" = off)
+VALIDATION_LOG_PATH = os.getenv("VALIDATION_LOG_PATH", "")
+
+_FLAGS = re.IGNORECASE
+
+GREETING_ONLY = re.compile(
+    r"^\W*(hi|hello|hey|hiya|yo|thanks|thank you|thx|ok|okay|cool|bye|goodbye|good (morning|afternoon|evening|night)|"
+    r"how are you( doing)?|what'?s up|sup|test|testing)\W*$",
+    _FLAGS,
+)
+WORD = re.compile(r"[A-Za-z']+")
+
+# name -> (pattern, weight); each feature is 1 when the pattern matches the input
+PATTERN_FEATURES = {
+    "user_story": (r"\bas an? \w+.{0,60}\b(i want|i need|i would like)\b", 3.0),
+    "modal": (r"\b(should|must|shall|needs? to|has to|have to|want|would like|required?)\b", 1.6),
+    "action": (
+        r"\b(add|allow|enable|create|show|display|send|support|integrate|implement|fix|prevent|export|import|"
+        r"upload|download|notify|validate|search|filter|sync|approve|reset|update|delete|generate|migrate|log)\w*\b",
+        1.5,
+    ),
+    "component": (
+        r"\b(page|screen|api|endpoint|button|form|dashboard|table|database|db|service|report|email|app|portal|"
+        r"panel|module|field|menu|notification|server|hmi|ui|ux|login|password|account|user|admin|feature|system|"
+        r"backend|frontend|mobile|web|csv|pdf|sso|auth\w*)s?\b",
+        1.5,
+    ),
+    "bug": (r"\b(bug|error|crash\w*|fails?|failing|broken|doesn'?t work|not working|issue|exception|regression)\b", 1.4),
+    "measure": (r"\d+\s*(ms|s|sec\w*|min\w*|hours?|days?|%|mb|gb|kb|users|rows|requests)\b|\bwithin\b", 0.8),
+    "question_opening": (r"^\s*(what|who|why|how|when|where|is|are|do|does|did|can you|could you|tell me)\b", -1.2),
+    "greeting_opening": (r"^\W*(hi|hello|hey|thanks|thank you|good (morning|afternoon|evening))\b", -1.0),
+    "off_topic": (
+        r"\b(weather|joke|love|dinner|lunch|movie|birthday|football|holiday|vacation|recipe|song|poem|"
+        r"your name|meaning of life|girlfriend|boyfriend)\b",
+        -2.2,
+    ),
+    "first_person_chat": (r"\b(i'?m|i am|i feel|my day|lol|haha)\b", -0.6),
+}
+PATTERNS = {name: re.compile(pattern, _FLAGS) for name, (pattern, _) in PATTERN_FEATURES.items()}
+
+DEFAULT_WEIGHTS = {
+    "bias": -0.8,
+    **{name: weight for name, (_, weight) in PATTERN_FEATURES.items()},
+    "short": -1.0,
+    "long": 1.0,
+    "gibberish": -4.0,
+}
+
+
+def features(text: str) -> dict[str, float]:
+    words = WORD.findall(text)
+    feats = {name: 1.0 if pattern.search(text) else 0.0 for name, pattern in PATTERNS.items()}
+    feats["short"] = 1.0 if len(words) < 4 else 0.0
+    feats["long"] = 1.0 if len(words) >= 8 else 0.0
+    feats["gibberish"] = gibberish(text, words)
+    return feats
+
+
+def gibberish(text: str, words: list[str] | None = None) -> float:
+    """Share of the input that looks like keyboard mashing rather than words (0..1)."""
+    words = WORD.findall(text) if words is None else words
+    if not words:
+        return 1.0
+    letters = sum(c.isalpha() for c in text)
+    if letters / max(len(text.strip()), 1) < 0.5:
+        return 1.0
+    odd = 0
+    for word in words:
+        lower = word.lower()
+        vowels = sum(c in "aeiouy" for c in lower)
+        if len(lower) > 3 and (vowels == 0 or vowels / len(lower) < 0.15 or re.search(r"(.)\1\1", lower)
+                               or re.search(r"[^aeiouy\W]{5,}", lower)):
+            odd += 1
+    return odd / len(words)
+
+
+def load_weights(path: str) -> dict[str, float]:
+    if path and Path(path).is_file():
+        with open(path, encoding="utf-8") as f:
+            return {**DEFAULT_WEIGHTS, **json.load(f)}
+    return dict(DEFAULT_WEIGHTS)
+
+
+_weights = load_weights(PREVALIDATION_WEIGHTS)
+
+
+def probability(feats: dict[str, float], weights: dict[str, float] | None = None) -> float:
+    weights = weights or _weights
+    z = weights.get("bias", 0.0) + sum(weights.get(name, 0.0) * value for name, value in feats.items())
+    return 1 / (1 + math.exp(-max(min(z, 30), -30)))
+
+
+def prevalidate(text: str, weights: dict[str, float] | None = None) -> dict:
+    """``decision`` is ``accept``, ``reject`` or ``uncertain`` (ask the LLM)."""
+    stripped = (text or "").strip()
+    if len(WORD.findall(stripped)) == 0 or sum(c.isalpha() for c in stripped) < 3:
+        return {"decision": "reject", "probability": 0.0, "reason": "The input is empty or contains no words."}
+    if GREETING_ONLY.match(stripped):
+        return {"decision": "reject", "probability": 0.0, "reason": "The input is a greeting, not a requirement."}
+
+    feats = features(stripped)
+    p = probability(feats, weights)
+    if p >= PREVALIDATION_ACCEPT:
+        return {"decision": "accept", "probability": p, "reason": "The input describes a software requirement."}
+    if p <= PREVALIDATION_REJECT:
+        reason = (
+            "The input looks like random text rather than a requirement."
+            if feats["gibberish"] >= 0.5
+            else "The input does not describe a software requirement, feature, bug or specification."
+        )
+        return {"decision": "reject", "probability": p, "reason": reason}
+    return {"decision": "uncertain", "probability": p, "reason": ""}
+
+
+def decides_locally(gate: dict) -> bool:
+    """Whether ``validate_requirement`` can answer from this gate result without the LLM (audits aside)."""
+    return PREVALIDATION_ENABLED and gate["decision"] != "uncertain"
+
+
+def log_decision(text: str, result: dict, gate: dict) -> None:
+    """Append an LLM validation decision to ``VALIDATION_LOG_PATH`` as a training/evaluation label."""
+    if not VALIDATION_LOG_PATH:
+        return
+    record = {
+        "input": text,
+        "is_valid": bool(result.get("is_valid")),
+        "reason": result.get("reason", ""),
+        "gate": gate["decision"],
+        "probability": round(gate["probability"], 4),
+        "at": time.time(),
+    }
+    try:
+        directory = os.path.dirname(VALIDATION_LOG_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(VALIDATION_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"Validation decision could not be logged: {e}")
+
+
+def fit(samples: list[tuple[str, bool]], epochs: int = 300, rate: float = 0.5, l2: float = 0.01) -> dict[str, float]:
+    """Logistic regression over ``features`` by batch gradient descent, starting from the defaults."""
+    rows = [(features(text.strip()), 1.0 if label else 0.0) for text, label in samples]
+    weights = dict(DEFAULT_WEIGHTS)
+    names = [name for name in weights if name != "bias"]
+    for _ in range(epochs):
+        gradient = dict.fromkeys(weights, 0.0)
+        for feats, label in rows:
+            error = probability(feats, weights) - label
+            gradient["bias"] += error
+            for name in names:
+                gradient[name] += error * feats[name]
+        for name in weights:
+            penalty = l2 * weights[name] if name != "bias" else 0.0
+            weights[name] -= rate * (gradient[name] / len(rows) + penalty)
+    return {name: round(value, 4) for name, value in weights.items()}
@@ -0,0 +1,265 @@
+"""Rule-based quality scoring of requirements and analysis reports.
+
+Implements the four dimensions and the deductions of ``QUALITY_PROMPT``
+(clarity, testability, completeness, actionability; compound "and" criteria,
+subjective wording, missing preconditions, unmeasurable criteria) directly
+over the structured ticket, with precompiled patterns, in about a
+millisecond for a full report. ``score_text`` applies the same dimensions to a raw requirement.
+
+``QUALITY_MODE`` picks who scores: ``local`` (rules only), ``hybrid`` (rules,
+with the LLM scorer consulted only when the local score sits next to a tier
+boundary) or ``deep`` (always the LLM scorer).
+"""
+import os
+import re
+
+QUALITY_MODE = os.getenv("QUALITY_MODE", "hybrid").lower()
+QUALITY_MODES = ("local", "hybrid", "deep")
+# In hybrid mode, local scores this close to a tier boundary are re-scored by the LLM
+QUALITY_AMBIGUOUS_MARGIN = float(os.getenv("QUALITY_AMBIGUOUS_MARGIN", "3"))
+
+# Lower bounds of the QUALITY_PROMPT tiers above the lowest one
+TIER_BOUNDARIES = (41, 61, 71, 81, 91)
+
+# Looked up per word after one tokenizing pass rather than scanned for with large alternations
+SUBJECTIVE_WORDS = frozenset(
+    "fast faster quick quickly slow slowly nice nicely easy easily simple intuitive user-friendly friendly "
+    "good better best efficient efficiently seamless seamlessly smooth smoothly robust appropriate appropriately "
+    "adequate adequately reasonable reasonably acceptable acceptably modern clean beautiful sufficient "
+    "sufficiently optimal optimally properly correctly".split()
+)
+SUBJECTIVE_PHRASES = ("as expected", "state of the art", "state-of-the-art", "user friendly")
+VAGUE_WORDS = frozenset("etc tbd some various several many few and/or stuff thing things".split())
+VAGUE_PHRASES = ("and so on", "to be decided", "as needed", "if possible")
+WORD = re.compile(r"[a-z]+(?:[-/][a-z]+)*")
+COMPOUND = re.compile(r"\band\b", re.IGNORECASE)
+# A number (with or without unit) or an observable outcome makes a criterion verifiable
+MEASURABLE = re.compile(
+    r"\d|\b(is|are|gets?|been|be)\s+(shown|displayed|disabled|enabled|redirected|returned|saved|stored|sent|"
+    r"delivered|logged|rejected|revoked|updated|created|deleted|locked|unlocked|blocked|invalidated|hidden|visible)\b|"
+    r"\b(error|status|message|code)\s+['\"\d]|\b(returns?|responds? with|receives?)\b",
+    re.IGNORECASE,
+)
+PLACEHOLDER = re.compile(r"^\s*(n/?a|none|unknown|tbd|-|)\s*$", re.IGNORECASE)
+
+ACTOR = re.compile(r"\b(as an? |users?|admins?|administrators?|customers?|managers?|operators?|clients?|the system)\b", re.IGNORECASE)
+ACTION = re.compile(
+    r"\b(add|allow|enable|create|show|display|send|support|integrate|fix|prevent|export|import|upload|download|"
+    r"notify|validate|search|filter|sync|log|approve|reject|reset|update|delete|load|generate)\w*\b",
+    re.IGNORECASE,
+)
+COMPONENT = re.compile(
+    r"\b(page|screen|api|endpoint|button|form|dashboard|table|database|service|report|email|app|portal|"
+    r"panel|module|field|menu|notification|server|hmi|ui)s?\b",
+    re.IGNORECASE,
+)
+CONDITION = re.compile(r"\b(when|if|given|then|within|must|shall|only|unless|after|before)\b", re.IGNORECASE)
+FAILURE = re.compile(r"\b(error|fail\w*|invalid|timeout|exception|edge|offline|retry|denied)\b", re.IGNORECASE)
+CONTEXT = re.compile(r"\b(because|so that|in order to|to avoid|to reduce|to allow)\b", re.IGNORECASE)
+
+REQUIRED_SECTIONS = (
+    "requirement_summary", "classification", "detailed_analysis", "edge_cases",
+    "acceptance_criteria", "user_stories", "test_cases", "dependencies_and_risks",
+)
+
+
+def resolve_quality_mode(mode: str | None) -> str:
+    mode = (mode or QUALITY_MODE).lower()
+    if mode not in QUALITY_MODES:
+        raise ValueError(f"Unknown quality mode '{mode}', expected one of {', '.join(QUALITY_MODES)}")
+    return mode
+
+
+def is_ambiguous(score: float) -> bool:
+    return any(abs(score - boundary) <= QUALITY_AMBIGUOUS_MARGIN for boundary in TIER_BOUNDARIES)
+
+
+def _list(value) -> list:
+    return value if isinstance(value, list) else []
+
+
+def _dict(value) -> dict:
+    return value if isinstance(value, dict) else {}
+
+
+def _filled(value) -> bool:
+    if isinstance(value, str):
+        return not PLACEHOLDER.match(value)
+    return bool(value)
+
+
+def _ratio(items: list, predicate) -> float:
+    return sum(1 for item in items if predicate(item)) / len(items) if items else 0.0
+
+
+def _text(value) -> str:
+    """All string leaves of ``value`` joined into one string."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return " ".join(_text(v) for v in value.values())
+    if isinstance(value, list):
+        return " ".join(_text(v) for v in value)
+    return ""
+
+
+def _terms(text: str, words: frozenset, phrases: tuple[str, ...]) -> list[str]:
+    """Occurrences of ``words`` and ``phrases`` in ``text``, lower-cased."""
+    lowered = text.lower()
+    found = [word for word in WORD.findall(lowered) if word in words]
+    for phrase in phrases:
+        found.extend([phrase] * lowered.count(phrase))
+    return found
+
+
+def _subjective(text: str) -> list[str]:
+    return _terms(text, SUBJECTIVE_WORDS, SUBJECTIVE_PHRASES)
+
+
+def _vague(text: str) -> list[str]:
+    return _terms(text, VAGUE_WORDS, VAGUE_PHRASES)
+
+
+def _tier_count(count: int, tiers: tuple[tuple[int, float], ...]) -> float:
+    return next((points for minimum, points in tiers if count >= minimum), 0.0)
+
+
+def _finish(dimensions: dict, issues: list[str], deductions: float) -> dict:
+    score = sum(dimensions.values()) - deductions
+    # High scores are reserved for tickets that are strong on every dimension
+    if min(dimensions.values()) < 23:
+        score = min(score, 90)
+    score = int(round(max(0, min(100, score))))
+    summary = ", ".join(f"{name} {round(points)}/25" for name, points in dimensions.items())
+    reason = f"{summary[0].upper()}{summary[1:]}. " + (
+        "Issues: " + "; ".join(issues[:4]) + "." if issues else "No rule-based deductions applied."
+    )
+    return {
+        "score": score,
+        "reason": reason,
+        "scorer": "local",
+        "dimensions": {name: round(points, 1) for name, points in dimensions.items()},
+        "deductions": round(deductions, 1),
+    }
+
+
+def score_ticket(ticket: dict) -> dict:
+    """Score an analysis report on QUALITY_PROMPT's 0-100 scale."""
+    summary = _dict(ticket.get("requirement_summary"))
+    classification = _dict(ticket.get("classification"))
+    criteria = [c for c in _list(ticket.get("acceptance_criteria")) if isinstance(c, dict)]
+    stories = [s for s in _list(ticket.get("user_stories")) if isinstance(s, dict)]
+    tests = [t for t in _list(ticket.get("test_cases")) if isinstance(t, dict)]
+    edge_cases = _list(ticket.get("edge_cases"))
+    analysis = _dict(ticket.get("detailed_analysis"))
+    risks = _dict(ticket.get("dependencies_and_risks"))
+    issues: list[str] = []
+
+    # Clarity & specificity
+    words = len(str(summary.get("original_requirement") or "").split())
+    clarity = _tier_count(words, ((8, 5), (4, 3), (1, 1)))
+    clarity += 4 if _filled(classification.get("target_system")) else 0
+    clarity += 2 if _filled(classification.get("requirement_type")) else 0
+    body = _text([criteria, stories, tests, edge_cases])
+    subjective = _subjective(body)
+    vague = _vague(body)
+    clarity += max(0, 14 - 2 * min(len(subjective), 5) - min(len(vague), 4))
+    if vague:
+        issues.append(f"vague terms ({', '.join(sorted(set(vague))[:3])})")
+
+    # Testability & measurability
+    then_clauses = [str(c.get("then") or "") for c in criteria]
+    measurable = _ratio(then_clauses, lambda t: MEASURABLE.search(t) and not _subjective(t))
+    testability = 12 * measurable
+    testability += 6 * _ratio(tests, lambda t: _filled(t.get("test_steps")) and _filled(t.get("expected_result")))
+    testability += _tier_count(len(edge_cases), ((3, 4), (1, 2)))
+    testability += 3 * _ratio(criteria, lambda c: _filled(c.get("verification_method")))
+    if criteria and measurable < 1:
+        issues.append(f"{round((1 - measurable) * len(criteria))} of {len(criteria)} acceptance criteria are not objectively measurable")
+
+    # Completeness
+    completeness = _tier_count(len(criteria), ((8, 8), (6, 7), (4, 5), (3, 3), (1, 1)))
+    preconditions = _ratio(criteria, lambda c: _filled(c.get("given")))
+    completeness += 5 * preconditions
+    completeness += 4 * _ratio(stories, lambda s: _filled(s.get("definition_of_done")))
+    completeness += 8 * sum(1 for key in REQUIRED_SECTIONS if _filled(ticket.get(key))) / len(REQUIRED_SECTIONS)
+
+    # Actionability & precision
+    actionability = 8 * _ratio(stories, lambda s: all(_filled(s.get(k)) for k in ("as_a", "i_want", "so_that", "priority")))
+    software = _dict(analysis.get("software_requirements"))
+    detail_lists = [*software.values(), analysis.get("performance_requirements"), analysis.get("hardware_requirements")]
+    actionability += min(5, 2 * sum(1 for value in detail_lists if _filled(value)))
+    actionability += 4 if _list(ticket.get("implementation_options")) and _filled(ticket.get("recommendation")) else 0
+    actionability += 3 if _filled(_dict(ticket.get("effort_estimation")).get("total_estimated_effort")) else 0
+    actionability += 3 if _filled(risks.get("risks")) else 0
+    actionability += 2 if _filled(ticket.get("next_steps")) else 0
+
+    # QUALITY_PROMPT's specific deductions
+    deductions = 0.0
+    if not criteria:
+        deductions += 20
+        issues.insert(0, "no acceptance criteria")
+    else:
+        compound = _ratio(then_clauses, lambda t: COMPOUND.search(t))
+        if compound:
+            deductions += 5 + 5 * compound
+            issues.append(f"{round(compound * len(criteria))} acceptance criteria combine outcomes with 'and'")
+        subjective_criteria = sorted({term for t in then_clauses for term in _subjective(t)})
+        if subjective_criteria:
+            deductions += 10 + min(5, len(subjective_criteria))
+            issues.insert(0, f"subjective acceptance criteria ({', '.join(subjective_criteria[:3])})")
+        if preconditions < 0.5:
+            deductions += 10 + 5 * (1 - preconditions)
+            issues.append("acceptance criteria lack preconditions")
+    if not edge_cases:
+        deductions += 5
+        issues.append("no edge or error cases")
+    if not stories and not criteria:
+        deductions += 10
+        issues.append("unclear what done means")
+    elif subjective and len(issues) < 4:
+        issues.append(f"subjective wording ({', '.join(sorted(set(subjective))[:3])})")
+
+    dimensions = {
+        "clarity": min(clarity, 25),
+        "testability": min(testability, 25),
+        "completeness": min(completeness, 25),
+        "actionability": min(actionability, 25),
+    }
+    return _finish(dimensions, issues, deductions)
+
+
+def score_text(text: str) -> dict:
+    """Score a raw, unstructured requirement with the same dimensions."""
+    text = text or ""
+    words = len(text.split())
+    issues: list[str] = []
+    subjective = sorted(set(_subjective(text)))
+    vague = sorted(set(_vague(text)))
+    numbers = len(re.findall(r"\d+", text))
+
+    clarity = _tier_count(words, ((25, 10), (12, 7), (6, 4), (1, 1)))
+    clarity += max(0, 8 - 3 * len(subjective)) + max(0, 7 - 2 * len(vague))
+    testability = min(12, 6 * numbers) + min(8, 2 * len(CONDITION.findall(text))) + (5 if FAILURE.search(text) else 0)
+    completeness = _tier_count(words, ((60, 10), (30, 7), (15, 4), (1, 1)))
+    completeness += 5 if len([line for line in text.splitlines() if line.strip()]) >= 3 else 0
+    completeness += 5 if re.search(r"\b(acceptance|criteria|given|then)\b", text, re.IGNORECASE) else 0
+    completeness += 5 if CONTEXT.search(text) else 0
+    actionability = (8 if ACTOR.search(text) else 0) + (8 if ACTION.search(text) else 0) + (9 if COMPONENT.search(text) else 0)
+
+    if subjective:
+        issues.append(f"subjective wording ({', '.join(subjective[:3])})")
+    if vague:
+        issues.append(f"vague terms ({', '.join(vague[:3])})")
+    if not numbers:
+        issues.append("no measurable thresholds")
+    if words < 12:
+        issues.append("very little detail")
+
+    dimensions = {
+        "clarity": min(clarity, 25),
+        "testability": min(testability, 25),
+        "completeness": min(completeness, 25),
+        "actionability": min(actionability, 25),
+    }
+    return _finish(dimensions, issues, 0.0)
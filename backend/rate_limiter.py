@@ -0,0 +1,279 @@
+"""Client-side throttling for calls to the LLM gateway.
+
+Every chat-completions call acquires a permit from one process-wide
+``AdaptiveLimiter`` before it is sent:
+
+- token buckets cap requests per minute and tokens per minute; a call is
+  charged an estimate up front (prompt size plus ``max_tokens``) and the
+  estimate is corrected with the ``usage`` the gateway reports;
+- the number of calls in flight follows an AIMD limit: it grows by one per
+  window of successful calls and is cut multiplicatively when the gateway
+  answers 429/503 or latency climbs well above its recent baseline;
+- a 429 pauses all callers until its ``Retry-After``; retries use jittered
+  exponential backoff.
+"""
+import asyncio
+import email.utils
+import json
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+# 0 disables the corresponding bucket
+LLM_RPM_LIMIT = float(os.getenv("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = float(os.getenv("LLM_TPM_LIMIT", "0"))
+
+# Bounds and starting point of the adaptive in-flight limit
+LLM_CONCURRENCY_INITIAL = float(os.getenv("LLM_CONCURRENCY_INITIAL", "16"))
+LLM_CONCURRENCY_MIN = float(os.getenv("LLM_CONCURRENCY_MIN", "2"))
+LLM_CONCURRENCY_MAX = float(os.getenv("LLM_CONCURRENCY_MAX", "64"))
+# Back off when recent latency exceeds this multiple of the baseline
+LLM_LATENCY_TOLERANCE = float(os.getenv("LLM_LATENCY_TOLERANCE", "2.0"))
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+# Responses worth retrying; 429 and 503 also mean the gateway is overloaded
+RETRY_STATUSES = (429, 502, 503, 504)
+OVERLOAD_STATUSES = (429, 503)
+
+# Rough prompt-token cost of an attached image
+IMAGE_TOKENS = 765
+
+
+def estimate_tokens(payload: dict) -> int:
+    """Upper-bound token estimate for a chat-completions payload."""
+    chars = 0
+    images = 0
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                else:
+                    images += 1
+        else:
+            chars += len(json.dumps(content))
+    return chars // 4 + images * IMAGE_TOKENS + int(payload.get("max_tokens") or 0)
+
+
+def parse_retry_after(headers) -> float | None:
+    """Seconds to wait according to ``retry-after-ms`` or ``Retry-After`` (seconds or HTTP date)."""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's ``Retry-After``."""
+    if retry_after is not None:
+        return min(retry_after, LLM_BACKOFF_MAX) + random.uniform(0, LLM_BACKOFF_BASE)
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    """``rate`` units per second with bursts up to ``capacity``.
+
+    ``acquire`` takes the units immediately, letting the balance go negative,
+    and sleeps until the debt is paid back, so waiters are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        if self.rate <= 0:
+            return
+        self._refill()
+        # A single request larger than the bucket only has to wait for a full bucket
+        self._level -= min(amount, self.capacity)
+        if self._level < 0:
+            await asyncio.sleep(-self._level / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """Charge (positive) or refund (negative) units after the fact."""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self._level = min(self.capacity, self._level - amount)
+
+    def stats(self) -> dict:
+        if self.rate <= 0:
+            return {"limit_per_minute": None}
+        self._refill()
+        return {"limit_per_minute": round(self.rate * 60), "available": round(self._level, 1)}
+
+
+@dataclass
+class Permit:
+    estimate: int
+    key: int
+    started: float = field(default_factory=time.monotonic)
+    released: bool = False
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        rpm: float = LLM_RPM_LIMIT,
+        tpm: float = LLM_TPM_LIMIT,
+        initial: float = LLM_CONCURRENCY_INITIAL,
+        minimum: float = LLM_CONCURRENCY_MIN,
+        maximum: float = LLM_CONCURRENCY_MAX,
+        tolerance: float = LLM_LATENCY_TOLERANCE,
+    ):
+        self.requests = TokenBucket(rpm / 60, rpm)
+        self.tokens = TokenBucket(tpm / 60, tpm)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(initial, minimum), maximum)
+        self.tolerance = tolerance
+        self._in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        # Latency per call class (keyed by max_tokens): slow-moving baseline and recent average
+        self._baseline: dict[int, float] = {}
+        self._recent: dict[int, float] = {}
+        self._counters = {"requests": 0, "throttled": 0, "retries": 0, "increases": 0, "decreases": 0}
+
+    async def acquire(self, payload: dict) -> Permit:
+        """Wait for a pause, a free in-flight slot and bucket capacity, in that order."""
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await self._enter()
+        try:
+            estimate = estimate_tokens(payload)
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimate)
+        except BaseException:
+            self._exit()
+            raise
+        self._counters["requests"] += 1
+        return Permit(estimate=estimate, key=int(payload.get("max_tokens") or 0))
+
+    def release(self, permit: Permit, status: int | None = None, usage: dict | None = None) -> None:
+        """Return the slot and feed the outcome into the limits.
+
+        ``status`` is the HTTP status (None when no response arrived) and
+        ``usage`` the response's token usage, when known.
+        """
+        if permit.released:
+            return
+        permit.released = True
+        self._exit()
+
+        if usage and usage.get("total_tokens") is not None:
+            self.tokens.adjust(usage["total_tokens"] - permit.estimate)
+
+        if status in OVERLOAD_STATUSES:
+            self._counters["throttled"] += 1
+            self._decrease()
+        elif status is not None and status < 400:
+            self._observe(permit.key, time.monotonic() - permit.started)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every new call for ``seconds`` (a server-requested ``Retry-After``)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def record_retry(self) -> None:
+        self._counters["retries"] += 1
+
+    def _observe(self, key: int, latency: float) -> None:
+        baseline = self._baseline.get(key)
+        if baseline is None:
+            self._baseline[key] = self._recent[key] = latency
+        else:
+            self._baseline[key] = baseline * 0.95 + latency * 0.05
+            self._recent[key] = self._recent[key] * 0.7 + latency * 0.3
+            if self._recent[key] > baseline * self.tolerance:
+                self._decrease()
+                return
+        if self.limit < self.maximum:
+            # Additive increase: about +1 per limit's worth of successful calls
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._counters["increases"] += 1
+            self._wake()
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        # One cut per burst of bad responses rather than one per response
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * 0.7)
+        self._counters["decreases"] += 1
+
+    async def _enter(self) -> None:
+        while self._in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif not waiter.cancelled():
+                    # Woken but no longer interested: pass the slot on
+                    self._wake()
+                raise
+        self._in_flight += 1
+
+    def _exit(self) -> None:
+        self._in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self._in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self._in_flight,
+            "waiting": len(self._waiters),
+            "paused_for_ms": round(max(self._paused_until - time.monotonic(), 0) * 1000, 1),
+            "requests_per_minute": self.requests.stats(),
+            "tokens_per_minute": self.tokens.stats(),
+            "latency_ms": {
+                str(key): {"baseline": round(self._baseline[key] * 1000, 1), "recent": round(self._recent[key] * 1000, 1)}
+                for key in self._baseline
+            },
+        }
+
+
+limiter = AdaptiveLimiter()
@@ -0,0 +1,585 @@
+"""The sections of an analysis report as a stream of layout blocks.
+
+Every export format walks the ticket the same way: ``walk(ticket, layout)``
+goes through the report schema once, in report order, and yields small blocks
+(``Heading``, ``Field``, ``Label``, ``Text``, ``Bullet``, ``Table``) that the
+exporter turns into Word paragraphs, PDF flowables, Markdown lines and so on.
+Which sections exist, their numbering and labels, and what is shown for a
+missing value live here only; an exporter only decides what a block looks
+like, and writes it out before the next one is produced.
+
+The walk is the same for every kind of document; a ``Layout`` only holds
+what differs between them as data: the section headings, the fields and
+lists of each kind of item and their labels, bullet markers, and how groups
+are set off. ``"word"`` and ``"pdf"`` are the Word and PDF reports as they
+have always been laid out, down to the bullet characters; ``"report"``, the
+default, is the complete report that the text formats export.
+
+Values are converted to strings but not escaped, as every format escapes
+differently. ``TABLES`` lists the columns of the test case and user story
+tables, used by the overview table in the report and by the CSV exports.
+"""
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+NA = "N/A"
+TITLE = "REQUIREMENT ANALYSIS REPORT"
+
+
+@dataclass(slots=True)
+class Heading:
+    text: str
+    # 1 = report title, 2 = section, 3 = item or group within a section
+    level: int
+
+
+@dataclass(slots=True)
+class Field:
+    label: str
+    value: str
+    # False for a label that reads into its value, e.g. "As a"
+    colon: bool = True
+
+
+@dataclass(slots=True)
+class Label:
+    """Introduces the list that follows, e.g. "Test Steps"."""
+    text: str
+
+
+@dataclass(slots=True)
+class Text:
+    text: str
+
+
+@dataclass(slots=True)
+class Bullet:
+    text: str
+    depth: int = 1
+    # Position in a numbered list, None for a bulleted one
+    number: int | None = None
+    # Written before the text by the Word and PDF layouts, e.g. "• "
+    marker: str = ""
+
+
+@dataclass(slots=True)
+class Table:
+    # Key of ``TABLES``
+    name: str
+    columns: tuple[str, ...]
+    rows: list[tuple[str, ...]]
+
+
+@dataclass(slots=True)
+class Break:
+    """Ends a group of lines; the PDF layout sets each group as one paragraph."""
+    # Indent the group that follows
+    indent: bool = False
+
+
+Block = Heading | Field | Label | Text | Bullet | Table | Break
+
+
+def text(value) -> str:
+    return NA if value is None else str(value)
+
+
+def report_title(ticket: dict) -> str:
+    """Short name of a report for tables of contents, issue summaries and file names."""
+    summary = ticket.get('requirement_summary')
+    if not isinstance(summary, dict):
+        summary = {}
+    requirement = " ".join(str(summary.get('original_requirement') or "").split())
+    if len(requirement) > 80:
+        requirement = requirement[:79] + "…"
+    requirement_id = summary.get('requirement_id')
+    if requirement_id and requirement:
+        return f"{requirement_id}: {requirement}"
+    return str(requirement_id or requirement or "Untitled requirement")
+
+
+def _joined(items) -> str:
+    return "\n".join(text(item) for item in items or [])
+
+
+def _steps(items) -> str:
+    return "\n".join(f"{number}. {text(item)}" for number, item in enumerate(items or [], 1))
+
+
+# Table name -> columns as (header, value of a row's dict), in export order
+TABLES: dict[str, tuple[tuple[str, Callable[[dict], str]], ...]] = {
+    "test_cases": (
+        ("ID", lambda test: text(test.get('test_id', NA))),
+        ("Title", lambda test: text(test.get('title') or test.get('test_case_title', NA))),
+        ("Story", lambda test: text(test.get('story_reference', NA))),
+        ("Type", lambda test: text(test.get('test_type', NA))),
+        ("Priority", lambda test: text(test.get('priority', NA))),
+        ("Automated", lambda test: text(test.get('automated', NA))),
+        ("Preconditions", lambda test: _joined(test.get('preconditions'))),
+        ("Test Steps", lambda test: _steps(test.get('test_steps'))),
+        ("Test Data", lambda test: text(test.get('test_data', ""))),
+        ("Expected Result", lambda test: text(test.get('expected_result', NA))),
+        ("Pass/Fail Criteria", lambda test: text(test.get('pass_fail_criteria', ""))),
+    ),
+    "user_stories": (
+        ("ID", lambda story: text(story.get('story_id', NA))),
+        ("Title", lambda story: text(story.get('title', NA))),
+        ("As a", lambda story: text(story.get('as_a', NA))),
+        ("I want", lambda story: text(story.get('i_want', NA))),
+        ("So that", lambda story: text(story.get('so_that', NA))),
+        ("Type", lambda story: text(story.get('story_type', ""))),
+        ("Priority", lambda story: text(story.get('priority', NA))),
+        ("Estimated Effort", lambda story: text(story.get('estimated_effort', NA))),
+        ("Acceptance Criteria", lambda story: _joined(story.get('acceptance_criteria'))),
+        ("Definition of Done", lambda story: _joined(story.get('definition_of_done'))),
+    ),
+}
+# Columns of the test case overview at the top of the report's test case section
+OVERVIEW_COLUMNS = ("ID", "Title", "Type", "Priority", "Automated")
+
+
+def rows(items: list, name: str, columns: tuple[str, ...] | None = None) -> Iterator[tuple[str, ...]]:
+    """Rows of the ``TABLES[name]`` table for a ticket's ``items``, limited to ``columns`` if given."""
+    spec = [(header, value) for header, value in TABLES[name] if columns is None or header in columns]
+    for item in items or []:
+        if isinstance(item, dict):
+            yield tuple(value(item) for _, value in spec)
+
+
+# Kinds of entry of an item: (kind, key, label), plus (key, label) pairs for PAIRS and SUBFIELDS
+FIELD = "field"  # label and value, N/A when missing
+OPTIONAL = "optional"  # a field left out without a value
+LEAD = "lead"  # a label that reads into its value, e.g. "As a ..."
+PHRASE = "phrase"  # the same, as plain text
+TEXT = "text"  # the value on its own
+EACH = "each"  # one field per entry of a list
+LIST = "list"  # the label, then the list as bullets
+STEPS = "steps"  # the label, then the list numbered
+PAIRS = "pairs"  # the label, then "label: value" bullets of a dict's values
+SUBFIELDS = "subfields"  # fields of a dict's values
+
+
+@dataclass(frozen=True)
+class Layout:
+    # Section headings by ticket key; a section without an entry is left out, one with None has no heading
+    headings: dict[str, str | None]
+    # Entries of each kind of item, in order
+    items: dict[str, tuple]
+    # Heading of each kind of item, formatted with ``idx`` and the item's values
+    titles: dict[str, str]
+    # Groups of the detailed analysis: (key or path of keys, title) or (key, title, subgroups)
+    analysis: tuple
+    # Groups of the clarification questions and of dependencies and risks: (key, title)
+    questions: tuple
+    dependencies: tuple
+    # How a None value reads
+    none: str = NA
+    # Before a bullet of a group's list, of a list under an item's label, of a subgroup's list,
+    # of a numbered step and of a next step (the last two formatted with the number)
+    marker: str = ""
+    sub_marker: str = ""
+    nested_marker: str = ""
+    step_marker: str = ""
+    next_marker: str = ""
+    # Before an item that is not an object
+    loose_marker: str = ""
+    # After a group title; groups are titled by a level-3 heading, or by a label
+    group_suffix: str = ""
+    group_labels: bool = False
+    # A Break before every item and group; items of these kinds get an indented one
+    breaks: bool = False
+    indent: tuple[str, ...] = ()
+    # The test case overview table
+    overview: bool = True
+    # The recommendation as a field after the implementation options rather than a section of its own
+    recommendation_field: bool = False
+
+    def text(self, value) -> str:
+        return self.none if value is None else str(value)
+
+
+class _Values(dict):
+    """An item's values for its title format, converted like every other value."""
+
+    def __init__(self, layout: Layout, item: dict, **values):
+        super().__init__(values)
+        self.layout = layout
+        self.item = item
+
+    def __missing__(self, key):
+        return self.layout.text(self.item.get(key, NA))
+
+
+def _bullets(layout: Layout, items, marker: str, depth: int = 1) -> Iterator[Bullet]:
+    for item in items or []:
+        yield Bullet(layout.text(item), depth, marker=marker)
+
+
+def _entries(layout: Layout, item: dict, entries: tuple) -> Iterator[Block]:
+    for kind, key, label, *pairs in entries:
+        if kind == FIELD:
+            yield Field(label, layout.text(item.get(key, NA)))
+        elif kind == LEAD:
+            yield Field(label, layout.text(item.get(key, NA)), colon=False)
+        elif kind == PHRASE:
+            yield Text(f"{label} {layout.text(item.get(key, NA))}")
+        elif kind == TEXT:
+            yield Text(layout.text(item.get(key, NA)))
+        elif kind == EACH:
+            for value in item.get(key) or []:
+                yield Field(label, layout.text(value))
+        elif not item.get(key):
+            continue
+        elif kind == OPTIONAL:
+            yield Field(label, layout.text(item[key]))
+        elif kind == SUBFIELDS:
+            for subkey, sublabel in pairs[0]:
+                yield Field(sublabel, layout.text(item[key].get(subkey, NA)))
+        else:
+            yield Label(label)
+            if kind == LIST:
+                yield from _bullets(layout, item[key], layout.sub_marker)
+            elif kind == STEPS:
+                for number, step in enumerate(item[key], 1):
+                    yield Bullet(layout.text(step), number=number, marker=layout.step_marker.format(number))
+            else:
+                for subkey, sublabel in pairs[0]:
+                    yield Bullet(f"{sublabel}: {layout.text(item[key].get(subkey, NA))}", marker=layout.sub_marker)
+
+
+def _item(layout: Layout, kind: str, idx: int, item, **values) -> Iterator[Block]:
+    """One item of a list section under its own heading, or a bullet when it is not an object."""
+    if not isinstance(item, dict):
+        if layout.breaks:
+            yield Break(indent=True)
+        prefix = f"AC{idx}: " if kind == "ac" else ""
+        yield Bullet(prefix + layout.text(item), marker=layout.loose_marker)
+        return
+    if layout.breaks:
+        yield Break(indent=kind in layout.indent)
+    yield Heading(layout.titles[kind].format_map(_Values(layout, item, idx=idx, **values)), 3)
+    yield from _entries(layout, item, layout.items[kind])
+
+
+def _group(layout: Layout, title: str) -> Iterator[Block]:
+    if layout.breaks:
+        yield Break()
+    yield Label(title) if layout.group_labels else Heading(title + layout.group_suffix, 3)
+
+
+def _summary(summary: dict, layout: Layout) -> Iterator[Block]:
+    yield from _entries(layout, summary, layout.items["summary"])
+
+
+def _classification(classification: dict, layout: Layout) -> Iterator[Block]:
+    yield from _entries(layout, classification, layout.items["classification"])
+
+
+def _detailed_analysis(analysis: dict, layout: Layout) -> Iterator[Block]:
+    for path, title, *subgroups in layout.analysis:
+        if subgroups:
+            source = analysis.get(path)
+            if source:
+                yield from _group(layout, title)
+                for key, label in subgroups[0]:
+                    if source.get(key):
+                        yield Bullet(label + layout.group_suffix)
+                        yield from _bullets(layout, source[key], layout.nested_marker, 2)
+            continue
+        items = analysis
+        for key in (path,) if isinstance(path, str) else path:
+            items = (items or {}).get(key)
+        if items:
+            yield from _group(layout, title)
+            yield from _bullets(layout, items, layout.marker)
+
+
+def _edge_cases(edge_cases: list, layout: Layout) -> Iterator[Block]:
+    for idx, edge_case in enumerate(edge_cases, 1):
+        yield from _item(layout, "edge_case", idx, edge_case)
+
+
+def _clarification_questions(questions: dict, layout: Layout) -> Iterator[Block]:
+    for key, title in layout.questions:
+        if questions.get(key):
+            yield from _group(layout, title)
+            yield from _bullets(layout, questions[key], layout.marker)
+
+
+def _acceptance_criteria(criteria: list, layout: Layout) -> Iterator[Block]:
+    for idx, ac in enumerate(criteria, 1):
+        yield from _item(layout, "ac", idx, ac)
+
+
+def _implementation_options(options: list, layout: Layout) -> Iterator[Block]:
+    for idx, option in enumerate(options, 1):
+        yield from _item(layout, "option", idx, option)
+
+
+def _recommendation(recommendation, layout: Layout) -> Iterator[Block]:
+    if layout.recommendation_field:
+        if layout.breaks:
+            yield Break()
+        yield Field("Recommendation", layout.text(recommendation))
+    else:
+        yield Heading("Recommendation", 3)
+        yield Text(layout.text(recommendation))
+
+
+def user_story(story: dict) -> Iterator[Block]:
+    """One user story of the complete report under its own heading; also the description of its Jira issue."""
+    return _item(LAYOUTS["report"], "story", 1, story)
+
+
+def _user_stories(stories: list, layout: Layout) -> Iterator[Block]:
+    for idx, story in enumerate(stories, 1):
+        yield from _item(layout, "story", idx, story)
+
+
+def _test_cases(tests: list, layout: Layout) -> Iterator[Block]:
+    if layout.overview:
+        yield Table("test_cases", OVERVIEW_COLUMNS, list(rows(tests, "test_cases", OVERVIEW_COLUMNS)))
+    for idx, test in enumerate(tests, 1):
+        title = test.get('title') or test.get('test_case_title', NA) if isinstance(test, dict) else None
+        yield from _item(layout, "test", idx, test, title=layout.text(title))
+
+
+def _dependencies_and_risks(dep_risks: dict, layout: Layout) -> Iterator[Block]:
+    for key, title in layout.dependencies:
+        if not dep_risks.get(key):
+            continue
+        yield from _group(layout, title)
+        for item in dep_risks[key]:
+            if not isinstance(item, dict):
+                yield Bullet(layout.text(item), marker=layout.marker)
+            elif "risk" in layout.items:
+                yield from _entries(layout, item, layout.items["risk"])
+            else:
+                yield Bullet(layout.titles["risk"].format_map(_Values(layout, item)), marker=layout.marker)
+
+
+def _effort_estimation(effort: dict, layout: Layout) -> Iterator[Block]:
+    yield from _entries(layout, effort, layout.items["effort"])
+
+
+def _next_steps(steps: list, layout: Layout) -> Iterator[Block]:
+    for number, step in enumerate(steps, 1):
+        yield Bullet(layout.text(step), number=number, marker=layout.next_marker.format(number))
+
+
+# (ticket key, type of its value, blocks of the value), in report order. A section is left out when
+# its key is missing or its value empty.
+SECTIONS = (
+    ('requirement_summary', dict, _summary),
+    ('classification', dict, _classification),
+    ('detailed_analysis', dict, _detailed_analysis),
+    ('edge_cases', list, _edge_cases),
+    ('clarification_questions', dict, _clarification_questions),
+    ('acceptance_criteria', list, _acceptance_criteria),
+    ('implementation_options', list, _implementation_options),
+    ('recommendation', object, _recommendation),
+    ('user_stories', list, _user_stories),
+    ('test_cases', list, _test_cases),
+    ('dependencies_and_risks', dict, _dependencies_and_risks),
+    ('effort_estimation', dict, _effort_estimation),
+    ('next_steps', list, _next_steps),
+)
+
+HEADINGS = {
+    'requirement_summary': "1. REQUIREMENT SUMMARY",
+    'classification': "2. CLASSIFICATION",
+    'detailed_analysis': "3. DETAILED ANALYSIS",
+    'edge_cases': "4. EDGE CASES",
+    'clarification_questions': "5. CLARIFICATION QUESTIONS",
+    'acceptance_criteria': "6. ACCEPTANCE CRITERIA",
+    'implementation_options': "7. IMPLEMENTATION OPTIONS",
+    # Continues the implementation options
+    'recommendation': None,
+    'user_stories': "8. USER STORIES",
+    'test_cases': "9. TEST CASES",
+    'dependencies_and_risks': "10. DEPENDENCIES & RISKS",
+    'effort_estimation': "11. EFFORT ESTIMATION",
+    'next_steps': "12. NEXT STEPS",
+}
+
+SUMMARY = (
+    (FIELD, 'original_requirement', "Original Requirement"), (FIELD, 'requirement_id', "Requirement ID"),
+    (FIELD, 'date', "Date"), (FIELD, 'analyst', "Analyst"),
+)
+CLASSIFICATION = (
+    (FIELD, 'requirement_type', "Requirement Type"), (FIELD, 'target_system', "Target System"),
+    (FIELD, 'domain', "Domain"), (FIELD, 'stakeholder', "Stakeholder"),
+    (FIELD, 'primary_category', "Primary Category"), (FIELD, 'sub_category', "Sub-Category"),
+    (FIELD, 'impact_scope', "Impact Scope"),
+)
+EDGE_CASE = (
+    (FIELD, 'scenario', "Scenario"), (FIELD, 'trigger', "Trigger"), (FIELD, 'expected_behavior', "Expected Behavior"),
+    (FIELD, 'risk_level', "Risk Level"), (FIELD, 'mitigation_strategy', "Mitigation"),
+)
+GIVEN_WHEN_THEN = ((FIELD, 'given', "Given"), (FIELD, 'when', "When"), (FIELD, 'then', "Then"))
+STORY_LEAD = ((LEAD, 'as_a', "As a"), (LEAD, 'i_want', "I want"), (LEAD, 'so_that', "So that"))
+BREAKDOWN = (('development', "Development"), ('testing', "Testing"), ('documentation', "Documentation"))
+QUESTION_GROUPS = (('functional', "Functional"), ('technical', "Technical"),
+                   ('constraints', "Constraints"), ('scope', "Scope"))
+
+LAYOUTS: dict[str, Layout] = {
+    # The complete report, for the text formats
+    "report": Layout(
+        headings=HEADINGS,
+        items={
+            "summary": SUMMARY,
+            "classification": CLASSIFICATION + (
+                # Not in the schema, but older reports carry them
+                (OPTIONAL, 'priority', "Priority"), (OPTIONAL, 'complexity', "Complexity"),
+            ),
+            "edge_case": EDGE_CASE,
+            "ac": GIVEN_WHEN_THEN + ((EACH, 'and', "And"),),
+            "option": (
+                (FIELD, 'description', "Description"), (LIST, 'pros', "Pros"), (LIST, 'cons', "Cons"),
+                (FIELD, 'effort_estimate', "Effort Estimate"), (FIELD, 'risk_level', "Risk Level"),
+            ),
+            "story": tuple((PHRASE, key, label) for _, key, label in STORY_LEAD) + (
+                (FIELD, 'priority', "Priority"), (FIELD, 'estimated_effort', "Estimated Effort"),
+                (LIST, 'acceptance_criteria', "Acceptance Criteria"), (LIST, 'definition_of_done', "Definition of Done"),
+            ),
+            "test": (
+                (FIELD, 'test_type', "Test Type"), (FIELD, 'priority', "Priority"),
+                (LIST, 'preconditions', "Preconditions"), (STEPS, 'test_steps', "Test Steps"),
+                (OPTIONAL, 'expected_result', "Expected Result"),
+            ),
+            "effort": (
+                (FIELD, 'total_estimated_effort', "Total Estimated Effort"), (PAIRS, 'breakdown', "Breakdown", BREAKDOWN),
+                (OPTIONAL, 'suggested_sprint_allocation', "Sprint Allocation"),
+            ),
+        },
+        titles={
+            "edge_case": "Edge Case #{idx}", "ac": "AC{idx}: {title}", "option": "Option {idx}: {option_name}",
+            "story": "{story_id}: {title}", "test": "{test_id}: {title}", "risk": "{risk} - Mitigation: {mitigation}",
+        },
+        analysis=(
+            ('hardware_requirements', "Hardware Requirements"),
+            ('software_requirements', "Software Requirements", (
+                ('ui_ux_related', "UI/UX Related"), ('hmi_related', "HMI Related"), ('backend_logic', "Backend Logic"),
+            )),
+            ('performance_requirements', "Performance Requirements"),
+            ('cross_functional_requirements', "Cross-Functional Requirements"),
+        ),
+        questions=tuple((key, f"{title} Questions") for key, title in QUESTION_GROUPS),
+        dependencies=(('dependencies', "Dependencies"), ('risks', "Risks")),
+    ),
+    # The Word report. Values are written as they are, so a None reads "None" as it always has.
+    "word": Layout(
+        headings={
+            **{key: heading for key, heading in HEADINGS.items() if key != 'next_steps'},
+            'edge_cases': "4. EDGE CASES IDENTIFIED",
+            'user_stories': "8. USER STORIES BREAKDOWN",
+        },
+        items={
+            "summary": SUMMARY,
+            "classification": CLASSIFICATION,
+            "edge_case": EDGE_CASE,
+            "ac": GIVEN_WHEN_THEN + ((LIST, 'and', "And"),),
+            "option": (
+                (FIELD, 'description', "Description"), (FIELD, 'effort_estimate', "Effort Estimate"),
+                (FIELD, 'risk_level', "Risk Level"),
+            ),
+            "story": STORY_LEAD + ((FIELD, 'priority', "Priority"), (FIELD, 'estimated_effort', "Estimated Effort")),
+            "test": ((FIELD, 'test_type', "Test Type"), (FIELD, 'priority', "Priority"), (LIST, 'test_steps', "Test Steps")),
+            "effort": (
+                (FIELD, 'total_estimated_effort', "Total Estimated Effort"), (PAIRS, 'breakdown', "Breakdown", BREAKDOWN),
+            ),
+        },
+        titles={
+            "edge_case": "Edge Case #{idx}", "ac": "AC{idx}: {title}", "option": "Option: {option_name}",
+            "story": "Story: {title}", "test": "{test_id}: {title}", "risk": "{risk} - Mitigation: {mitigation}",
+        },
+        analysis=(
+            ('hardware_requirements', "Hardware Requirements"),
+            ('software_requirements', "Software Requirements", (
+                ('ui_ux_related', "UI/UX Related"), ('backend_logic', "Backend Logic"),
+            )),
+        ),
+        questions=(('functional', "Functional Questions"), ('technical', "Technical Questions")),
+        dependencies=(('dependencies', "Dependencies"), ('risks', "Risks")),
+        none="None",
+        marker="• ",
+        sub_marker="  • ",
+        nested_marker="  - ",
+        group_suffix=":",
+        overview=False,
+        recommendation_field=True,
+    ),
+    # The PDF report: every item and group is a run of lines after a Break, set as one paragraph
+    "pdf": Layout(
+        headings=HEADINGS,
+        items={
+            "summary": SUMMARY,
+            "classification": (
+                (FIELD, 'requirement_type', "Requirement Type"), (FIELD, 'target_system', "Target System"),
+                (FIELD, 'domain', "Domain"), (FIELD, 'primary_category', "Primary Category"),
+                (FIELD, 'priority', "Priority"), (FIELD, 'complexity', "Complexity"),
+            ),
+            "edge_case": ((FIELD, 'expected_behavior', "Expected"),),
+            "ac": GIVEN_WHEN_THEN + ((EACH, 'and', "And"),),
+            "option": (
+                (TEXT, 'description', None), (LIST, 'pros', "Pros"), (LIST, 'cons', "Cons"),
+                (FIELD, 'effort_estimate', "Effort"), (FIELD, 'risk_level', "Risk"),
+            ),
+            "story": STORY_LEAD + (
+                (FIELD, 'priority', "Priority"), (FIELD, 'estimated_effort', "Effort"),
+                (LIST, 'acceptance_criteria', "Acceptance Criteria"),
+            ),
+            "test": (
+                (LIST, 'preconditions', "Preconditions"), (STEPS, 'test_steps', "Test Steps"),
+                (OPTIONAL, 'expected_result', "Expected Result"),
+            ),
+            "risk": ((FIELD, 'risk', "Risk"), (FIELD, 'mitigation', "Mitigation")),
+            "effort": (
+                (FIELD, 'total_estimated_effort', "Total Estimated Effort"), (SUBFIELDS, 'breakdown', None, BREAKDOWN),
+                (OPTIONAL, 'suggested_sprint_allocation', "Sprint Allocation"),
+            ),
+        },
+        titles={
+            "edge_case": "{scenario}", "ac": "AC{idx}: {title}", "option": "Option {idx}: {option_name}",
+            "story": "{story_id}: {title}", "test": "{test_id}: {title}",
+        },
+        analysis=(
+            (('software_requirements', 'ui_ux_related'), "UI/UX Requirements"),
+            (('software_requirements', 'backend_logic'), "Backend Requirements"),
+            ('hardware_requirements', "Hardware Requirements"),
+            ('performance_requirements', "Performance Requirements"),
+        ),
+        questions=QUESTION_GROUPS,
+        dependencies=(('dependencies', "Dependencies"), ('risks', "Risks & Mitigation")),
+        marker="• ",
+        sub_marker="  • ",
+        step_marker="  {}. ",
+        next_marker="{}. ",
+        loose_marker="• ",
+        group_labels=True,
+        breaks=True,
+        indent=("test",),
+        recommendation_field=True,
+    ),
+}
+
+
+def walk(ticket: dict, title: str = TITLE, layout: str = "report") -> Iterator[Block]:
+    """Every block of the report in ``layout``, in order, starting with its title."""
+    spec = LAYOUTS[layout]
+    yield Heading(title, 1)
+    for key, kind, blocks in SECTIONS:
+        if key not in spec.headings:
+            continue
+        value = ticket.get(key)
+        if value is None or value == [] or value == "":
+            continue
+        if key == 'recommendation' and spec.recommendation_field and not ticket.get('implementation_options'):
+            continue
+        if spec.headings[key] is not None:
+            yield Heading(spec.headings[key], 2)
+        if isinstance(value, kind):
+            yield from blocks(value, spec)
+        else:
+            # Malformed model output, e.g. a string where a list belongs: show it as is
+            yield Text(text(value))
@@ -0,0 +1,176 @@
+"""Sharded generation of the analysis report.
+
+Instead of one completion producing every section of ``SYSTEM_PROMPT``'s
+JSON structure within a single ``max_tokens`` budget, the report is split
+into section groups. The core group (summary and classification) is
+generated first; the remaining groups are then generated in parallel, each
+with its own token budget and the core sections as shared context, and
+merged back into the usual ticket shape.
+
+Every shard sends ``SYSTEM_PROMPT`` unchanged as its first message and only
+appends a short shard instruction, so the shards share one prompt prefix.
+"""
+import asyncio
+import json
+import os
+from contextlib import aclosing
+
+import metrics
+from llm_service import SYSTEM_PROMPT, analysis_payload, post_chat, safe_json_parse
+
+# "single" (one completion) or "sharded"; a request may override it
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "single").lower()
+ANALYSIS_MODES = ("single", "sharded")
+
+# Timeout per shard call in seconds
+SHARD_TIMEOUT = float(os.getenv("SHARD_TIMEOUT", "60"))
+
+CORE_SHARD = "core"
+
+# Shard name -> (top-level sections, max_tokens). Sections of the output
+# structure not listed here are added to the "analysis" shard.
+SHARDS = {
+    CORE_SHARD: (("requirement_summary", "classification"), 800),
+    "analysis": (("detailed_analysis", "clarification_questions", "acceptance_criteria"), 2500),
+    "options": (("implementation_options", "recommendation", "next_steps"), 1500),
+    "edge_cases": (("edge_cases",), 1500),
+    "stories": (("user_stories", "epic"), 3000),
+    "tests": (("test_cases", "test_stories", "test_coverage_summary"), 3500),
+    "risks": (("dependencies_and_risks", "effort_estimation"), 1200),
+}
+
+# Upper bound when a shard is retried after hitting its token budget
+SHARD_MAX_TOKENS_LIMIT = 8000
+
+
+def _output_structure(prompt: str) -> dict:
+    """The JSON skeleton embedded in the system prompt."""
+    start = prompt.index("OUTPUT JSON STRUCTURE:")
+    start = prompt.index("{", start)
+    end = prompt.index("PHASE-BY-PHASE", start)
+    return json.loads(prompt[start:prompt.rindex("}", start, end) + 1])
+
+
+STRUCTURE = _output_structure(SYSTEM_PROMPT)
+SECTION_ORDER = list(STRUCTURE)
+
+_unassigned = [key for key in SECTION_ORDER if not any(key in sections for sections, _ in SHARDS.values())]
+if _unassigned:
+    sections, budget = SHARDS["analysis"]
+    SHARDS["analysis"] = (sections + tuple(_unassigned), budget)
+
+
+def resolve_mode(mode: str | None) -> str:
+    """Validate a requested analysis mode, falling back to ``ANALYSIS_MODE``."""
+    mode = (mode or ANALYSIS_MODE).lower()
+    if mode not in ANALYSIS_MODES:
+        raise ValueError(f"Unknown analysis mode '{mode}', expected one of {', '.join(ANALYSIS_MODES)}")
+    return mode
+
+
+def _shard_instruction(name: str, core: dict | None) -> str:
+    sections, _ = SHARDS[name]
+    skeleton = {key: STRUCTURE[key] for key in sections if key in STRUCTURE}
+    lines = [
+        "SECTIONED GENERATION:",
+        "This call produces only part of the report. Return ONLY a JSON object with exactly",
+        "these top-level keys, following the structure and phase instructions above:",
+        json.dumps(skeleton, indent=2),
+    ]
+    if name == "stories":
+        lines.append("Number user stories US-001, US-002, ... in order.")
+    if name == "tests":
+        lines.append("User stories are numbered US-001, US-002, ...; reference them by that id.")
+    if core is not None:
+        lines.append("Summary and classification already produced for this requirement (stay consistent with them):")
+        lines.append(json.dumps(core, ensure_ascii=False))
+    return "\n".join(lines)
+
+
+def _shard_payload(name: str, user_input: str, image_base64: str | None, core: dict | None) -> dict:
+    payload = analysis_payload(user_input, image_base64)
+    system, user = payload["messages"]
+    payload["messages"] = [system, {"role": "system", "content": _shard_instruction(name, core)}, user]
+    payload["max_tokens"] = SHARDS[name][1]
+    return payload
+
+
+async def generate_shard(name: str, user_input: str, image_base64: str | None = None, core: dict | None = None) -> dict:
+    """Generate one section group; returns only that group's sections.
+
+    A shard that runs out of tokens is retried once with twice the budget
+    before its truncated output is repaired. Raises ``ValueError`` when the
+    output does not parse or has none of the group's sections; the core
+    shard needs all of them.
+    """
+    payload = _shard_payload(name, user_input, image_base64, core)
+    with metrics.span(f"shard_{name}"):
+        while True:
+            data = await post_chat(f"SYSTEM_PROMPT:{name}", payload, timeout=SHARD_TIMEOUT)
+            choice = data["choices"][0]
+            if choice.get("finish_reason") != "length" or payload["max_tokens"] >= SHARD_MAX_TOKENS_LIMIT:
+                break
+            print(f"Shard '{name}' hit max_tokens={payload['max_tokens']}, retrying with a larger budget")
+            payload = {**payload, "max_tokens": min(payload["max_tokens"] * 2, SHARD_MAX_TOKENS_LIMIT)}
+
+    result = safe_json_parse(choice["message"]["content"])
+    if "error" in result:
+        raise ValueError(f"Shard '{name}' returned no usable JSON: {result['error']}")
+    sections, _ = SHARDS[name]
+    shard = {key: result[key] for key in sections if key in result}
+    missing = [key for key in sections if key not in shard]
+    if not shard or (name == CORE_SHARD and missing):
+        raise ValueError(f"Shard '{name}' is missing {', '.join(missing)}")
+    return shard
+
+
+async def stream_sharded_analysis(user_input: str, image_base64: str | None = None):
+    """Sharded counterpart of ``llm_service.stream_analysis``.
+
+    Yields ``("section", key, value)`` for each section as its shard
+    completes, then ``("report", None, report)`` with the merged report in
+    the usual section order. A failed non-core shard only drops its sections;
+    the run fails if the core shard or every other shard fails.
+    """
+    core = await generate_shard(CORE_SHARD, user_input, image_base64)
+    merged = dict(core)
+    for key, value in core.items():
+        yield "section", key, value
+
+    async def run(name: str) -> tuple[str, dict | Exception]:
+        try:
+            return name, await generate_shard(name, user_input, image_base64, core)
+        except Exception as e:
+            return name, e
+
+    tasks = [asyncio.ensure_future(run(name)) for name in SHARDS if name != CORE_SHARD]
+    errors = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            name, sections = await next_done
+            if isinstance(sections, Exception):
+                print(f"Shard '{name}' failed: {sections}")
+                errors.append(sections)
+                continue
+            merged.update(sections)
+            for key, value in sections.items():
+                yield "section", key, value
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if errors and len(errors) == len(tasks):
+        raise errors[0]
+
+    report = {key: merged[key] for key in SECTION_ORDER if key in merged}
+    report["is_valid"] = True
+    yield "report", None, report
+
+
+async def generate_sharded_analysis(user_input: str, image_base64: str | None = None) -> dict:
+    """Produce the full analysis report through parallel section shards."""
+    # Closed on return, so shards still running are cancelled now rather than on garbage collection
+    async with aclosing(stream_sharded_analysis(user_input, image_base64)) as events:
+        async for kind, _, value in events:
+            if kind == "report":
+                return value
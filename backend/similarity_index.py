@@ -0,0 +1,279 @@
+"""Near-duplicate index over past requirements and the drafts generated for them.
+
+Reworded versions of the same requirement miss the exact-hash LLM cache. Each
+analysed input is reduced to a set of word shingles (unigrams and bigrams
+without filler words) and a MinHash signature; signatures are banded into
+LSH buckets, so a lookup only compares the few entries sharing a bucket, and
+candidates are ranked by the exact Jaccard similarity of their shingles.
+
+Entries point at the draft holding the generated ticket (``draft_store``)
+rather than copying it. With a shared draft store they are appended to a
+JSONL file, so inserts are incremental, every worker picks up the others'
+inserts on its next lookup and the index survives restarts; entries whose
+draft expired are dropped on hit. With per-process drafts the index stays in
+memory too, as a file would point workers at drafts they cannot read.
+"""
+import difflib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from draft_store import get_store as get_draft_store
+
+SIMILAR_INDEX_ENABLED = os.getenv("SIMILAR_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+SIMILAR_INDEX_PATH = os.getenv(
+    "SIMILAR_INDEX_PATH", str(Path(__file__).resolve().parent / ".cache" / "similar_index.jsonl")
+)
+# At or above this similarity the prior ticket is returned as is, unless the wording changes a number
+# or negation. A changed number in a 50-word requirement still scores about 0.9.
+SIMILAR_REUSE_THRESHOLD = float(os.getenv("SIMILAR_REUSE_THRESHOLD", "0.98"))
+# At or above this one the prior ticket is refined with the wording changes instead of starting over
+SIMILAR_SEED_THRESHOLD = float(os.getenv("SIMILAR_SEED_THRESHOLD", "0.6"))
+SIMILAR_INDEX_MAX_ENTRIES = int(os.getenv("SIMILAR_INDEX_MAX_ENTRIES", "20000"))
+
+NUM_PERM = 128
+BANDS = 32  # 4 rows per band: pairs above ~0.45 Jaccard almost always share a bucket
+_ROWS = NUM_PERM // BANDS
+_PRIME = np.uint64((1 << 61) - 1)
+
+_rng = np.random.default_rng(1)
+_A = _rng.integers(1, (1 << 61) - 1, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, (1 << 61) - 1, NUM_PERM, dtype=np.uint64)
+
+WORD = re.compile(r"[a-z0-9]+")
+FILLER = frozenset(
+    "a an the to of for and or in on at by with be is are it its this that as from should must shall will "
+    "can could would want need needs able i we our my me us".split()
+)
+
+
+def shingles(text: str) -> set[str]:
+    words = [w for w in WORD.findall(text.lower()) if w not in FILLER]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def signature(items: set[str]) -> np.ndarray:
+    if not items:
+        return np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in items),
+        dtype=np.uint64,
+        count=len(items),
+    )
+    # Universal hashing per permutation; uint64 wraparound is fine for MinHash
+    with np.errstate(over="ignore"):
+        permuted = (np.outer(hashes, _A) + _B) % _PRIME
+    return permuted.min(axis=0)
+
+
+def jaccard(a: set[str], b: set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def wording_diff(before: str, after: str) -> dict:
+    """Words removed from and added to ``before`` to get ``after``."""
+    old, new = before.split(), after.split()
+    removed, added = [], []
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(a=old, b=new, autojunk=False).get_opcodes():
+        if op in ("replace", "delete"):
+            removed.append(" ".join(old[i1:i2]))
+        if op in ("replace", "insert"):
+            added.append(" ".join(new[j1:j2]))
+    return {"removed": removed, "added": added}
+
+
+# Words whose change alters what a requirement asks for, however small the rewording
+MEANINGFUL = re.compile(
+    r"\d|\b(?:zero|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|twenty|thirty|fifty|"
+    r"hundred|thousand|million|once|twice|half|double|single|multiple|"
+    r"least|most|more|less|fewer|max|maximum|min|minimum|over|under|above|below|exceed|exceeds|within|"
+    r"all|any|every|each|none|only|"
+    r"not|no|never|nor|without|except|unless|cannot|[a-z]+n't|"
+    r"seconds?|minutes?|hours?|days?|weeks?|months?|years?|ms|kb|mb|gb|tb|percent)\b",
+    re.IGNORECASE,
+)
+
+
+def changes_meaning(diff: dict) -> bool:
+    """Whether a ``wording_diff`` changes a number, quantity or negation."""
+    return any(MEANINGFUL.search(text) for text in diff["removed"] + diff["added"])
+
+
+class SimilarityIndex:
+    def __init__(self, path: str | None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self._shingles: dict[str, set[str]] = {}
+        self._buckets: dict[tuple[int, bytes], set[str]] = {}
+        self._keys: dict[str, list[tuple[int, bytes]]] = {}
+        self._offset = 0
+        self._records = 0
+        self._counters = {"lookups": 0, "reused": 0, "seeded": 0, "misses": 0, "inserts": 0, "stale": 0}
+        self._refresh()
+
+    def _band_keys(self, sig: np.ndarray) -> list[tuple[int, bytes]]:
+        return [(band, sig[band * _ROWS:(band + 1) * _ROWS].tobytes()) for band in range(BANDS)]
+
+    def _add(self, entry: dict) -> None:
+        entry_id = entry["id"]
+        if entry_id in self._entries:
+            return
+        items = shingles(entry["text"])
+        keys = self._band_keys(signature(items))
+        self._entries[entry_id] = entry
+        self._shingles[entry_id] = items
+        self._keys[entry_id] = keys
+        for key in keys:
+            self._buckets.setdefault(key, set()).add(entry_id)
+        # Oldest entries go first once the index is full
+        while len(self._entries) > SIMILAR_INDEX_MAX_ENTRIES:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, entry_id: str) -> None:
+        if self._entries.pop(entry_id, None) is None:
+            return
+        self._shingles.pop(entry_id, None)
+        for key in self._keys.pop(entry_id, ()):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _refresh(self) -> None:
+        """Apply records appended to the file since the last read (by this or another worker)."""
+        if not self.path:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < self._offset:
+                    # Compacted by another worker: start over from the new file
+                    self._reset()
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"Similarity index could not be read: {e}")
+            return
+        # A partially written last line is picked up on the next refresh
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self._records += 1
+            if "remove" in record:
+                self._drop(record["remove"])
+            else:
+                self._add(record)
+        self._offset += end
+
+    def _reset(self) -> None:
+        self._entries, self._shingles, self._buckets, self._keys = {}, {}, {}, {}
+        self._offset = self._records = 0
+
+    def _append(self, record: dict) -> None:
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Similarity index could not be written: {e}")
+
+    def lookup(self, text: str) -> dict | None:
+        """Most similar indexed entry at or above ``SIMILAR_SEED_THRESHOLD``, with its ``similarity``."""
+        items = shingles(text)
+        with self._lock:
+            self._refresh()
+            self._counters["lookups"] += 1
+            candidates = set()
+            for key in self._band_keys(signature(items)):
+                candidates |= self._buckets.get(key, set())
+            best, best_score = None, 0.0
+            for entry_id in candidates:
+                score = jaccard(items, self._shingles[entry_id])
+                if score > best_score:
+                    best, best_score = entry_id, score
+            if best is None or best_score < SIMILAR_SEED_THRESHOLD:
+                self._counters["misses"] += 1
+                return None
+            return {**self._entries[best], "similarity": round(best_score, 4)}
+
+    def insert(self, text: str, draft_id: str, version: int) -> str:
+        entry = {"id": hashlib.sha256(f"{draft_id}:{version}".encode("utf-8")).hexdigest()[:16],
+                 "text": text, "draft_id": draft_id, "version": version, "created_at": time.time()}
+        with self._lock:
+            self._refresh()
+            self._append(entry)
+            self._add(entry)
+            self._counters["inserts"] += 1
+            if self._records > 2 * max(len(self._entries), SIMILAR_INDEX_MAX_ENTRIES // 2):
+                self._compact()
+        return entry["id"]
+
+    def remove(self, entry_id: str) -> None:
+        """Forget an entry, e.g. because its draft expired."""
+        with self._lock:
+            self._append({"remove": entry_id})
+            self._drop(entry_id)
+            self._counters["stale"] += 1
+
+    def count(self, outcome: str) -> None:
+        with self._lock:
+            self._counters[outcome] += 1
+
+    def _compact(self) -> None:
+        """Rewrite the file with only the live entries once removals and evictions pile up.
+
+        A record another worker appends while the file is being replaced is
+        lost, which only costs a future index hit.
+        """
+        if not self.path:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for entry in self._entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Similarity index could not be compacted: {e}")
+            return
+        self._offset, self._records = os.path.getsize(self.path), len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "entries": len(self._entries),
+            "buckets": len(self._buckets),
+            "reuse_threshold": SIMILAR_REUSE_THRESHOLD,
+            "seed_threshold": SIMILAR_SEED_THRESHOLD,
+            "path": self.path or None,
+        }
+
+
+_index: SimilarityIndex | None = None
+
+
+def get_index() -> SimilarityIndex:
+    global _index
+    if _index is None:
+        path = SIMILAR_INDEX_PATH
+        if path and not get_draft_store().shared:
+            print("Similarity index kept in memory: the draft store is not shared")
+            path = ""
+        _index = SimilarityIndex(path)
+    return _index
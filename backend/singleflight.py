@@ -0,0 +1,111 @@
+"""Coalesce concurrent identical calls into a single upstream request.
+
+Within a worker, the first caller for a key becomes the leader and runs the
+call; every concurrent caller with the same key awaits the leader's result.
+Across workers, an optional directory of per-key lock files serialises the
+leaders: a worker that had to wait for another process re-checks the shared
+response cache before calling upstream itself. Calls whose result will not be
+in that cache pass no re-check and are not serialised, as waiting would only
+delay them.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-worker locking is unavailable
+    fcntl = None
+
+# Give up waiting on another worker's lock after this many seconds
+SINGLEFLIGHT_LOCK_TIMEOUT = float(os.getenv("LLM_SINGLEFLIGHT_LOCK_TIMEOUT", "120"))
+
+
+class SingleFlight:
+    def __init__(self, lock_dir: str | None = None):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._flights: dict[str, asyncio.Task] = {}
+        self._counters = {"leaders": 0, "coalesced": 0, "remote_coalesced": 0}
+
+    async def do(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        recheck: Callable[[], Awaitable[Any]] | None = None,
+    ) -> Any:
+        """Run ``func`` once per key among concurrent callers and share its result.
+
+        ``recheck`` is awaited after waiting on another worker's lock; a
+        non-None result is returned instead of calling ``func``. Without it
+        the cross-worker lock is not taken.
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            self._counters["coalesced"] += 1
+        else:
+            self._counters["leaders"] += 1
+            # Run in its own task so one caller disconnecting does not cancel the others
+            flight = asyncio.ensure_future(self._lead(key, func, recheck))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        return await asyncio.shield(flight)
+
+    async def _lead(self, key, func, recheck):
+        if not self.lock_dir or recheck is None:
+            return await func()
+
+        path = os.path.join(self.lock_dir, f"{key}.lock")
+        fd, waited = await self._acquire(path)
+        try:
+            if waited and recheck is not None:
+                result = await recheck()
+                if result is not None:
+                    self._counters["remote_coalesced"] += 1
+                    return result
+            return await func()
+        finally:
+            if fd is not None:
+                # Unlink while still holding the lock so waiters can tell the file went stale
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                os.close(fd)
+
+    async def _acquire(self, path: str) -> tuple[int | None, bool]:
+        """Take an exclusive lock on ``path``; returns (fd, whether we had to wait)."""
+        deadline = time.monotonic() + SINGLEFLIGHT_LOCK_TIMEOUT
+        waited = False
+        delay = 0.02
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            print(f"Single-flight lock wait timed out for {os.path.basename(path)}")
+                            os.close(fd)
+                            return None, waited
+                        waited = True
+                        await asyncio.sleep(delay)
+                        delay = min(delay * 2, 0.5)
+                try:
+                    live = os.fstat(fd).st_ino == os.stat(path).st_ino
+                except FileNotFoundError:
+                    live = False
+            except BaseException:
+                os.close(fd)
+                raise
+            if live:
+                return fd, waited
+            # The previous holder finished and removed the file; lock the new one
+            os.close(fd)
+
+    def stats(self) -> dict:
+        return {**self._counters, "in_flight": len(self._flights), "cross_worker": bool(self.lock_dir)}
@@ -15,6 +15,10 @@ export class RequirementAiComponent {
 
   analysis: RequirementAnalysisReport | null = null;
 
+  // Server-side copy of the analysis, so follow-ups and downloads can send its id instead of the report
+  draftId: string | null = null;
+  draftVersion: number | null = null;
+
   // ⭐ quality scores
   qualityBefore: number | null = null;
   qualityAfter: number | null = null;
@@ -77,49 +81,94 @@ export class RequirementAiComponent {
 
   // =============================  //  GENERATE
   // =============================
-  generate() {
+  // Streams the report from /refine-stream (NDJSON) so each section
+  // renders as soon as the backend has generated it.
+  async generate() {
     if (!this.userInput.trim()) return;
 
     this.loading = true;
+    this.analysis = null;
+    this.qualityBefore = null;
+    this.qualityAfter = null;
 
-    this.http.post<any>('http://127.0.0.1:8000/refine', {
-      user_input: this.userInput,
-      image_base64: this.selectedImageBase64
-    }).subscribe({
-      next: (res) => {
-        // Check if there's an error
-        if (res.error === true) {
-          this.showError(res.reason || 'An error occurred while processing your request.');
-          this.loading = false;
-          return;
-        }
-
-        // Check if validation failed
-        if (res.is_valid === false) {
-          this.modalMessage = res.reason || 'The input does not appear to be a valid requirement. Please provide a feature request, bug report, or technical specification.';
-          this.showModal = true;
-          this.loading = false;
-          return;
-        }
+    try {
+      const response = await fetch('http://127.0.0.1:8000/refine-stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          user_input: this.userInput,
+          image_base64: this.selectedImageBase64
+        })
+      });
 
-        this.analysis = res.ticket as RequirementAnalysisReport;
-        this.qualityBefore = res.quality_before?.score ?? null;
-        this.qualityAfter = res.quality_after?.score ?? null;
-        this.loading = false;
-      },
-      error: (err) => {
+      if (!response.ok || !response.body) {
         let errorMsg = 'Unable to connect to the service. Please check your connection and try again.';
-        if (err.status === 500) {
+        if (response.status === 500) {
           errorMsg = 'Server error occurred. Please try again in a moment.';
-        } else if (err.status === 400) {
+        } else if (response.status === 400) {
           errorMsg = 'Invalid request. Please check your input and try again.';
-        } else if (err.status === 0) {
-          errorMsg = 'Unable to reach the server. Please check your connection and try again.';
         }
         this.showError(errorMsg);
-        this.loading = false;
-      },
-    });
+        return;
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() ?? '';
+
+        for (const line of lines) {
+          if (line.trim() && !this.handleStreamEvent(JSON.parse(line))) {
+            reader.cancel();
+            return;
+          }
+        }
+      }
+    } catch (err) {
+      this.showError('Unable to reach the server. Please check your connection and try again.');
+    } finally {
+      this.loading = false;
+    }
+  }
+
+  // Apply one streamed event; returns false when the stream should stop
+  private handleStreamEvent(event: any): boolean {
+    switch (event.event) {
+      case 'section':
+        this.analysis = { ...(this.analysis ?? {}), [event.key]: event.value } as RequirementAnalysisReport;
+        return true;
+
+      case 'quality_before':
+        this.qualityBefore = event.score ?? null;
+        return true;
+
+      case 'done':
+        this.analysis = event.ticket as RequirementAnalysisReport;
+        this.draftId = event.draft_id ?? null;
+        this.draftVersion = event.version ?? null;
+        this.qualityBefore = event.quality_before?.score ?? null;
+        this.qualityAfter = event.quality_after?.score ?? null;
+        return true;
+
+      case 'invalid':
+        this.modalMessage = event.reason || 'The input does not appear to be a valid requirement. Please provide a feature request, bug report, or technical specification.';
+        this.showModal = true;
+        return false;
+
+      case 'error':
+        this.showError(event.reason || 'An error occurred while processing your request.');
+        return false;
+
+      default:
+        return true;
+    }
   }
 
   // =============================
@@ -156,16 +205,16 @@ export class RequirementAiComponent {
   // =============================
   // 🔄 REFINE
   // =============================
-  refineFurther() {
+  refineFurther(useDraftId = true) {
     if (!this.instruction.trim()) return;
 
     this.loading = true;
 
-    this.http.post<any>('http://127.0.0.1:8000/refine-followup', {
-      original_requirement: this.userInput,
-      current_draft: this.analysis,
-      instruction: this.instruction,
-    }).subscribe({
+    const body = useDraftId && this.draftId
+      ? { draft_id: this.draftId, base_version: this.draftVersion, instruction: this.instruction }
+      : { original_requirement: this.userInput, current_draft: this.analysis, instruction: this.instruction };
+
+    this.http.post<any>('http://127.0.0.1:8000/refine-followup', body).subscribe({
       next: (res) => {
         // Check if there's an error
         if (res.error === true) {
@@ -175,11 +224,19 @@ export class RequirementAiComponent {
         }
 
         this.analysis = res.ticket as RequirementAnalysisReport;
+        this.draftVersion = res.version ?? this.draftVersion;
         this.qualityAfter = res.quality_after?.score ?? null;
         this.instruction = '';
         this.loading = false;
       },
       error: (err) => {
+        if (useDraftId && this.draftId && (err.status === 404 || err.status === 409)) {
+          // The stored draft expired or changed elsewhere: resend the report we are showing
+          this.draftId = null;
+          this.draftVersion = null;
+          this.refineFurther(false);
+          return;
+        }
         let errorMsg = 'Unable to refine the requirement. Please try again.';
         if (err.status === 500) {
           errorMsg = 'Server error occurred during refinement. Please try again.';
@@ -192,6 +249,11 @@ export class RequirementAiComponent {
     });
   }
 
+  // Stored draft reference when available, otherwise the full report
+  private exportBody(): object {
+    return this.draftId ? { draft_id: this.draftId, version: this.draftVersion } : this.analysis!;
+  }
+
   // =============================
   // ⬇️ WORD
   // =============================
@@ -200,7 +262,7 @@ export class RequirementAiComponent {
 
     this.http.post(
       'http://127.0.0.1:8000/download-word',
-      this.analysis,
+      this.exportBody(),
       { responseType: 'blob' }
     ).subscribe({
       next: (blob) => {
@@ -211,7 +273,16 @@ export class RequirementAiComponent {
         a.click();
         window.URL.revokeObjectURL(url);
       },
-      error: (err) => console.error('Download failed', err)
+      error: (err) => {
+        if (err.status === 404 && this.draftId) {
+          // Stored draft expired: download from the report we are showing
+          this.draftId = null;
+          this.draftVersion = null;
+          this.downloadWord();
+          return;
+        }
+        console.error('Download failed', err);
+      }
     });
   }
 
@@ -223,7 +294,7 @@ export class RequirementAiComponent {
 
     this.http.post(
       'http://127.0.0.1:8000/download-pdf',
-      this.analysis,
+      this.exportBody(),
       { responseType: 'blob' }
     ).subscribe({
       next: (blob) => {
@@ -234,7 +305,16 @@ export class RequirementAiComponent {
         a.click();
         window.URL.revokeObjectURL(url);
       },
-      error: (err) => console.error('PDF download failed', err)
+      error: (err) => {
+        if (err.status === 404 && this.draftId) {
+          // Stored draft expired: download from the report we are showing
+          this.draftId = null;
+          this.draftVersion = null;
+          this.downloadPdf();
+          return;
+        }
+        console.error('PDF download failed', err);
+      }
     });
   }
 }
\ No newline at end of file